@@ -0,0 +1,127 @@
+#
+# test_connection.py - Tests for the Yabsc connection pool
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+import BaseHTTPServer
+import httplib
+import os
+import SocketServer
+import socket
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'yabsclib'))
+
+import connection
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Answers every request with its method and path, keeping the connection
+    open unless the server is told to drop it after the response, or to drop
+    POST requests without answering them
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def respond(self):
+        server = self.server
+        server.requests.append((self.command, self.path))
+        length = int(self.headers.getheader('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        if self.command == 'POST' and server.droppost:
+            self.close_connection = 1
+            return
+        body = '%s %s' % (self.command, self.path)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # Closing without saying so leaves the client a stale connection
+        if server.dropafter:
+            self.close_connection = 1
+
+    do_GET = respond
+    do_POST = respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StandInHandler)
+        self.requests = []
+        self.dropafter = False
+        self.droppost = False
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.pool = connection.ConnectionPool(self.url)
+        # Do not warn about requests made by the tests on the main thread
+        self.checkThread = connection.checkThread
+        connection.checkThread = lambda method, url: False
+
+    def tearDown(self):
+        connection.checkThread = self.checkThread
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, path):
+        return self.pool.request('GET', self.url + path).read()
+
+    def testReuse(self):
+        self.assertEqual(self.get('/one'), 'GET /one')
+        self.assertEqual(self.get('/two'), 'GET /two')
+        stats = self.pool.stats()
+        self.assertEqual(stats['opened'], 1)
+        self.assertEqual(stats['reused'], 1)
+
+    def testStaleConnection(self):
+        self.server.dropafter = True
+        self.assertEqual(self.get('/one'), 'GET /one')
+        self.assertEqual(self.get('/two'), 'GET /two')
+        self.assertEqual(self.server.requests, [('GET', '/one'), ('GET', '/two')])
+        self.assertEqual(self.pool.stats()['opened'], 2)
+
+    def testPostOnNewConnection(self):
+        self.server.dropafter = True
+        self.assertEqual(self.get('/one'), 'GET /one')
+        response = self.pool.request('POST', self.url + '/cmd', 'data')
+        self.assertEqual(response.read(), 'POST /cmd')
+        self.assertEqual(self.server.requests, [('GET', '/one'), ('POST', '/cmd')])
+
+    def testPostNotResent(self):
+        self.assertEqual(self.get('/one'), 'GET /one')
+        self.server.droppost = True
+        self.assertRaises((httplib.HTTPException, socket.error), self.pool.request, 'POST', self.url + '/cmd', 'data')
+        self.assertEqual(self.server.requests, [('GET', '/one'), ('POST', '/cmd')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,12 +25,17 @@ from osc import conf
 
 import util
 import buildservice
+import scheduler
+import commandrunner
 import results
 import workers
 import submitrequests
 
 defaultconfig = {'general': {'autoscroll': False,
-                             'refreshinterval': '10'},
+                             'refreshinterval': '10',
+                             'cachesize': '64',
+                             'poolsize': '4',
+                             'logstoresize': '256'},
                  'persistence': {'size': '900,725'}}
 
 class ApiSelection:
@@ -133,21 +138,6 @@ class ConfigureDialog(QtGui.QDialog):
         self.setLayout(layout)
 
 
-class WaitStatsThread(QtCore.QThread):
-    """
-    WaitStatsThread(bs)
-    
-    Thread for retrieving wait stats. Requires a BuildService object
-    """
-    def __init__(self, bs):
-        QtCore.QThread.__init__(self)
-        self.bs = bs
-        self.stats = []
-    
-    def run(self):
-        self.stats = self.bs.getWaitStats()
-
-
 class MainWindow(QtGui.QMainWindow):
     """
     MainWindow()
@@ -199,12 +189,25 @@ class MainWindow(QtGui.QMainWindow):
         self.bs = buildservice.BuildService()
         if self.cfg.has_option('persistence', 'apiurl'):
             self.bs.apiurl = self.cfg.get('persistence', 'apiurl')
+        self.bs.cache.maxsize = self.cfg.getint('general', 'cachesize')*1024*1024
+        self.bs.session.setSize(self.cfg.getint('general', 'poolsize'))
+        self.bs.logstore.maxsize = self.cfg.getint('general', 'logstoresize')*1024*1024
+        
+        # Request scheduler, running BuildService requests in the background
+        # for all widgets
+        self.scheduler = scheduler.RequestScheduler()
+        QtCore.QObject.connect(self.scheduler, QtCore.SIGNAL("requestFailed"), self.requestFailed)
+        
+        # User commands, such as rebuilds, with their progress in the status bar
+        self.commands = commandrunner.CommandRunner(self.scheduler)
+        self.statusBar().addPermanentWidget(self.commands)
         
-        # Wait stats
+        # Wait stats, shared with the worker tab through the worker status
+        # snapshots of the BuildService object
+        self.waitstatssnapshot = None
         self.waitstatstimer = QtCore.QTimer()
         QtCore.QObject.connect(self.waitstatstimer, QtCore.SIGNAL("timeout()"), self.refreshWaitStats)
-        self.waitstatsthread = WaitStatsThread(self.bs)
-        QtCore.QObject.connect(self.waitstatsthread, QtCore.SIGNAL("finished()"), self.updateWaitStats)
+        QtCore.QObject.connect(self.bs, QtCore.SIGNAL("workerStatusChanged"), self.updateWaitStats)
         self.waitstatstimer.start(self.cfg.getint('general', 'refreshinterval')*1000)
 
         # Central widgets
@@ -227,6 +230,19 @@ class MainWindow(QtGui.QMainWindow):
         exportaction.setStatusTip("Export current view to file")
         file.addAction(exportaction)
         self.connect(exportaction, QtCore.SIGNAL('triggered()'), self.export)
+        failedlogsaction = QtGui.QAction("Summarize &Failed Builds ...", self)
+        failedlogsaction.setStatusTip("Retrieve the logs of all failed builds of the current project")
+        file.addAction(failedlogsaction)
+        self.connect(failedlogsaction, QtCore.SIGNAL('triggered()'), self.rw.fetchFailedLogs)
+        searchlogsaction = QtGui.QAction("&Search Build Logs ...", self)
+        searchlogsaction.setShortcut('Ctrl+F')
+        searchlogsaction.setStatusTip("Search the downloaded build logs of the current project")
+        file.addAction(searchlogsaction)
+        self.connect(searchlogsaction, QtCore.SIGNAL('triggered()'), self.rw.searchBuildLogs)
+        fleethistoryaction = QtGui.QAction("Worker &History ...", self)
+        fleethistoryaction.setStatusTip("Chart worker utilization and the wait queue over time")
+        file.addAction(fleethistoryaction)
+        self.connect(fleethistoryaction, QtCore.SIGNAL('triggered()'), self.ww.showFleetHistory)
         file.addAction(exit)
         
         server = menubar.addMenu('&Server')
@@ -307,6 +323,12 @@ class MainWindow(QtGui.QMainWindow):
             else:
                 widget.viewable = False
                 widget.disableRefresh()
+        # Only follow build logs in the visible tab
+        for (idx, logpoller) in ((0, self.rw.logpoller), (1, self.ww.logpoller)):
+            if idx == tabidx:
+                logpoller.resume()
+            else:
+                logpoller.pause()
     
     def closeEvent(self, event):
         """
@@ -326,8 +348,20 @@ class MainWindow(QtGui.QMainWindow):
         except IOError, e:
             QtGui.QMessageBox.critical(self, "Configuration File Error",
                                        "Could not write configuration file %s: %s" % (self.cfgfilename, e))
+        self.scheduler.shutdown()
+        self.bs.session.close()
+        self.bs.logstore.save()
+        self.bs.durations.save()
         QtGui.QMainWindow.closeEvent(self, event)
 
+    def requestFailed(self, request):
+        """
+        requestFailed(request)
+        
+        Report a failed background request in the status bar
+        """
+        self.statusBar().showMessage("Request failed: %s" % request.error, 10000)
+
     def refreshWaitStats(self):
         """
         refreshWaitStats()
@@ -335,16 +369,36 @@ class MainWindow(QtGui.QMainWindow):
         Refresh wait stats
         """
         self.waitstatstimer.stop()
-        self.waitstatsthread.start()
+        maxage = self.cfg.getint('general', 'refreshinterval')
+        self.scheduler.submit(self.bs.getWorkerStatusSnapshot, (maxage,),
+                              key=('workerstatus', self.bs.apiurl, maxage),
+                              callback=self.waitStatsRetrieved, errback=self.waitStatsRetrieved)
+
+    def waitStatsRetrieved(self, request):
+        """
+        waitStatsRetrieved(request)
+        
+        Handle the end of a wait stats request
+        """
+        if request.result:
+            self.updateWaitStats(request.result)
+        self.waitstatstimer.start()
     
-    def updateWaitStats(self):
+    def updateWaitStats(self, snapshot):
         """
-        updateWaitStats()
+        updateWaitStats(snapshot)
         
-        Update wait stats in the status bar from the last result
+        Update wait stats in the status bar from a worker status snapshot
         """
+        if snapshot is self.waitstatssnapshot:
+            return
+        self.waitstatssnapshot = snapshot
         s = "Waiting"
-        for (arch, count) in self.waitstatsthread.stats:
+        for (arch, count) in snapshot.waiting:
             s += "  | <b>%s</b> - <b>%s</b>" % (arch, count)
         self.statslabel.setText(s)
-        self.waitstatstimer.start()
+        stats = self.bs.session.stats(self.bs.apiurl)
+        self.statslabel.setToolTip("%d requests, %d connections opened, %d reused, %d on the main thread" % (stats['requests'],
+                                                                                                           stats['opened'],
+                                                                                                           stats['reused'],
+                                                                                                           stats['mainthread']))
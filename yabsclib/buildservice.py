@@ -20,12 +20,33 @@
 
 import os
 import tempfile
+import threading
 import time
+import urllib
+import urllib2
 import urlparse
+from array import array
 import xml.etree.cElementTree as ElementTree
 from PyQt4 import QtCore
 from osc import conf, core
 
+from cache import DiskCache
+from connection import Session
+from logstore import LogStore
+from fleethistory import FleetHistory
+from durations import DurationCache
+from requeststore import RequestStore
+from resultstore import ResultStore, statusCode, statusName
+from scheduler import PRIORITY_INTERACTIVE
+from transport import Transport, NOT_MODIFIED
+
+# Seconds for which the watched projects are reused by callers that can
+# accept a list that is not quite current
+WATCHED_MAXAGE = 300
+
+# Submit requests retrieved per search request while synchronizing
+SUBMITREQUEST_PAGESIZE = 500
+
 def flag2bool(flag):
     """
     flag2bool(flag) -> Boolean
@@ -51,11 +72,13 @@ def bool2flag(b):
 
 class metafile:
     """
-    metafile(url, input, change_is_required=False, file_ext='.xml')
+    metafile(session, url, input, change_is_required=False, file_ext='.xml')
 
-    Implementation on osc.core.metafile that does not print to stdout
+    Implementation on osc.core.metafile that does not print to stdout, and
+    saves through the connection.Session 'session'
     """
-    def __init__(self, url, input, change_is_required=False, file_ext='.xml'):
+    def __init__(self, session, url, input, change_is_required=False, file_ext='.xml'):
+        self.session = session
         self.url = url
         self.change_is_required = change_is_required
 
@@ -75,12 +98,108 @@ class metafile:
 
         # don't do any exception handling... it's up to the caller what to do in case
         # of an exception
-        core.http_PUT(self.url, file=self.filename)
+        f = open(self.filename)
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        self.session.PUT(self.url, data).read()
         os.unlink(self.filename)
         return True
 
+class Worker(object):
+    """
+    Worker(id, hostarch, status, project=None, package=None, target=None, starttime=None)
+
+    The status of one build service worker. For building workers, 'starttime'
+    is when the build started, in seconds since the epoch, and 'started' the
+    same time as text. The attributes that do not apply to a worker are None.
+    Items can also be read like those of a dict, for which attributes that
+    are None are missing
+    """
+    __slots__ = ('id', 'hostarch', 'status', 'project', 'package', 'target', 'starttime', 'started')
+
+    def __init__(self, id, hostarch, status, project=None, package=None, target=None, starttime=None):
+        self.id = id
+        self.hostarch = hostarch
+        self.status = status
+        self.project = project
+        self.package = package
+        self.target = target
+        self.starttime = starttime
+        if starttime is None:
+            self.started = None
+        else:
+            self.started = time.asctime(time.localtime(starttime))
+
+    def __getitem__(self, key):
+        try:
+            value = getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return getattr(self, key, None) is not None
+
+
+class WorkerStatusSnapshot(object):
+    """
+    WorkerStatusSnapshot(apiurl, building, idle, waiting)
+
+    The parsed contents of one _workerstatus document. 'building' and 'idle'
+    are lists of Worker objects, and 'waiting' is a list of (arch, count)
+    pairs. 'time' is when the snapshot was last confirmed to be current
+    """
+    def __init__(self, apiurl, building, idle, waiting):
+        self.apiurl = apiurl
+        self.building = building
+        self.idle = idle
+        self.waiting = waiting
+        self.time = time.time()
+
+    def fromXML(cls, apiurl, data):
+        """
+        WorkerStatusSnapshot.fromXML(apiurl, data) -> WorkerStatusSnapshot
+
+        Parse the _workerstatus XML document 'data'
+        """
+        tree = ElementTree.fromstring(data)
+        building = []
+        for worker in tree.findall('building'):
+            building.append(Worker(worker.get('workerid'), worker.get('hostarch'), 'building',
+                                   worker.get('project'), worker.get('package'),
+                                   '/'.join((worker.get('repository'), worker.get('arch'))),
+                                   float(worker.get('starttime'))))
+        idle = []
+        for worker in tree.findall('idle'):
+            idle.append(Worker(worker.get('workerid'), worker.get('hostarch'), 'idle'))
+        waiting = []
+        for worker in tree.findall('waiting'):
+            waiting.append((worker.get('arch'), int(worker.get('jobs'))))
+        return cls(apiurl, building, idle, waiting)
+    fromXML = classmethod(fromXML)
+
+    def workers(self):
+        """
+        workers() -> list of Worker objects
+
+        Returns the building workers followed by the idle ones
+        """
+        return self.building + self.idle
+
+
 class BuildService(QtCore.QObject):
-    "Interface to Build Service API"
+    """
+    Interface to Build Service API
+
+    Emits workerStatusChanged(snapshot) whenever a new worker status snapshot
+    has been retrieved, and watchedProjectsChanged(apiurl, projects) whenever
+    the watched projects of an API server are found to have changed, from
+    whichever thread retrieved them
+    """
     def __init__(self, apiurl=None):
         QtCore.QObject.__init__(self)
 
@@ -90,6 +209,51 @@ class BuildService(QtCore.QObject):
         else:
             self.apiurl = conf.config['apiurl']
 
+        self.session = Session()
+        self.transport = Transport(self.session)
+        self.cache = DiskCache()
+        self.logstore = LogStore()
+        self.fleethistory = FleetHistory()
+        self.durations = DurationCache()
+        self.requeststore = RequestStore()
+
+        self._packagestatus = {}
+        self._packagestatuslock = threading.Lock()
+
+        self._workerstatus = None
+        self._workerstatuslock = threading.Lock()
+
+        # The API server whose submit requests were returned last
+        self._submitrequestsfor = None
+        self._submitrequestlock = threading.Lock()
+
+        # apiurl -> (time, frozenset of projects)
+        self._watched = {}
+        self._watchedlock = threading.Lock()
+
+    def _url(self, path, query=[]):
+        """_url(path, query=[]) -> str
+
+        Returns the URL on the current API server for the list of path components and the list of
+        'name=value' query strings
+        """
+        return core.makeurl(self.apiurl, path, query)
+
+    def _GET(self, path, query=[]):
+        """_GET(path, query=[]) -> file-like object
+
+        GET a document from the current API server through the connection pool. See _url()
+        """
+        return self.session.GET(self._url(path, query))
+
+    def _POST(self, path, query=[]):
+        """_POST(path, query=[]) -> str
+
+        POST a command to the current API server through the connection pool, and return the reply.
+        See _url()
+        """
+        return self.session.POST(self._url(path, query)).read()
+
     def getAPIServerList(self):
         """getAPIServerList() -> list
 
@@ -112,25 +276,105 @@ class BuildService(QtCore.QObject):
 
         Get list of projects
         """
-        return [project for project in core.meta_get_project_list(self.apiurl) if project != 'deleted']
+        tree = ElementTree.parse(self._GET(['source']))
+        return sorted([entry.get('name') for entry in tree.findall('entry') if entry.get('name') != 'deleted'])
 
-    def getWatchedProjectList(self):
-        """getWatchedProjectList() -> list
+    def getWatchedProjectList(self, maxage=0):
+        """getWatchedProjectList(maxage=0) -> list
 
-        Get list of watched projects
+        Get list of watched projects. The list retrieved for the current API server is reused if it
+        is less than maxage seconds old
         """
+        return sorted(self.getWatchedProjects(maxage))
+
+    def getWatchedProjects(self, maxage=0):
+        """getWatchedProjects(maxage=0) -> frozenset
+
+        Get the set of watched projects. The set retrieved for the current API server is reused if
+        it is less than maxage seconds old
+        """
+        apiurl = self.apiurl
+        self._watchedlock.acquire()
+        try:
+            cached = self._watched.get(apiurl)
+        finally:
+            self._watchedlock.release()
+        if cached and time.time() - cached[0] < maxage:
+            return cached[1]
+
+        now = time.time()
         username = self.getUserName()
-        tree = ElementTree.fromstring(''.join(core.get_user_meta(self.apiurl, username)))
-        projects = []
+        tree = ElementTree.parse(self._GET(['person', username])).getroot()
+        projects = set()
         watchlist = tree.find('watchlist')
         if watchlist:
             for project in watchlist.findall('project'):
-                projects.append(project.get('name'))
+                projects.add(project.get('name'))
         homeproject = 'home:%s' % username
-        if not homeproject in projects and homeproject in self.getProjectList():
-            projects.append(homeproject)
+        if not homeproject in projects and self._projectExists(homeproject):
+            projects.add(homeproject)
+        projects = frozenset(projects)
+        self._setWatched(apiurl, now, projects)
         return projects
 
+    def watchedProjects(self):
+        """watchedProjects() -> frozenset
+
+        Returns the watched projects of the current API server as last retrieved, however old, or
+        None if they have not been retrieved. Never makes a request
+        """
+        self._watchedlock.acquire()
+        try:
+            cached = self._watched.get(self.apiurl)
+        finally:
+            self._watchedlock.release()
+        if cached:
+            return cached[1]
+        return None
+
+    def _setWatched(self, apiurl, now, projects):
+        """_setWatched(apiurl, now, projects)
+
+        Remember the watched projects of apiurl as of time now, and emit watchedProjectsChanged if
+        they changed
+        """
+        self._watchedlock.acquire()
+        try:
+            previous = self._watched.get(apiurl)
+            self._watched[apiurl] = (now, projects)
+        finally:
+            self._watchedlock.release()
+        if previous is None or previous[1] != projects:
+            self.emit(QtCore.SIGNAL("watchedProjectsChanged"), apiurl, projects)
+
+    def _updateWatched(self, project, watched):
+        """_updateWatched(project, watched)
+
+        Add project to, or remove it from, the remembered watched projects after a change, and
+        expire them so that the next request with a maxage gets them again
+        """
+        current = self.watchedProjects()
+        if current is None:
+            return
+        if watched:
+            projects = current | frozenset([project])
+        else:
+            projects = current - frozenset([project])
+        self._setWatched(self.apiurl, 0, projects)
+
+    def _projectExists(self, project):
+        """_projectExists(project) -> bool
+
+        Returns True if project exists on the current API server
+        """
+        try:
+            self._GET(['source', project, '_meta']).read()
+        except urllib2.HTTPError, e:
+            if e.code == 404:
+                return False
+            raise
+        return True
+
     def watchProject(self, project):
         """
         watchProject(project)
@@ -138,17 +382,17 @@ class BuildService(QtCore.QObject):
         Watch project
         """
         username = self.getUserName()
-        data = core.meta_exists('user', username, create_new=False, apiurl=self.apiurl)
-        url = core.make_meta_url('user', username, self.apiurl)
+        url = self._url(['person', username])
 
-        person = ElementTree.fromstring(''.join(data))
+        person = ElementTree.parse(self.session.GET(url)).getroot()
         watchlist = person.find('watchlist')
         if not watchlist:
             watchlist = ElementTree.SubElement(person, 'watchlist')
         ElementTree.SubElement(watchlist, 'project', name=str(project))
 
-        f = metafile(url, ElementTree.tostring(person))
+        f = metafile(self.session, url, ElementTree.tostring(person))
         f.sync()
+        self._updateWatched(str(project), True)
 
     def unwatchProject(self, project):
         """
@@ -157,40 +401,85 @@ class BuildService(QtCore.QObject):
         Watch project
         """
         username = self.getUserName()
-        data = core.meta_exists('user', username, create_new=False, apiurl=self.apiurl)
-        url = core.make_meta_url('user', username, self.apiurl)
+        url = self._url(['person', username])
 
-        person = ElementTree.fromstring(''.join(data))
+        person = ElementTree.parse(self.session.GET(url)).getroot()
         watchlist = person.find('watchlist')
         for node in watchlist:
             if node.get('name') == str(project):
                 watchlist.remove(node)
                 break
 
-        f = metafile(url, ElementTree.tostring(person))
+        f = metafile(self.session, url, ElementTree.tostring(person))
         f.sync()
+        self._updateWatched(str(project), False)
+
+    def _parseResults(self, f):
+        """_parseResults(f) -> iterator
 
-    def getResults(self, project):
-        """getResults(project) -> (dict, list)
+        Parse a project result document from the file-like object f as it is received. Yields a
+        (target, packages, codes, details) tuple for every result block, where packages is a list of
+        package names, codes an array of the corresponding status codes and details a dict of package
+        names to the details text of their status, for those that have one
+        """
+        root = None
+        for (event, elem) in ElementTree.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+            elif elem.tag == 'result':
+                packages = []
+                codes = array('B')
+                details = {}
+                for status in elem.findall('status'):
+                    package = status.get('package')
+                    packages.append(package)
+                    codes.append(statusCode(status.get('code')))
+                    text = status.findtext('details')
+                    if text:
+                        details[package] = text
+                yield ('/'.join((elem.get('repository'), elem.get('arch'))), packages, codes, details)
+                # Drop the parsed result block
+                root.clear()
+
+    def iterResults(self, project):
+        """iterResults(project) -> iterator
+
+        Get results of a project, one target at a time, as they are received. Yields a
+        (target, packages, codes, details) tuple for every target, as described for
+        ResultStore.addResults()
+        """
+        f = self.transport.open(self._url(['build', project, '_result']))
+        try:
+            for result in self._parseResults(f):
+                yield result
+        finally:
+            f.close()
+        f.finish()
 
-        Get results of a project. Returns (results, targets)
+    def getResults(self, project, ifchanged=False):
+        """getResults(project, ifchanged=False) -> ResultStore
 
-        results is a dict, with package names as the keys, and lists of result codes as the values
+        Get results of a project as a ResultStore, with a column for each target and a row for each
+        package
 
-        targets is a list of targets, corresponding to the result code lists
+        The result document is parsed as it is received, so it is never held in memory as a whole
+
+        If ifchanged is True and the results have not changed since the last call, NOT_MODIFIED is
+        returned instead
         """
-        results = {}
-        targets = []
-        tree = ElementTree.fromstring(''.join(core.show_prj_results_meta(self.apiurl, project)))
-        for result in tree.findall('result'):
-            targets.append('/'.join((result.get('repository'), result.get('arch'))))
-            for status in result.findall('status'):
-                package = status.get('package')
-                code = status.get('code')
-                if not package in results:
-                    results[package] = []
-                results[package].append(code)
-        return (results, targets)
+        f = self.transport.open(self._url(['build', project, '_result']), conditional=ifchanged)
+        if f is NOT_MODIFIED:
+            return NOT_MODIFIED
+        store = ResultStore()
+        try:
+            for (target, packages, codes, details) in self._parseResults(f):
+                store.addResults(target, packages, codes, details)
+        finally:
+            f.close()
+        if f.finish():
+            return NOT_MODIFIED
+        return store
 
     def getTargets(self, project):
         """
@@ -199,30 +488,62 @@ class BuildService(QtCore.QObject):
         Get a list of targets for a project
         """
         targets = []
-        tree = ElementTree.fromstring(''.join(core.show_project_meta(self.apiurl, project)))
+        tree = ElementTree.fromstring(self.getProjectMeta(project))
         for repo in tree.findall('repository'):
             for arch in repo.findall('arch'):
                 targets.append('%s/%s' % (repo.get('name'), arch.text))
         return targets
 
-    def getPackageStatus(self, project, package):
+    def getPackageStatus(self, project, package, maxage=0):
         """
-        getPackageStatus(project, package) -> dict
+        getPackageStatus(project, package, maxage=0) -> dict
 
         Returns the status of a package as a dict with targets as the keys and status codes as the
-        values
-        """
-        status = {}
-        tree = ElementTree.fromstring(''.join(core.show_results_meta(self.apiurl, project, package)))
-        for result in tree.findall('result'):
-            target = '/'.join((result.get('repository'), result.get('arch')))
-            statusnode = result.find('status')
-            code = statusnode.get('code')
-            details = statusnode.find('details')
-            if details is not None:
-                code += ': ' + details.text
-            status[target] = code
-        return status
+        values. A status retrieved less than maxage seconds ago is returned without a request
+        """
+        return self.getPackagesStatus(project, [package], maxage)[package]
+
+    def getPackagesStatus(self, project, packages, maxage=0):
+        """
+        getPackagesStatus(project, packages, maxage=0) -> dict
+
+        Returns the status of several packages as a dict of package names to dicts as returned by
+        getPackageStatus(). The status of all packages that were not retrieved within the last
+        maxage seconds is retrieved with a single request
+        """
+        now = time.time()
+        result = {}
+        missing = []
+        self._packagestatuslock.acquire()
+        try:
+            for package in packages:
+                cached = self._packagestatus.get((self.apiurl, project, package))
+                if cached and now - cached[0] < maxage:
+                    result[package] = cached[1]
+                else:
+                    missing.append(package)
+        finally:
+            self._packagestatuslock.release()
+        if not missing:
+            return result
+
+        for package in missing:
+            result[package] = {}
+        query = ['package=%s' % urllib.quote_plus(package) for package in missing]
+        for (target, packages, codes, details) in self._parseResults(self._GET(['build', project, '_result'], query)):
+            for (package, code) in zip(packages, codes):
+                text = statusName(code)
+                if package in details:
+                    text += ': ' + details[package]
+                result.setdefault(package, {})[target] = text
+
+        self._packagestatuslock.acquire()
+        try:
+            for package in missing:
+                self._packagestatus[(self.apiurl, project, package)] = (now, result[package])
+        finally:
+            self._packagestatuslock.release()
+        return result
 
     def getBinaryList(self, project, target, package):
         """
@@ -231,7 +552,8 @@ class BuildService(QtCore.QObject):
         Returns a list of binaries for a particular target and package
         """
         (repo, arch) = target.split('/')
-        return core.get_binarylist(self.apiurl, project, repo, arch, package)
+        tree = ElementTree.parse(self._GET(['build', project, repo, arch, package])).getroot()
+        return [binary.get('filename') for binary in tree.findall('binary')]
 
     def getBinary(self, project, target, package, file, path):
         """
@@ -240,7 +562,19 @@ class BuildService(QtCore.QObject):
         Get binary 'file' for 'project' and 'target' and save it as 'path'
         """
         (repo, arch) = target.split('/')
-        core.get_binary_file(self.apiurl, project, repo, arch, file, target_filename=path, package=package)
+        f = self._GET(['build', project, repo, arch, package, file])
+        try:
+            out = open(path, 'wb')
+            try:
+                while True:
+                    data = f.read(65536)
+                    if not data:
+                        break
+                    out.write(data)
+            finally:
+                out.close()
+        finally:
+            f.close()
 
     def getBuildLog(self, project, target, package, offset=0):
         """
@@ -251,61 +585,193 @@ class BuildService(QtCore.QObject):
         If offset is greater than 0, return only text after that offset. This allows live streaming
         """
         (repo, arch) = target.split('/')
-        u = core.makeurl(self.apiurl, ['build', project, repo, arch, package, '_log?nostream=1&start=%s' % offset])
-        return core.http_GET(u).read()
+        return self._GET(['build', project, repo, arch, package, '_log'],
+                         ['nostream=1', 'start=%s' % offset]).read()
 
-    def getWorkerStatus(self):
+    def getBuildLogInfo(self, project, target, package):
         """
-        getWorkerStatus() -> list of dicts
+        getBuildLogInfo(project, target, package) -> tuple
 
-        Get worker status as a list of dictionaries. Each dictionary contains the keys 'id',
-        'hostarch', and 'status'. If the worker is building, the dict will additionally contain the
-        keys 'project', 'package', 'target', and 'starttime'
+        Returns the (size, mtime) of the build log of a package for a particular target. The mtime
+        identifies the build the log belongs to
         """
-        url = core.makeurl(self.apiurl, ['build', '_workerstatus'])
-        f = core.http_GET(url)
-        tree = ElementTree.parse(f).getroot()
-        workerstatus = []
-        for worker in tree.findall('building'):
-            d = {'id': worker.get('workerid'),
-                 'status': 'building'}
-            for attr in ('hostarch', 'project', 'package', 'starttime'):
-                d[attr] = worker.get(attr)
-            d['target'] = '/'.join((worker.get('repository'), worker.get('arch')))
-            d['started'] = time.asctime(time.localtime(float(worker.get('starttime'))))
-            workerstatus.append(d)
-        for worker in tree.findall('idle'):
-            d = {'id': worker.get('workerid'),
-                 'hostarch': worker.get('hostarch'),
-                 'status': 'idle'}
-            workerstatus.append(d)
-        return workerstatus
+        (repo, arch) = target.split('/')
+        tree = ElementTree.parse(self._GET(['build', project, repo, arch, package, '_log'],
+                                           ['view=entry'])).getroot()
+        entry = tree.find('entry')
+        return (int(entry.get('size')), int(entry.get('mtime')))
 
-    def getWaitStats(self):
+    def getCompleteBuildLog(self, project, target, package):
         """
-        getWaitStats() -> list
+        getCompleteBuildLog(project, target, package) -> str
+
+        Returns the build log of a finished build of a package for a particular target. The log is
+        taken from the log store if it holds the log of the same build, and added to it otherwise
+
+        The log is downloaded to a file in the log store as it is received, so an interrupted
+        download is resumed from where it stopped by the next call
+        """
+        (size, mtime) = self.getBuildLogInfo(project, target, package)
+        key = (self.apiurl, project, target, package, mtime)
+        log = self.logstore.get(*key)
+        if log is not None and len(log) == size:
+            return log
+        partial = self.logstore.openPartial(*key)
+        try:
+            offset = partial.tell()
+            if offset > size:
+                partial.truncate(0)
+                offset = 0
+            if offset < size:
+                (repo, arch) = target.split('/')
+                f = self._GET(['build', project, repo, arch, package, '_log'],
+                              ['nostream=1', 'start=%d' % offset])
+                try:
+                    while True:
+                        data = f.read(65536)
+                        if not data:
+                            break
+                        partial.write(data)
+                finally:
+                    f.close()
+            partial.flush()
+            partial.seek(0)
+            log = partial.read()
+        finally:
+            partial.close()
+        self.logstore.put(self.apiurl, project, target, package, mtime, log)
+        self.logstore.removePartial(*key)
+        return log
+
+    def storeBuildLog(self, project, target, package, log):
+        """
+        storeBuildLog(project, target, package, log)
+
+        Add the complete build log of a finished build, retrieved by streaming, to the log store
+        """
+        (size, mtime) = self.getBuildLogInfo(project, target, package)
+        if len(log) == size:
+            self.logstore.put(self.apiurl, project, target, package, mtime, log)
+
+    def searchBuildLogs(self, project, text):
+        """
+        searchBuildLogs(project, text) -> list
+
+        Search the stored build logs of project for lines containing text. See LogStore.search()
+        """
+        return self.logstore.search(self.apiurl, project, text)
+
+    def getWorkerStatusSnapshot(self, maxage=0):
+        """
+        getWorkerStatusSnapshot(maxage=0) -> WorkerStatusSnapshot
+
+        Get the worker status of the build service. If the last snapshot is
+        less than maxage seconds old, it is returned without a request.
+        Concurrent callers share a single request, and if the document has not
+        changed, the previous snapshot object is returned with its time
+        updated. New snapshots are published with workerStatusChanged. Every
+        request adds a sample to the fleet history
+        """
+        self._workerstatuslock.acquire()
+        try:
+            snapshot = self._workerstatus
+            if snapshot and snapshot.apiurl != self.apiurl:
+                snapshot = None
+            if snapshot and time.time() - snapshot.time < maxage:
+                return snapshot
+            url = self._url(['build', '_workerstatus'])
+            data = self.transport.get(url, conditional=bool(snapshot))
+            if data is NOT_MODIFIED:
+                snapshot.time = time.time()
+                self.fleethistory.record(snapshot, snapshot.time)
+                return snapshot
+            snapshot = WorkerStatusSnapshot.fromXML(self.apiurl, data)
+            self._workerstatus = snapshot
+            self.fleethistory.record(snapshot, snapshot.time)
+        finally:
+            self._workerstatuslock.release()
+        self.emit(QtCore.SIGNAL("workerStatusChanged"), snapshot)
+        return snapshot
+
+    def getWorkerStatus(self, maxage=0):
+        """
+        getWorkerStatus(maxage=0) -> list of Worker objects
+
+        Get worker status as a list of Worker objects. Each has an 'id', 'hostarch', and 'status'.
+        If the worker is building, it additionally has a 'project', 'package', 'target', and
+        'starttime'
+
+        See getWorkerStatusSnapshot() for maxage
+        """
+        return self.getWorkerStatusSnapshot(maxage).workers()
+
+    def getWaitStats(self, maxage=0):
+        """
+        getWaitStats(maxage=0) -> list
 
         Returns the number of jobs in the wait queue as a list of (arch, count)
         pairs
-        """
-        url = core.makeurl(self.apiurl, ['build', '_workerstatus'])
-        f = core.http_GET(url)
-        tree = ElementTree.parse(f).getroot()
-        stats = []
-        for worker in tree.findall('waiting'):
-            stats.append((worker.get('arch'), int(worker.get('jobs'))))
-        return stats
 
-    def getSubmitRequests(self):
+        See getWorkerStatusSnapshot() for maxage
         """
-        getSubmitRequests() -> list of dicts
+        return list(self.getWorkerStatusSnapshot(maxage).waiting)
 
+    def getSubmitRequests(self, ifchanged=False):
+        """
+        getSubmitRequests(ifchanged=False) -> list of dicts
+
+        Get the submit requests of the current API server, sorted by id. The
+        requests are kept in the persistent request store, and only the
+        requests with a higher id than the highest one stored, or with a state
+        change since the latest one stored, are retrieved, SUBMITREQUEST_PAGESIZE
+        at a time. If ifchanged is True and the requests have not changed
+        since the last call, NOT_MODIFIED is returned instead
+        """
+        apiurl = self.apiurl
+        self._submitrequestlock.acquire()
+        try:
+            (lastid, lastchange) = self.requeststore.position(apiurl)
+            found = self._searchSubmitRequests("submit and @id > %d" % lastid)
+            if lastchange:
+                found += self._searchSubmitRequests("submit and state/@when >= '%s'" % lastchange)
+            changed = self.requeststore.update(apiurl, found)
+            if ifchanged and not changed and self._submitrequestsfor == apiurl:
+                return NOT_MODIFIED
+            self._submitrequestsfor = apiurl
+        finally:
+            self._submitrequestlock.release()
+        return self.requeststore.requests(apiurl)
+
+    def _searchSubmitRequests(self, match):
+        """_searchSubmitRequests(match) -> list
+
+        Returns the submit requests matching the XPath expression match as a list of (request, when)
+        pairs, where when is the time of the last state change of the request. Results are retrieved
+        in pages of SUBMITREQUEST_PAGESIZE, until a page is short or has no requests not seen before
+        """
+        found = []
+        seen = set()
+        offset = 0
+        while True:
+            f = self._GET(['search', 'request'], ['match=%s' % urllib.quote_plus(match),
+                                                  'limit=%d' % SUBMITREQUEST_PAGESIZE,
+                                                  'offset=%d' % offset])
+            tree = ElementTree.parse(f).getroot()
+            nodes = tree.findall('request')
+            new = [sr for sr in nodes if sr.get('id') not in seen]
+            seen.update([sr.get('id') for sr in new])
+            found += self._parseSubmitRequests(new)
+            if len(nodes) < SUBMITREQUEST_PAGESIZE or not new:
+                return found
+            offset += len(nodes)
+
+    def _parseSubmitRequests(self, nodes):
+        """_parseSubmitRequests(nodes) -> list
+
+        Parse the submit requests among the request elements nodes. See _searchSubmitRequests()
         """
-        url = core.makeurl(self.apiurl, ['search', 'request', '?match=submit'])
-        f = core.http_GET(url)
-        tree = ElementTree.parse(f).getroot()
         submitrequests = []
-        for sr in tree.findall('request'):
+        for sr in nodes:
             if sr.get('type') != "submit":
                 continue
 
@@ -317,10 +783,10 @@ class BuildService(QtCore.QObject):
             dst = sb.findall('target')[0]
             d['dstproject'] = dst.get('project')
             d['dstpackage'] = dst.get('package')
-            d['state'] = sr.findall('state')[0].get('name')
+            state = sr.findall('state')[0]
+            d['state'] = state.get('name')
 
-            submitrequests.append(d)
-        submitrequests.sort(key=lambda x: x['id'])
+            submitrequests.append((d, state.get('when') or ''))
         return submitrequests
 
     def rebuild(self, project, package, target=None, code=None):
@@ -330,12 +796,13 @@ class BuildService(QtCore.QObject):
         Rebuild 'package' in 'project' for 'target'. If 'code' is specified,
         all targets with that code will be rebuilt
         """
+        query = ['cmd=rebuild', 'package=%s' % urllib.quote_plus(package)]
         if target:
             (repo, arch) = target.split('/')
-        else:
-            repo = None
-            arch = None
-        return core.rebuild(self.apiurl, project, package, repo, arch, code)
+            query += ['repository=%s' % urllib.quote_plus(repo), 'arch=%s' % urllib.quote_plus(arch)]
+        if code:
+            query.append('code=%s' % urllib.quote_plus(code))
+        return self._POST(['build', project], query)
 
     def abortBuild(self, project, package=None, target=None):
         """
@@ -343,12 +810,13 @@ class BuildService(QtCore.QObject):
 
         Abort build of a package or all packages in a project
         """
+        query = ['cmd=abortbuild']
+        if package:
+            query.append('package=%s' % urllib.quote_plus(package))
         if target:
             (repo, arch) = target.split('/')
-        else:
-            repo = None
-            arch = None
-        return core.abortbuild(self.apiurl, project, package, arch, repo)
+            query += ['repository=%s' % urllib.quote_plus(repo), 'arch=%s' % urllib.quote_plus(arch)]
+        return self._POST(['build', project], query)
 
     def getBuildHistory(self, project, package, target):
         """
@@ -358,8 +826,7 @@ class BuildService(QtCore.QObject):
         (time, srcmd5, rev, versrel, bcnt)
         """
         (repo, arch) = target.split('/')
-        u = core.makeurl(self.apiurl, ['build', project, repo, arch, package, '_history'])
-        f = core.http_GET(u)
+        f = self._GET(['build', project, repo, arch, package, '_history'])
         root = ElementTree.parse(f).getroot()
 
         r = []
@@ -374,6 +841,24 @@ class BuildService(QtCore.QObject):
             r.append((t, srcmd5, rev, versrel, bcnt))
         return r
 
+    def getBuildDurations(self, project, package, target):
+        """
+        getBuildDurations(project, package, target) -> list
+
+        Get the durations of the builds in the build history of package for
+        target as a list of (time, seconds) tuples, oldest first. Entries
+        without a duration are left out
+        """
+        (repo, arch) = target.split('/')
+        f = self._GET(['build', project, repo, arch, package, '_history'])
+        root = ElementTree.parse(f).getroot()
+
+        r = []
+        for node in root.findall('entry'):
+            if node.get('duration'):
+                r.append((int(node.get('time')), int(node.get('duration'))))
+        return r
+
     def getCommitLog(self, project, package, revision=None):
         """
         getCommitLog(project, package, revision=None) -> list
@@ -384,8 +869,7 @@ class BuildService(QtCore.QObject):
         Each log is a tuple of the form (rev, srcmd5, version, time, user,
         comment)
         """
-        u = core.makeurl(self.apiurl, ['source', project, package, '_history'])
-        f = core.http_GET(u)
+        f = self._GET(['source', project, package, '_history'])
         root = ElementTree.parse(f).getroot()
 
         r = []
@@ -414,7 +898,7 @@ class BuildService(QtCore.QObject):
 
         Get XML metadata for project
         """
-        return ''.join(core.show_project_meta(self.apiurl, project))
+        return self._GET(['source', project, '_meta']).read()
 
     def getPackageMeta(self, project, package):
         """
@@ -422,7 +906,7 @@ class BuildService(QtCore.QObject):
 
         Get XML metadata for package in project
         """
-        return ''.join(core.show_package_meta(self.apiurl, project, package))
+        return self._GET(['source', project, package, '_meta']).read()
 
     def projectFlags(self, project):
         """
@@ -433,6 +917,39 @@ class BuildService(QtCore.QObject):
         return ProjectFlags(self, project)
 
 
+class WatchedProjectsMixin(object):
+    """
+    Keeps the watched projects shown by a widget with the BuildService object
+    'bs' and the RequestScheduler 'scheduler' up to date. The widget passes
+    them to its setWatchedProjects(projects) method, and connects the
+    watchedProjectsChanged signal of bs to watchedProjectsChanged()
+    """
+    def refreshWatchedProjects(self):
+        """
+        refreshWatchedProjects()
+        
+        Show the watched projects known to the BuildService object, or the
+        cached list if there are none yet, and get them again in the
+        background if they are out of date
+        """
+        watched = self.bs.watchedProjects()
+        if watched is None:
+            watched = self.bs.cache.get(self.bs.apiurl, 'watched')
+        if watched is not None:
+            self.setWatchedProjects(watched)
+        self.scheduler.submit(self.bs.getWatchedProjects, (WATCHED_MAXAGE,),
+                              key=('watched', self.bs.apiurl), priority=PRIORITY_INTERACTIVE)
+
+    def watchedProjectsChanged(self, apiurl, projects):
+        """
+        watchedProjectsChanged(apiurl, projects)
+        
+        Show the watched projects when they have changed
+        """
+        if apiurl == self.bs.apiurl:
+            self.setWatchedProjects(projects)
+
+
 class ProjectFlags(object):
     """
     ProjectFlags(bs, project)
@@ -0,0 +1,195 @@
+#
+# cache.py - Persistent data cache for Yabsc
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+import hashlib
+import marshal
+import os
+import re
+import struct
+import tempfile
+import threading
+import zlib
+
+# Every cache file starts with this header. Bump CACHE_VERSION whenever the
+# layout of any cached value changes, so old entries are discarded
+CACHE_MAGIC = 'YBSC'
+CACHE_VERSION = 2
+_header = struct.Struct('>4sH')
+
+# The file names of entries, as made by DiskCache._filename()
+_entryname = re.compile(r'^[^.].*-[0-9a-f]{16}$')
+
+def defaultCacheDir():
+    """
+    defaultCacheDir() -> str
+
+    Returns the directory for the yabsc cache, following the XDG base
+    directory specification
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'yabsc')
+
+def defaultDataDir():
+    """
+    defaultDataDir() -> str
+
+    Returns the directory for data yabsc keeps for the long term, such as
+    history, following the XDG base directory specification
+    """
+    base = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+    return os.path.join(base, 'yabsc')
+
+
+class DiskCache(object):
+    """
+    DiskCache(path=None, maxsize=64*1024*1024)
+
+    A persistent cache of marshallable values, stored as compressed files
+    under 'path' (by default the entries directory of the yabsc cache, apart
+    from the other stores in it). Values are keyed by API URL, kind and name.
+    Once the cache grows beyond 'maxsize' bytes, the least recently used
+    entries are removed
+    """
+    def __init__(self, path=None, maxsize=64*1024*1024):
+        if path is None:
+            path = os.path.join(defaultCacheDir(), 'entries')
+        self.path = path
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+
+    def _filename(self, apiurl, kind, name):
+        """
+        _filename(apiurl, kind, name) -> str
+
+        Returns the file name for an entry
+        """
+        server = hashlib.sha1(apiurl).hexdigest()[:16]
+        entry = hashlib.sha1(name).hexdigest()[:16]
+        return os.path.join(self.path, server, '%s-%s' % (kind, entry))
+
+    def get(self, apiurl, kind, name=''):
+        """
+        get(apiurl, kind, name='') -> object
+
+        Returns the cached value, or None if there is no valid entry
+        """
+        filename = self._filename(apiurl, kind, name)
+        try:
+            f = open(filename, 'rb')
+            try:
+                data = f.read()
+            finally:
+                f.close()
+        except IOError:
+            return None
+        try:
+            (magic, version) = _header.unpack_from(data)
+            if magic != CACHE_MAGIC or version != CACHE_VERSION:
+                raise ValueError('cache entry version mismatch')
+            value = marshal.loads(zlib.decompress(data[_header.size:]))
+        except (struct.error, ValueError, EOFError, TypeError, zlib.error):
+            self._remove(filename)
+            return None
+        # Record the access for eviction
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return value
+
+    def put(self, apiurl, kind, value, name=''):
+        """
+        put(apiurl, kind, value, name='')
+
+        Store value in the cache. Errors writing the cache are ignored
+        """
+        filename = self._filename(apiurl, kind, name)
+        data = _header.pack(CACHE_MAGIC, CACHE_VERSION) + zlib.compress(marshal.dumps(value), 1)
+        try:
+            directory = os.path.dirname(filename)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            (fd, tmpname) = tempfile.mkstemp(prefix='.tmp', dir=directory)
+            f = os.fdopen(fd, 'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            os.rename(tmpname, filename)
+        except (IOError, OSError):
+            return
+        self.evict()
+
+    def remove(self, apiurl, kind, name=''):
+        """
+        remove(apiurl, kind, name='')
+
+        Remove an entry from the cache
+        """
+        self._remove(self._filename(apiurl, kind, name))
+
+    def _remove(self, filename):
+        try:
+            os.unlink(filename)
+        except OSError:
+            pass
+
+    def evict(self):
+        """
+        evict()
+
+        Remove the least recently used entries until the cache is no larger
+        than maxsize. Only the entry files of each server directory are
+        counted and removed
+        """
+        self.lock.acquire()
+        try:
+            entries = []
+            total = 0
+            try:
+                servers = os.listdir(self.path)
+            except OSError:
+                return
+            for server in servers:
+                dirpath = os.path.join(self.path, server)
+                try:
+                    filenames = os.listdir(dirpath)
+                except OSError:
+                    continue
+                for filename in filenames:
+                    if not _entryname.match(filename):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+            if total <= self.maxsize:
+                return
+            entries.sort()
+            for (mtime, size, path) in entries:
+                if total <= self.maxsize:
+                    break
+                self._remove(path)
+                total -= size
+        finally:
+            self.lock.release()
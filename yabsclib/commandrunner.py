@@ -0,0 +1,156 @@
+#
+# commandrunner.py - Background user commands for Yabsc
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+from PyQt4 import QtGui, QtCore
+
+from scheduler import PRIORITY_INTERACTIVE
+
+# Milliseconds between checks for commands cancelled through the scheduler
+CHECK_INTERVAL = 500
+
+class Command(object):
+    """
+    Command(request, description, callback, errback)
+
+    A user command running on the request scheduler
+    """
+    def __init__(self, request, description, callback, errback):
+        self.request = request
+        self.description = description
+        self.callback = callback
+        self.errback = errback
+
+
+class CommandRunner(QtGui.QWidget):
+    """
+    CommandRunner(scheduler, parent=None)
+
+    Runs commands started by the user, such as rebuilds and downloads, on the
+    request scheduler, so that the GUI stays responsive. While commands are
+    running, the widget shows a busy indicator with the description of the
+    oldest one and a button to cancel them. It is meant to be added to the
+    status bar
+    """
+    def __init__(self, scheduler, parent=None):
+        QtGui.QWidget.__init__(self, parent)
+        self.scheduler = scheduler
+        self.commands = []
+        self.timer = QtCore.QTimer()
+        QtCore.QObject.connect(self.timer, QtCore.SIGNAL("timeout()"), self.updateIndicator)
+
+        self.label = QtGui.QLabel()
+        self.progressbar = QtGui.QProgressBar()
+        self.progressbar.setRange(0, 0)
+        self.progressbar.setMaximumWidth(100)
+        self.progressbar.setMaximumHeight(16)
+        self.cancelbutton = QtGui.QToolButton()
+        self.cancelbutton.setText('Cancel')
+        self.cancelbutton.setAutoRaise(True)
+        self.cancelbutton.setToolTip('Cancel the running commands')
+        QtCore.QObject.connect(self.cancelbutton, QtCore.SIGNAL("clicked()"), self.cancel)
+
+        layout = QtGui.QHBoxLayout()
+        layout.setMargin(0)
+        layout.addWidget(self.label)
+        layout.addWidget(self.progressbar)
+        layout.addWidget(self.cancelbutton)
+        self.setLayout(layout)
+        self.hide()
+
+    def run(self, description, func, args=(), kwargs=None, callback=None, errback=None,
+            key=None, group=None, **params):
+        """
+        run(description, func, args=(), kwargs=None, callback=None,
+            errback=None, key=None, group=None, **params) -> Request
+
+        Run func(*args, **kwargs) on the scheduler as the command described
+        by 'description'. callback(request) is called when it is done. If it
+        fails, errback(request) is called, or an error message is shown if
+        there is no errback. See RequestScheduler.submit() for key, group and
+        params
+        """
+        request = self.scheduler.submit(func, args, kwargs, key=key, group=group,
+                                        priority=PRIORITY_INTERACTIVE,
+                                        callback=self.commandDone, errback=self.commandDone,
+                                        **params)
+        self.commands.append(Command(request, description, callback, errback))
+        self.updateIndicator()
+        return request
+
+    def isActive(self):
+        """
+        isActive() -> boolean
+
+        Returns True while commands are running
+        """
+        self.updateIndicator()
+        return bool(self.commands)
+
+    def cancel(self):
+        """
+        cancel()
+
+        Cancel all commands. Requests already sent to the server can not be
+        recalled, but their results are discarded
+        """
+        for command in self.commands:
+            command.request.cancel()
+        self.commands = []
+        self.updateIndicator()
+
+    def commandDone(self, request):
+        """
+        commandDone(request)
+
+        Deliver the outcome of a request to the commands waiting for it
+        """
+        done = [command for command in self.commands if command.request is request]
+        self.commands = [command for command in self.commands if command.request is not request]
+        self.updateIndicator()
+        for command in done:
+            if request.error is None:
+                if command.callback:
+                    command.callback(request)
+            elif command.errback:
+                command.errback(request)
+            else:
+                QtGui.QMessageBox.critical(self.window(), "Error",
+                                           "%s failed: %s" % (command.description, request.error))
+
+    def updateIndicator(self):
+        """
+        updateIndicator()
+
+        Show the oldest running command, or hide the indicator if there are
+        none. Commands that were cancelled, such as those superseded by others
+        of their group, are dropped
+        """
+        self.commands = [command for command in self.commands if not command.request.cancelled]
+        if not self.commands:
+            self.timer.stop()
+            self.hide()
+            return
+        if not self.timer.isActive():
+            self.timer.start(CHECK_INTERVAL)
+        text = "%s ..." % self.commands[0].description
+        if len(self.commands) > 1:
+            text += " (%d more)" % (len(self.commands) - 1)
+        self.label.setText(text)
+        self.show()
@@ -0,0 +1,482 @@
+#
+# connection.py - Persistent HTTP connections for Yabsc
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+import base64
+import cookielib
+import httplib
+import socket
+import ssl
+import threading
+import traceback
+import urllib
+import urllib2
+import urlparse
+import warnings
+from StringIO import StringIO
+from osc import conf, core
+
+# Methods that can be sent again when a reused connection fails, as repeating
+# them has no further effect on the server. Other methods are always sent on
+# a new connection
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+# Redirects that are followed for IDEMPOTENT_METHODS, and how many of them in
+# a row, like urllib2 does
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+
+# Seconds a connection may wait for the server before the request fails
+TIMEOUT = 60
+
+class MainThreadRequestWarning(RuntimeWarning):
+    """
+    Issued for a request made on the main thread, which runs the GUI and does
+    not respond until the request is done
+    """
+
+def checkThread(method, url):
+    """
+    checkThread(method, url) -> boolean
+
+    Returns True if called on the main thread, after warning with the stack
+    of the caller. The warning is shown once for each call site
+    """
+    if threading.currentThread().getName() != 'MainThread':
+        return False
+    stack = ''.join(traceback.format_stack()[:-2])
+    warnings.warn("%s %s on the main thread\n%s" % (method, url, stack), MainThreadRequestWarning)
+    return True
+
+def hostOptions(apiurl):
+    """
+    hostOptions(apiurl) -> dict
+
+    Returns the options configured in .oscrc for the server of apiurl, which
+    are empty if there are none
+    """
+    options = conf.config.get('api_host_options', {})
+    host = urlparse.urlsplit(apiurl)[1]
+    for key in (apiurl, host):
+        if key in options:
+            return options[key]
+    return {}
+
+def credentials(apiurl):
+    """
+    credentials(apiurl) -> tuple
+
+    Returns the (user, password) configured in .oscrc for apiurl, or None if
+    there are none
+    """
+    options = hostOptions(apiurl)
+    user = options.get('user')
+    if not user:
+        return None
+    password = options.get('pass', '')
+    # Passwords from a keyring or credentials manager may be objects that are
+    # looked up when needed
+    if callable(password):
+        password = password()
+    return (user, str(password or ''))
+
+def sslContext(apiurl):
+    """
+    sslContext(apiurl) -> ssl.SSLContext
+
+    Returns the SSL context for the server of apiurl, checking certificates
+    against the cafile or capath configured in .oscrc, or the system
+    certificates, unless sslcertck is off
+    """
+    options = hostOptions(apiurl)
+    if not options.get('sslcertck', True):
+        return ssl._create_unverified_context()
+    return ssl.create_default_context(cafile=options.get('cafile') or None,
+                                      capath=options.get('capath') or None)
+
+def proxy(scheme, netloc):
+    """
+    proxy(scheme, netloc) -> tuple
+
+    Returns the (host, user, password) of the proxy configured in the
+    environment for URLs with scheme on the server netloc, like urllib2
+    finds it, or None if they are not proxied. user and password are None
+    if the proxy needs no authentication
+    """
+    host = netloc.split('@')[-1].split(':')[0]
+    url = urllib.getproxies().get(scheme)
+    if not url or urllib.proxy_bypass(host):
+        return None
+    if '://' not in url:
+        url = 'http://' + url
+    proxyhost = urlparse.urlsplit(url)[1]
+    (user, password) = (None, None)
+    if '@' in proxyhost:
+        (userinfo, proxyhost) = proxyhost.rsplit('@', 1)
+        (user, password) = (urllib.unquote(userinfo.split(':', 1)[0]),
+                            urllib.unquote(userinfo.split(':', 1)[-1]))
+    return (proxyhost, user, password)
+
+
+class CookieResponse(object):
+    """
+    CookieResponse(response)
+
+    The part of a urllib2 response that cookielib reads cookies from, for an
+    httplib response
+    """
+    def __init__(self, response):
+        self.response = response
+
+    def info(self):
+        return self.response.msg
+
+
+class ConnectionPool(object):
+    """
+    ConnectionPool(apiurl, size=4)
+
+    Keep-alive HTTP connections to the server of apiurl. Up to 'size' idle
+    connections are kept for reuse; more may be open at the same time when
+    there are more concurrent requests. Proxies are taken from the
+    environment, like urllib2 does, and the SSL options, extra headers and
+    cookie jar are those of osc. Servers that ask for another kind of
+    authentication than the basic one, or use the ssh signature
+    authentication of osc, are handled by the osc http functions instead.
+    The number of requests, connections opened and connections reused are
+    kept in 'requests', 'opened' and 'reused', and the number of requests
+    made on the main thread in 'mainthread'
+    """
+    def __init__(self, apiurl, size=4):
+        (scheme, netloc) = urlparse.urlsplit(apiurl)[:2]
+        self.apiurl = apiurl
+        self.scheme = scheme
+        self.netloc = netloc
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.opened = 0
+        self.reused = 0
+        self.mainthread = 0
+        self.headers = {'User-Agent': 'yabsc',
+                        'Connection': 'keep-alive'}
+        options = hostOptions(apiurl)
+        for (header, value) in options.get('http_headers', ()):
+            self.headers[header] = value
+        auth = credentials(apiurl)
+        if auth:
+            self.headers['Authorization'] = 'Basic ' + base64.b64encode('%s:%s' % auth)
+        # Let osc handle the authentication schemes the pool can not
+        self.fallback = bool(options.get('sshkey'))
+        self.cookiejar = getattr(conf, 'cookiejar', None)
+        if self.cookiejar is None:
+            self.cookiejar = cookielib.CookieJar()
+        self.context = None
+        if scheme == 'https':
+            self.context = sslContext(apiurl)
+        self.proxy = proxy(scheme, netloc)
+        self.proxyheaders = {}
+        if self.proxy and self.proxy[1] is not None:
+            self.proxyheaders['Proxy-Authorization'] = 'Basic ' + base64.b64encode('%s:%s' % self.proxy[1:])
+
+    def _get(self, reuse=True):
+        """
+        _get(reuse=True) -> (HTTPConnection, boolean)
+
+        Returns an idle connection if 'reuse' is True and there is one, or a
+        new one, and whether it was reused
+        """
+        self.lock.acquire()
+        try:
+            self.requests += 1
+            if reuse and self.idle:
+                self.reused += 1
+                return (self.idle.pop(), True)
+            self.opened += 1
+        finally:
+            self.lock.release()
+        host = self.netloc
+        if self.proxy is not None:
+            host = self.proxy[0]
+        if self.scheme == 'https':
+            connection = httplib.HTTPSConnection(host, timeout=TIMEOUT, context=self.context)
+            # HTTPS goes through a tunnel, HTTP requests are sent to the proxy
+            if self.proxy is not None:
+                connection.set_tunnel(self.netloc, headers=self.proxyheaders)
+            return (connection, False)
+        return (httplib.HTTPConnection(host, timeout=TIMEOUT), False)
+
+    def _put(self, connection):
+        """
+        _put(connection)
+
+        Return a connection whose response has been read completely to the
+        pool, or close it if the pool is full
+        """
+        self.lock.acquire()
+        try:
+            if len(self.idle) < self.size:
+                self.idle.append(connection)
+                return
+        finally:
+            self.lock.release()
+        connection.close()
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        request(method, url, body=None, headers=None) -> PooledResponse
+
+        Send a request for the absolute 'url' and return the response. Errors
+        are raised as urllib2.HTTPError, like the osc http functions do.
+
+        Only IDEMPOTENT_METHODS are sent on reused connections, and retried on
+        a new one if the server has closed the connection in the meantime.
+        Other requests may have reached the server whatever the error, so
+        they are sent on a new connection and never repeated
+        """
+        if checkThread(method, url):
+            self.lock.acquire()
+            try:
+                self.mainthread += 1
+            finally:
+                self.lock.release()
+        if self.fallback:
+            return core.http_request(method, url, headers or {}, body)
+        (scheme, netloc, path, query, fragment) = urlparse.urlsplit(url)
+        if query:
+            path += '?' + query
+        allheaders = self.headers.copy()
+        if self.proxy is not None and self.scheme != 'https':
+            path = '%s://%s%s' % (scheme, netloc, path)
+            allheaders.update(self.proxyheaders)
+        if headers:
+            allheaders.update(headers)
+        if body is not None:
+            allheaders['Content-Length'] = str(len(body))
+        cookierequest = urllib2.Request(url)
+        self.cookiejar.add_cookie_header(cookierequest)
+        if cookierequest.has_header('Cookie'):
+            allheaders['Cookie'] = cookierequest.get_header('Cookie')
+
+        idempotent = method in IDEMPOTENT_METHODS
+        while True:
+            (connection, reused) = self._get(idempotent)
+            try:
+                connection.request(method, path, body, allheaders)
+                response = connection.getresponse()
+                break
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                if not reused:
+                    raise
+        self.cookiejar.extract_cookies(CookieResponse(response), cookierequest)
+
+        if not 200 <= response.status < 300:
+            data = response.read()
+            if response.will_close:
+                connection.close()
+            else:
+                self._put(connection)
+            if response.status == 401 and 'basic' not in (response.getheader('WWW-Authenticate') or '').lower():
+                # The request was refused, so it can be sent again
+                self.fallback = True
+                return core.http_request(method, url, headers or {}, body)
+            raise urllib2.HTTPError(url, response.status, response.reason, response.msg, StringIO(data))
+        return PooledResponse(self, connection, response)
+
+    def close(self):
+        """
+        close()
+
+        Close the idle connections
+        """
+        self.lock.acquire()
+        try:
+            idle = self.idle
+            self.idle = []
+        finally:
+            self.lock.release()
+        for connection in idle:
+            connection.close()
+
+    def stats(self):
+        """
+        stats() -> dict
+
+        Returns the request statistics of the pool
+        """
+        return {'requests': self.requests,
+                'opened': self.opened,
+                'reused': self.reused,
+                'mainthread': self.mainthread,
+                'idle': len(self.idle)}
+
+
+class PooledResponse(object):
+    """
+    PooledResponse(pool, connection, response)
+
+    A file-like HTTP response. Its connection is returned to the pool as soon
+    as the body has been read completely
+    """
+    def __init__(self, pool, connection, response):
+        self.pool = pool
+        self.connection = connection
+        self.response = response
+        self.status = response.status
+
+    def read(self, size=-1):
+        if self.connection is None:
+            return ''
+        if size < 0:
+            data = self.response.read()
+        else:
+            data = self.response.read(size)
+        if self.response.isclosed() or (size != 0 and not data):
+            self._release()
+        return data
+
+    def info(self):
+        return self.response.msg
+
+    def _release(self):
+        """
+        _release()
+
+        Give the connection back to the pool, unless the server wants it closed
+        """
+        connection = self.connection
+        self.connection = None
+        if self.response.will_close:
+            connection.close()
+        else:
+            self.pool._put(connection)
+
+    def close(self):
+        """
+        close()
+
+        Close the response. A connection with unread data is closed rather
+        than reused
+        """
+        if self.connection is not None:
+            if self.response.isclosed():
+                self._release()
+            else:
+                self.connection.close()
+                self.connection = None
+
+
+class Session(object):
+    """
+    Session(size=4)
+
+    HTTP access to any number of build service servers, with a
+    ConnectionPool of 'size' connections for each API URL
+    """
+    def __init__(self, size=4):
+        self.size = size
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def pool(self, url):
+        """
+        pool(url) -> ConnectionPool
+
+        Returns the connection pool for the server of url
+        """
+        (scheme, netloc) = urlparse.urlsplit(url)[:2]
+        key = (scheme, netloc)
+        self.lock.acquire()
+        try:
+            try:
+                return self.pools[key]
+            except KeyError:
+                pool = ConnectionPool('%s://%s' % key, self.size)
+                self.pools[key] = pool
+                return pool
+        finally:
+            self.lock.release()
+
+    def setSize(self, size):
+        """
+        setSize(size)
+
+        Set the number of idle connections kept for each server
+        """
+        self.size = size
+        self.lock.acquire()
+        try:
+            for pool in self.pools.values():
+                pool.size = size
+        finally:
+            self.lock.release()
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        request(method, url, body=None, headers=None) -> PooledResponse
+
+        Send a request, following up to MAX_REDIRECTS redirects of
+        IDEMPOTENT_METHODS. See ConnectionPool.request()
+        """
+        redirects = 0
+        while True:
+            try:
+                return self.pool(url).request(method, url, body, headers)
+            except urllib2.HTTPError, e:
+                location = e.info().getheader('Location')
+                if e.code not in REDIRECT_CODES or method not in IDEMPOTENT_METHODS \
+                   or not location or redirects == MAX_REDIRECTS:
+                    raise
+                redirects += 1
+                url = urlparse.urljoin(url, location)
+
+    def GET(self, url, headers=None):
+        return self.request('GET', url, headers=headers)
+
+    def PUT(self, url, data, headers=None):
+        return self.request('PUT', url, data, headers)
+
+    def POST(self, url, data='', headers=None):
+        return self.request('POST', url, data, headers)
+
+    def close(self):
+        """
+        close()
+
+        Close the idle connections of all servers
+        """
+        for pool in self.pools.values():
+            pool.close()
+
+    def stats(self, apiurl=None):
+        """
+        stats(apiurl=None) -> dict
+
+        Returns the request statistics of the server of apiurl, or the totals
+        for all servers
+        """
+        if apiurl is not None:
+            return self.pool(apiurl).stats()
+        total = {'requests': 0, 'opened': 0, 'reused': 0, 'mainthread': 0, 'idle': 0}
+        for pool in self.pools.values():
+            for (key, value) in pool.stats().items():
+                total[key] += value
+        return total
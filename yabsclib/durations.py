@@ -0,0 +1,368 @@
+#
+# durations.py - Build duration estimates for Yabsc
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+import httplib
+import marshal
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib2
+from PyQt4 import QtCore
+
+from cache import defaultCacheDir
+
+# Bump whenever the layout of the duration cache changes
+CACHE_VERSION = 1
+
+# Seconds between cache saves while durations are being added
+SAVE_INTERVAL = 60
+
+# Seconds for which the estimated duration of a build is used before its
+# history is retrieved again
+ESTIMATE_MAXAGE = 86400
+
+# The number of most recent builds an estimate is based on
+HISTORY_DEPTH = 5
+
+# Histories retrieved by one background request, and background requests
+# running at a time
+BATCH_SIZE = 16
+CONCURRENCY = 2
+
+# Errors retrieving or parsing a build history. Histories that could not be
+# retrieved are tried again after RETRY_DELAY seconds, doubling with every
+# failure up to ESTIMATE_MAXAGE
+FETCH_ERRORS = (urllib2.URLError, httplib.HTTPException, socket.error, SyntaxError, ValueError)
+RETRY_DELAY = 60
+
+def estimateDuration(durations):
+    """
+    estimateDuration(durations) -> int
+
+    Returns the median of the last HISTORY_DEPTH durations of a
+    getBuildDurations() list, or None if it is empty
+    """
+    recent = sorted([seconds for (t, seconds) in durations[-HISTORY_DEPTH:]])
+    if not recent:
+        return None
+    return recent[len(recent) / 2]
+
+def fetchDurations(bs, keys):
+    """
+    fetchDurations(bs, keys) -> tuple
+
+    Retrieve the build histories of keys, a list of (apiurl, project,
+    package, target) tuples, through the BuildService object bs, and store
+    their estimateDuration() in its DurationCache. Builds without a history
+    have a duration of None. Keys of other API servers than that of bs are
+    left out.
+
+    Returns a (results, failures) tuple. results is a list of (key, duration)
+    pairs, and failures a list of (key, error) pairs of the histories that
+    could not be retrieved
+    """
+    results = []
+    failures = []
+    for key in keys:
+        (apiurl, project, package, target) = key
+        if apiurl != bs.apiurl:
+            continue
+        try:
+            duration = estimateDuration(bs.getBuildDurations(project, package, target))
+        except urllib2.HTTPError, e:
+            if e.code != 404:
+                failures.append((key, e))
+                continue
+            duration = None
+        except FETCH_ERRORS, e:
+            failures.append((key, e))
+            continue
+        bs.durations.put(key, duration)
+        results.append((key, duration))
+    return (results, failures)
+
+
+class DurationCache(object):
+    """
+    DurationCache(path=None)
+
+    A persistent cache of the estimated durations of builds, keyed by
+    (apiurl, project, package, target), stored in the file 'path', by default
+    the durations file of the yabsc cache, beside the entries directory of
+    the DiskCache so its eviction does not remove it
+    """
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(defaultCacheDir(), 'durations')
+        self.path = path
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.dirty = False
+        self.saved = 0
+        # key -> (time checked, duration)
+        self.durations = {}
+
+    def _load(self):
+        """
+        _load()
+
+        Read the cache on first use. The lock must be held
+        """
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            f = open(self.path, 'rb')
+            try:
+                (version, durations) = marshal.load(f)
+            finally:
+                f.close()
+            if version != CACHE_VERSION:
+                raise ValueError('duration cache version mismatch')
+        except (IOError, EOFError, ValueError, TypeError):
+            durations = {}
+        self.durations = durations
+
+    def snapshot(self):
+        """
+        snapshot() -> dict
+
+        Returns a copy of the cache as a dict of keys to (time checked,
+        duration) tuples
+        """
+        self.lock.acquire()
+        try:
+            self._load()
+            return dict(self.durations)
+        finally:
+            self.lock.release()
+
+    def put(self, key, duration):
+        """
+        put(key, duration)
+
+        Store the estimated duration of key, checked now
+        """
+        self.lock.acquire()
+        try:
+            self._load()
+            self.durations[key] = (time.time(), duration)
+            self.dirty = True
+        finally:
+            self.lock.release()
+        if time.time() - self.saved > SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        """
+        save()
+
+        Write the cache, leaving out durations older than ESTIMATE_MAXAGE, if
+        it has changed. Errors writing the cache are ignored
+        """
+        self.lock.acquire()
+        try:
+            if not self.dirty:
+                return
+            deadline = time.time() - ESTIMATE_MAXAGE
+            durations = dict([(key, value) for (key, value) in self.durations.iteritems() if value[0] > deadline])
+            data = marshal.dumps((CACHE_VERSION, durations))
+            try:
+                directory = os.path.dirname(self.path)
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                (fd, tmpname) = tempfile.mkstemp(prefix='.tmp', dir=directory)
+                f = os.fdopen(fd, 'wb')
+                try:
+                    f.write(data)
+                finally:
+                    f.close()
+                os.rename(tmpname, self.path)
+            except (IOError, OSError):
+                return
+            self.dirty = False
+            self.saved = time.time()
+        finally:
+            self.lock.release()
+
+
+class DurationEstimator(QtCore.QObject):
+    """
+    DurationEstimator(bs, scheduler)
+
+    Estimates the remaining time of running builds from the build histories
+    in the DurationCache of the BuildService object bs. The cache is read on
+    scheduler, and estimates are given from a copy of it, 'estimates', which
+    is only changed on the GUI thread. Histories that are missing or older
+    than ESTIMATE_MAXAGE are retrieved in the background on scheduler,
+    BATCH_SIZE at a time, and each is only requested once however many
+    workers build it. Retrievals for an earlier API server are dropped when
+    the server changes.
+
+    Emits estimatesChanged(keys) with the keys of newly retrieved durations,
+    and estimatesFailed(failures) with the (key, error) pairs of histories
+    that could not be retrieved
+    """
+    def __init__(self, bs, scheduler):
+        QtCore.QObject.__init__(self)
+        self.bs = bs
+        self.scheduler = scheduler
+        self.apiurl = bs.apiurl
+        self.queue = []
+        # Keys queued or being retrieved
+        self.pending = set()
+        self.requests = []
+        # Key -> (time checked, duration), or None until the cache is read
+        self.estimates = None
+        # Key -> (time of the next retry, delay) of failed retrievals
+        self.failures = {}
+        # The workers of the last update, queued once the cache is read
+        self.workers = []
+        self.scheduler.submit(self.bs.durations.snapshot, callback=self.cacheLoaded,
+                              errback=self.cacheLoaded)
+
+    def cacheLoaded(self, request):
+        """
+        cacheLoaded(request)
+
+        Take the copy of the cache read on the scheduler and queue the
+        retrievals of the workers updated while it was being read
+        """
+        if request.error is None:
+            self.estimates = request.result
+        else:
+            self.estimates = {}
+        self.update(self.workers)
+
+    def key(self, worker):
+        """
+        key(worker) -> tuple
+
+        Returns the duration cache key of the build of worker
+        """
+        return (self.bs.apiurl, worker.project, worker.package, worker.target)
+
+    def update(self, workers):
+        """
+        update(workers)
+
+        Queue the retrieval of the histories of the builds of workers that
+        have no current estimate, except those failing to be retrieved
+        until their next retry
+        """
+        if self.bs.apiurl != self.apiurl:
+            self.reset()
+        self.workers = workers
+        if self.estimates is None:
+            return
+        now = time.time()
+        deadline = now - ESTIMATE_MAXAGE
+        for worker in workers:
+            if worker.starttime is None:
+                continue
+            key = self.key(worker)
+            if key in self.pending:
+                continue
+            failure = self.failures.get(key)
+            if failure is not None and failure[0] > now:
+                continue
+            cached = self.estimates.get(key)
+            if cached is None or cached[0] < deadline:
+                self.pending.add(key)
+                self.queue.append(key)
+        self.submitNext()
+
+    def reset(self):
+        """
+        reset()
+
+        Cancel the queued and running retrievals, and follow the current API
+        server of bs
+        """
+        for request in self.requests:
+            request.cancel()
+        self.requests = []
+        self.queue = []
+        self.pending = set()
+        self.apiurl = self.bs.apiurl
+
+    def submitNext(self):
+        """
+        submitNext()
+
+        Start requests until CONCURRENCY are running. The requests are not
+        in a group, as submitting to a group cancels the other requests in it
+        """
+        while self.queue and len(self.requests) < CONCURRENCY:
+            keys = self.queue[:BATCH_SIZE]
+            del self.queue[:BATCH_SIZE]
+            request = self.scheduler.submit(fetchDurations, (self.bs, keys),
+                                            callback=self.durationsFetched, errback=self.durationsFetched,
+                                            keys=keys)
+            self.requests.append(request)
+
+    def durationsFetched(self, request):
+        """
+        durationsFetched(request)
+
+        Take the durations retrieved by one request into 'estimates', back
+        off the keys that failed, and start the next request
+        """
+        if request not in self.requests:
+            return
+        self.requests.remove(request)
+        self.pending.difference_update(request.params['keys'])
+        if request.error is None:
+            (results, failures) = request.result
+        else:
+            (results, failures) = ([], [(key, request.error) for key in request.params['keys']])
+        now = time.time()
+        keys = []
+        for (key, duration) in results:
+            self.estimates[key] = (now, duration)
+            self.failures.pop(key, None)
+            keys.append(key)
+        for (key, error) in failures:
+            delay = RETRY_DELAY
+            if key in self.failures:
+                delay = min(self.failures[key][1] * 2, ESTIMATE_MAXAGE)
+            self.failures[key] = (now + delay, delay)
+        self.submitNext()
+        if keys:
+            self.emit(QtCore.SIGNAL("estimatesChanged"), keys)
+        if failures:
+            self.emit(QtCore.SIGNAL("estimatesFailed"), failures)
+
+    def remaining(self, worker):
+        """
+        remaining(worker) -> int
+
+        Returns the estimated seconds until the build of worker finishes,
+        which is negative for builds taking longer than estimated, or None if
+        there is no estimate
+        """
+        if worker.starttime is None or self.estimates is None:
+            return None
+        cached = self.estimates.get(self.key(worker))
+        if cached is None or cached[1] is None:
+            return None
+        return int(cached[1] - (time.time() - worker.starttime))
@@ -0,0 +1,409 @@
+#
+# fleethistory.py - Worker fleet history for Yabsc
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+import hashlib
+import marshal
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from cache import defaultDataDir
+
+# Bump whenever the layout of the history files changes
+HISTORY_VERSION = 2
+
+# A sample of one architecture: time, architecture id, and the building
+# workers, idle workers and waiting jobs. Rollups hold averages
+RECORD = struct.Struct('<dHfff')
+
+# The kinds of architecture a history is kept for. Workers report the
+# architecture of their host, and waiting jobs the scheduler architecture
+# they build for, which need not be the same, so each architecture is
+# recorded as a (kind, name) pair
+HOSTARCH = 'hostarch'
+SCHEDULERARCH = 'arch'
+
+# The seconds covered by each record of a level, with 0 for the samples as
+# recorded, and the seconds for which the level is kept, or None to keep it
+# forever
+LEVELS = ((0, 8*86400),
+          (60, 31*86400),
+          (600, 366*86400),
+          (3600, None))
+
+# The usual number of seconds between samples, used to pick a level for
+# queries
+SAMPLE_INTERVAL = 10
+
+class Series(object):
+    """
+    Series(filename)
+
+    An append-only file of RECORD records in time order. Records are found
+    by binary search on their times, so reading a time range only reads the
+    records in it
+    """
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __len__(self):
+        try:
+            return os.path.getsize(self.filename) / RECORD.size
+        except OSError:
+            return 0
+
+    def append(self, records):
+        """
+        append(records)
+
+        Append a list of record tuples
+        """
+        if not records:
+            return
+        f = open(self.filename, 'ab')
+        try:
+            f.write(''.join([RECORD.pack(*record) for record in records]))
+        finally:
+            f.close()
+
+    def _find(self, f, count, t):
+        """
+        _find(f, count, t) -> int
+
+        Returns the index of the first record in the open file f of count
+        records with a time of at least t
+        """
+        (lo, hi) = (0, count)
+        while lo < hi:
+            mid = (lo + hi) / 2
+            f.seek(mid * RECORD.size)
+            if RECORD.unpack(f.read(RECORD.size))[0] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def last(self):
+        """
+        last() -> tuple
+
+        Returns the last record, or None if there are none
+        """
+        count = len(self)
+        if not count:
+            return None
+        f = open(self.filename, 'rb')
+        try:
+            f.seek((count - 1) * RECORD.size)
+            return RECORD.unpack(f.read(RECORD.size))
+        finally:
+            f.close()
+
+    def read(self, start, end):
+        """
+        read(start, end) -> list
+
+        Returns the records with times from start up to, but not including,
+        end
+        """
+        count = len(self)
+        if not count:
+            return []
+        f = open(self.filename, 'rb')
+        try:
+            first = self._find(f, count, start)
+            last = self._find(f, count, end)
+            f.seek(first * RECORD.size)
+            data = f.read((last - first) * RECORD.size)
+        finally:
+            f.close()
+        return [RECORD.unpack_from(data, offset) for offset in xrange(0, len(data) - RECORD.size + 1, RECORD.size)]
+
+    def prune(self, before):
+        """
+        prune(before)
+
+        Remove the records older than before
+        """
+        count = len(self)
+        if not count:
+            return
+        f = open(self.filename, 'rb')
+        try:
+            first = self._find(f, count, before)
+            if first == 0:
+                return
+            f.seek(first * RECORD.size)
+            data = f.read()
+        finally:
+            f.close()
+        (fd, tmpname) = tempfile.mkstemp(prefix='.tmp', dir=os.path.dirname(self.filename))
+        f = os.fdopen(fd, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        os.rename(tmpname, self.filename)
+
+
+class ServerHistory(object):
+    """
+    ServerHistory(path)
+
+    The fleet history of one API server, kept in the directory 'path': a
+    Series for every level in LEVELS, and the list of (kind, name)
+    architectures the records refer to by id. If that list is lost, the
+    records can not be read and are discarded. The rollups in progress are
+    not saved, but rebuilt from the recorded samples
+    """
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.series = [Series(os.path.join(path, '%d.dat' % width)) for (width, keep) in LEVELS]
+        try:
+            f = open(os.path.join(path, 'arches'), 'rb')
+            try:
+                (version, arches) = marshal.load(f)
+            finally:
+                f.close()
+            if version != HISTORY_VERSION:
+                raise ValueError('fleet history version mismatch')
+            self.arches = arches
+        except (IOError, EOFError, ValueError, TypeError):
+            self.arches = []
+            for series in self.series:
+                if len(series):
+                    os.unlink(series.filename)
+        self.archids = dict([(arch, archid) for (archid, arch) in enumerate(self.arches)])
+        # Rollup level -> architecture id -> [bucket, samples, building, idle, waiting]
+        self.pending = [{} for level in LEVELS]
+        now = time.time()
+        for ((width, keep), series) in zip(LEVELS, self.series):
+            if keep is not None:
+                series.prune(now - keep)
+        self._rebuildPending()
+
+    def _rebuildPending(self):
+        """
+        _rebuildPending()
+
+        Accumulate the samples of the last time span of each rollup level,
+        whose record has not been written yet
+        """
+        last = self.series[0].last()
+        if last is None:
+            return
+        now = last[0]
+        start = min([now - now % width for (width, keep) in LEVELS if width])
+        samples = self.series[0].read(start, now + 1)
+        for (level, (width, keep)) in enumerate(LEVELS):
+            if not width:
+                continue
+            bucket = now - now % width
+            pending = self.pending[level]
+            for (t, archid, building, idle, waiting) in samples:
+                if t < bucket:
+                    continue
+                acc = pending.get(archid)
+                if acc is None:
+                    pending[archid] = [bucket, 1, building, idle, waiting]
+                else:
+                    acc[1] += 1
+                    acc[2] += building
+                    acc[3] += idle
+                    acc[4] += waiting
+
+    def archId(self, arch):
+        """
+        archId(arch) -> int
+
+        Returns the id of the (kind, name) tuple arch, adding it to the list
+        of architectures
+        """
+        try:
+            return self.archids[arch]
+        except KeyError:
+            archid = len(self.arches)
+            self.arches.append(arch)
+            self.archids[arch] = archid
+            (fd, tmpname) = tempfile.mkstemp(prefix='.tmp', dir=self.path)
+            f = os.fdopen(fd, 'wb')
+            try:
+                marshal.dump((HISTORY_VERSION, self.arches), f)
+            finally:
+                f.close()
+            os.rename(tmpname, os.path.join(self.path, 'arches'))
+            return archid
+
+    def record(self, now, counts):
+        """
+        record(now, counts)
+
+        Record counts, a dict of (kind, name) architectures to (building,
+        idle, waiting) tuples, as the sample at time now. Known architectures that are not
+        in counts are recorded as zeros. Each rollup record is written once
+        the first sample after its time span arrives
+        """
+        for arch in counts:
+            self.archId(arch)
+        samples = []
+        for (archid, arch) in enumerate(self.arches):
+            (building, idle, waiting) = counts.get(arch, (0, 0, 0))
+            samples.append((now, archid, building, idle, waiting))
+        self.series[0].append(samples)
+
+        for (level, (width, keep)) in enumerate(LEVELS):
+            if not width:
+                continue
+            bucket = now - now % width
+            pending = self.pending[level]
+            rollups = []
+            for (t, archid, building, idle, waiting) in samples:
+                acc = pending.get(archid)
+                if acc is not None and acc[0] != bucket:
+                    n = float(acc[1])
+                    rollups.append((acc[0], archid, acc[2] / n, acc[3] / n, acc[4] / n))
+                    acc = None
+                if acc is None:
+                    pending[archid] = [bucket, 1, building, idle, waiting]
+                else:
+                    acc[1] += 1
+                    acc[2] += building
+                    acc[3] += idle
+                    acc[4] += waiting
+            self.series[level].append(rollups)
+
+    def query(self, start, end, arch=None, maxpoints=1200):
+        """
+        query(start, end, arch=None, maxpoints=1200) -> tuple
+
+        Returns the history from start to end as a (width, samples) tuple.
+        width is the span in seconds of each sample, 0 for the samples as
+        recorded, from the finest level giving at most about maxpoints
+        samples. samples is a list of (time, building, idle, waiting) tuples
+        for the (kind, name) architecture arch, or the totals of all
+        architectures if arch is None
+        """
+        for (level, (width, keep)) in enumerate(LEVELS):
+            if (end - start) / max(width, SAMPLE_INTERVAL) <= maxpoints:
+                break
+        archid = None
+        if arch is not None:
+            archid = self.archids.get(arch)
+            if archid is None:
+                return (width, [])
+        totals = {}
+        for (t, recordarch, building, idle, waiting) in self.series[level].read(start, end):
+            if archid is not None and recordarch != archid:
+                continue
+            total = totals.get(t)
+            if total is None:
+                totals[t] = [building, idle, waiting]
+            else:
+                total[0] += building
+                total[1] += idle
+                total[2] += waiting
+        return (width, [(t, b, i, w) for (t, (b, i, w)) in sorted(totals.iteritems())])
+
+
+class FleetHistory(object):
+    """
+    FleetHistory(path=None)
+
+    A local time series store of the worker fleet of each API server under
+    'path', by default the fleet directory of the yabsc data directory, where
+    no cache eviction reaches it. Every worker
+    status poll adds a sample of the building and idle workers of each host
+    architecture and the waiting jobs of each scheduler architecture. Samples are rolled up into averages
+    over a minute, ten minutes and an hour, so queries over long periods
+    read few records
+    """
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(defaultDataDir(), 'fleet')
+        self.path = path
+        self.lock = threading.Lock()
+        self.servers = {}
+
+    def _server(self, apiurl):
+        """
+        _server(apiurl) -> ServerHistory
+
+        Returns the history of apiurl. The lock must be held
+        """
+        try:
+            return self.servers[apiurl]
+        except KeyError:
+            name = hashlib.sha1(apiurl).hexdigest()[:16]
+            server = ServerHistory(os.path.join(self.path, name))
+            self.servers[apiurl] = server
+            return server
+
+    def record(self, snapshot, now=None):
+        """
+        record(snapshot, now=None)
+
+        Add a sample of the WorkerStatusSnapshot snapshot at time now, by
+        default the current time. Errors writing the history are ignored
+        """
+        if now is None:
+            now = time.time()
+        counts = {}
+        for worker in snapshot.building:
+            counts.setdefault((HOSTARCH, worker.hostarch), [0, 0, 0])[0] += 1
+        for worker in snapshot.idle:
+            counts.setdefault((HOSTARCH, worker.hostarch), [0, 0, 0])[1] += 1
+        for (arch, jobs) in snapshot.waiting:
+            counts.setdefault((SCHEDULERARCH, arch), [0, 0, 0])[2] += jobs
+        self.lock.acquire()
+        try:
+            self._server(snapshot.apiurl).record(now, counts)
+        except (IOError, OSError):
+            pass
+        finally:
+            self.lock.release()
+
+    def arches(self, apiurl):
+        """
+        arches(apiurl) -> list
+
+        Returns the (kind, name) architectures recorded for apiurl
+        """
+        self.lock.acquire()
+        try:
+            return sorted(self._server(apiurl).arches)
+        finally:
+            self.lock.release()
+
+    def query(self, apiurl, start, end, arch=None, maxpoints=1200):
+        """
+        query(apiurl, start, end, arch=None, maxpoints=1200) -> tuple
+
+        Returns the history of apiurl from start to end. See
+        ServerHistory.query()
+        """
+        self.lock.acquire()
+        try:
+            return self._server(apiurl).query(start, end, arch, maxpoints)
+        finally:
+            self.lock.release()
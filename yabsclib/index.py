@@ -0,0 +1,359 @@
+#
+# index.py - Name search indexes for Yabsc
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+import bisect
+import fnmatch
+import re
+from array import array
+
+# Characters that make a filter a glob pattern
+GLOB_CHARS = '*?['
+
+def trigrams(text):
+    """
+    trigrams(text) -> set
+
+    Returns the set of three character substrings of text
+    """
+    return set(text[i:i+3] for i in xrange(len(text) - 2))
+
+def parseQuery(text):
+    """
+    parseQuery(text) -> tuple
+
+    Returns the (kind, pattern) of a filter typed by the user. Text between
+    slashes is a regular expression, text with any of GLOB_CHARS is a glob
+    pattern for the whole name, and other text is a substring. kind is
+    'regex', 'glob' or 'substring'
+    """
+    if len(text) > 1 and text.startswith('/') and text.endswith('/'):
+        return ('regex', text[1:-1])
+    for c in GLOB_CHARS:
+        if c in text:
+            return ('glob', text)
+    return ('substring', text)
+
+def narrows(previous, text):
+    """
+    narrows(previous, text) -> boolean
+
+    Returns True if every name matching the filter text also matches the
+    filter previous, so that only the matches of previous need searching
+    """
+    (kind, pattern) = parseQuery(text)
+    (previouskind, previouspattern) = parseQuery(previous)
+    return kind == previouskind == 'substring' and previouspattern.lower() in pattern.lower()
+
+def regexLiterals(pattern):
+    """
+    regexLiterals(pattern) -> list
+
+    Returns strings that any match of the regular expression pattern must
+    contain. Patterns with alternatives or groups give none
+    """
+    if '|' in pattern or '(' in pattern:
+        return []
+    literals = []
+    run = ''
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c in '*?{':
+            # The character before is optional
+            literals.append(run[:-1])
+            run = ''
+            if c == '{':
+                i = pattern.find('}', i)
+                if i < 0:
+                    break
+        elif c == '\\':
+            literals.append(run)
+            run = ''
+            i += 1
+        elif c == '[':
+            literals.append(run)
+            run = ''
+            i = pattern.find(']', i + 2)
+            if i < 0:
+                break
+        elif c in '.^$+':
+            literals.append(run)
+            run = ''
+        else:
+            run += c
+        i += 1
+    literals.append(run)
+    return [literal for literal in literals if literal]
+
+def globLiterals(pattern):
+    """
+    globLiterals(pattern) -> list
+
+    Returns strings that any name matching the glob pattern must contain
+    """
+    return [literal for literal in re.split(r'\*|\?|\[[^\]]*\]?', pattern) if literal]
+
+
+class TrigramIndex(object):
+    """
+    TrigramIndex(names)
+
+    A case insensitive search index over the list 'names'. Searches return the
+    positions of matching names in 'names', in order. A trigram index narrows
+    searches down to the names that contain the literal parts of a query;
+    it is built on the first search that can use it, or by calling build()
+    """
+    def __init__(self, names):
+        self.names = names
+        self.lower = [name.lower() for name in names]
+        self.trigrams = None
+
+    def build(self):
+        """
+        build()
+
+        Build the trigram index, if it has not been built yet
+        """
+        if self.trigrams is not None:
+            return
+        postings = {}
+        for (i, name) in enumerate(self.lower):
+            for gram in trigrams(name):
+                try:
+                    postings[gram].append(i)
+                except KeyError:
+                    postings[gram] = array('I', [i])
+        self.trigrams = postings
+
+    def candidates(self, literals, within=None):
+        """
+        candidates(literals, within=None) -> sequence
+
+        Returns the positions of the names that may contain all of literals:
+        those containing all their trigrams, or within if it is given, as
+        checking the names already narrowed down is faster than the index
+        """
+        if within is not None:
+            return within
+        grams = set()
+        for literal in literals:
+            grams.update(trigrams(literal.lower()))
+        if not grams:
+            return xrange(len(self.names))
+        self.build()
+        postings = sorted([self.trigrams.get(gram, ()) for gram in grams], key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            if not result:
+                break
+            result.intersection_update(posting)
+        return sorted(result)
+
+    def search(self, text, within=None):
+        """
+        search(text, within=None) -> list
+
+        Returns the positions of the names containing text. If within is a
+        list of positions, such as the result of a search for part of text,
+        only those are searched
+        """
+        text = text.lower()
+        lower = self.lower
+        if not text:
+            return list(self.candidates([], within))
+        return [i for i in self.candidates([text], within) if text in lower[i]]
+
+    def glob(self, pattern, within=None):
+        """
+        glob(pattern, within=None) -> list
+
+        Returns the positions of the names matching the shell style pattern
+        """
+        match = re.compile(fnmatch.translate(pattern.lower())).match
+        lower = self.lower
+        return [i for i in self.candidates(globLiterals(pattern), within) if match(lower[i])]
+
+    def regex(self, pattern, within=None):
+        """
+        regex(pattern, within=None) -> list
+
+        Returns the positions of the names containing a match of the regular
+        expression pattern. Raises re.error for invalid patterns
+        """
+        search = re.compile(pattern, re.I).search
+        names = self.names
+        return [i for i in self.candidates(regexLiterals(pattern), within) if search(names[i])]
+
+    def query(self, text, within=None):
+        """
+        query(text, within=None) -> list
+
+        Returns the positions of the names matching a filter typed by the
+        user. See parseQuery()
+        """
+        (kind, pattern) = parseQuery(text)
+        if kind == 'regex':
+            return self.regex(pattern, within)
+        elif kind == 'glob':
+            return self.glob(pattern, within)
+        return self.search(pattern, within)
+
+
+class NameIndex(object):
+    """
+    NameIndex(names)
+
+    A sorted list of distinct names, such as projects, with a TrigramIndex,
+    'text', for case insensitive searches
+    """
+    def __init__(self, names):
+        self.names = sorted(set(names))
+        self.text = TrigramIndex(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        return self.names[i]
+
+    def __contains__(self, name):
+        return self.position(name) >= 0
+
+    def position(self, name):
+        """
+        position(name) -> int
+
+        Returns the position of name, or -1 if it is not in the index
+        """
+        i = bisect.bisect_left(self.names, name)
+        if i < len(self.names) and self.names[i] == name:
+            return i
+        return -1
+
+    def buildTrigrams(self):
+        """
+        buildTrigrams()
+
+        Build the trigram index of 'text'
+        """
+        self.text.build()
+
+    def search(self, text, within=None):
+        """
+        search(text, within=None) -> list
+
+        Returns the positions of the names containing text. See
+        TrigramIndex.search()
+        """
+        return self.text.search(text, within)
+
+
+def intersect(positions, size):
+    """
+    intersect(positions, size) -> list
+
+    Returns the sorted positions that are in all the lists of positions in
+    the list 'positions', or all positions up to size if there are none
+    """
+    if not positions:
+        return range(size)
+    positions = sorted(positions, key=len)
+    result = positions[0]
+    for other in positions[1:]:
+        if not result:
+            break
+        other = set(other)
+        result = [i for i in result if i in other]
+    return list(result)
+
+
+class RecordIndex(object):
+    """
+    RecordIndex(records, fields, textfields=())
+
+    Filtering indexes of the list 'records', such as workers or submit
+    requests, whose values are read like those of a dict. For each of fields,
+    the positions of the records are grouped by value, and each of textfields
+    has a TrigramIndex of its values. Missing values are None in groups and
+    empty in text searches
+    """
+    def __init__(self, records, fields, textfields=()):
+        self.size = len(records)
+        # field -> value -> list of positions
+        self.groups = {}
+        for field in fields:
+            groups = {}
+            for (i, value) in enumerate(self._values(records, field)):
+                try:
+                    groups[value].append(i)
+                except KeyError:
+                    groups[value] = [i]
+            self.groups[field] = groups
+        self.text = {}
+        for field in textfields:
+            self.text[field] = TrigramIndex([value or '' for value in self._values(records, field)])
+
+    def _values(self, records, field):
+        values = []
+        for record in records:
+            try:
+                values.append(record[field])
+            except KeyError:
+                values.append(None)
+        return values
+
+    def histogram(self, field):
+        """
+        histogram(field) -> dict
+
+        Returns the number of records with each value of field
+        """
+        return dict([(value, len(positions)) for (value, positions) in self.groups[field].iteritems()])
+
+    def matching(self, field, values):
+        """
+        matching(field, values) -> list
+
+        Returns the positions of the records whose field has one of values
+        """
+        groups = self.groups[field]
+        if len(values) == 1:
+            for value in values:
+                return groups.get(value, [])
+        result = []
+        for value in values:
+            result.extend(groups.get(value, ()))
+        result.sort()
+        return result
+
+    def search(self, fields, text):
+        """
+        search(fields, text) -> list
+
+        Returns the positions of the records with a value of any of the text
+        fields containing text, matching case. The trigram indexes narrow the
+        search down to the values containing text in any case
+        """
+        result = set()
+        for field in fields:
+            index = self.text[field]
+            names = index.names
+            result.update([i for i in index.search(text) if text in names[i]])
+        return sorted(result)
@@ -0,0 +1,153 @@
+#
+# logfetch.py - Bulk build log retrieval for Yabsc
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+import re
+from PyQt4 import QtCore
+
+# Lines that usually explain why a build failed
+_errorline = re.compile(r'error|fail|fatal|undefined reference|cannot|no such file|not found|\*\*\*', re.I)
+
+# The lines the build service adds after every failed build
+_epilogue = re.compile(r'^\[\s*\d+s\]\s*$|^System halted|^\S+ failed "build|^RPM build errors')
+
+def summarizeFailure(log, maxlines=5):
+    """
+    summarizeFailure(log, maxlines=5) -> list
+
+    Returns the last maxlines lines of a build log that look like errors. If
+    there are none, the last lines of the log are returned
+    """
+    lines = [line.rstrip() for line in log.rstrip().split('\n')]
+    summary = []
+    for line in reversed(lines):
+        if _errorline.search(line) and not _epilogue.search(line):
+            summary.append(line)
+            if len(summary) == maxlines:
+                break
+    if not summary:
+        summary = lines[-maxlines:]
+        summary.reverse()
+    summary.reverse()
+    return summary
+
+def fetchFailureSummary(bs, project, target, package):
+    """
+    fetchFailureSummary(bs, project, target, package) -> list
+
+    Get the complete build log through the BuildService object bs and
+    return its summarizeFailure()
+    """
+    return summarizeFailure(bs.getCompleteBuildLog(project, target, package))
+
+
+class LogFetcher(QtCore.QObject):
+    """
+    LogFetcher(bs, scheduler, concurrency=3)
+
+    Retrieves the build logs of many package and target pairs through the
+    BuildService object bs, with at most 'concurrency' requests running on
+    scheduler at a time. Logs are added to the log store of bs, and
+    downloads that were interrupted earlier are resumed.
+
+    Emits fetchProgress(done, total) as each log is retrieved, and
+    fetchFinished(project, results) at the end, where results is a list of
+    (package, target, summary, error) tuples. summary is the
+    summarizeFailure() of the log, or None if retrieving it failed with error
+    """
+    def __init__(self, bs, scheduler, concurrency=3):
+        QtCore.QObject.__init__(self)
+        self.bs = bs
+        self.scheduler = scheduler
+        self.concurrency = concurrency
+        self.project = None
+        self.queue = []
+        self.requests = []
+        self.results = []
+        self.total = 0
+
+    def isActive(self):
+        """
+        isActive() -> boolean
+
+        Returns True while logs are being retrieved
+        """
+        return bool(self.queue or self.requests)
+
+    def start(self, project, cells):
+        """
+        start(project, cells)
+
+        Retrieve the logs of project for cells, a list of (package, target)
+        pairs
+        """
+        self.cancel()
+        self.project = project
+        self.queue = list(cells)
+        self.queue.reverse()
+        self.results = []
+        self.total = len(cells)
+        if not cells:
+            self.emit(QtCore.SIGNAL("fetchFinished"), project, [])
+            return
+        self.submitNext()
+
+    def cancel(self):
+        """
+        cancel()
+
+        Stop retrieving logs. Logs being downloaded are kept to be resumed
+        """
+        self.queue = []
+        for request in self.requests:
+            request.cancel()
+        self.requests = []
+
+    def submitNext(self):
+        """
+        submitNext()
+
+        Start requests until 'concurrency' are running
+        """
+        while self.queue and len(self.requests) < self.concurrency:
+            (package, target) = self.queue.pop()
+            request = self.scheduler.submit(fetchFailureSummary, (self.bs, self.project, target, package),
+                                            key=('failuresummary', self.bs.apiurl, self.project, target, package),
+                                            callback=self.logFetched, errback=self.logFetched,
+                                            package=package, target=target)
+            self.requests.append(request)
+
+    def logFetched(self, request):
+        """
+        logFetched(request)
+
+        Record the result of one log request and start the next
+        """
+        if request not in self.requests:
+            return
+        self.requests.remove(request)
+        if request.error is None:
+            self.results.append((request.params['package'], request.params['target'], request.result, None))
+        else:
+            self.results.append((request.params['package'], request.params['target'], None, request.error))
+        self.emit(QtCore.SIGNAL("fetchProgress"), len(self.results), self.total)
+        self.submitNext()
+        if not self.isActive():
+            self.results.sort()
+            self.emit(QtCore.SIGNAL("fetchFinished"), self.project, self.results)
@@ -0,0 +1,479 @@
+#
+# logstore.py - Persistent searchable build log store for Yabsc
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+import glob
+import hashlib
+import marshal
+import os
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+
+from cache import defaultCacheDir
+from index import trigrams
+
+# Bump whenever the layout of the index or the log files changes
+INDEX_VERSION = 1
+
+# Seconds between index saves while logs are being added
+SAVE_INTERVAL = 10
+
+# Bytes of a log lowercased and split into trigrams at a time
+TRIGRAM_CHUNK = 64*1024
+
+# The journal is merged into the index once it is larger than this share of
+# the index, or than JOURNAL_MINSIZE bytes if that is more
+JOURNAL_RATIO = 0.5
+JOURNAL_MINSIZE = 256*1024
+
+def logTrigrams(data):
+    """
+    logTrigrams(data) -> set
+
+    Returns the set of the lower case trigrams of the log text data. The text
+    is processed TRIGRAM_CHUNK bytes at a time, so that no more than that is
+    copied at once however large the log is
+    """
+    grams = set()
+    for start in xrange(0, len(data), TRIGRAM_CHUNK):
+        # Overlap the chunks so the trigrams spanning them are included
+        grams.update(trigrams(data[start:start + TRIGRAM_CHUNK + 2].lower()))
+    return grams
+
+
+class LogStore(object):
+    """
+    LogStore(path=None, maxsize=256*1024*1024)
+
+    A persistent store of build logs under 'path' (by default the logs
+    directory of the yabsc cache), with a trigram index for full text
+    search. Logs are keyed by API URL, project, target, package and a build
+    id that changes with every build. Once the compressed logs take more than
+    'maxsize' bytes, the least recently used ones are removed.
+
+    Changes to the index are appended to a journal, which is replayed over
+    the index when it is read, and merged into it once it has grown large
+    """
+    def __init__(self, path=None, maxsize=256*1024*1024):
+        if path is None:
+            path = os.path.join(defaultCacheDir(), 'logs')
+        self.path = path
+        self.maxsize = maxsize
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.saved = 0
+        self.nextid = 0
+        # docid -> [key, size, atime], key is (apiurl, project, target, package, buildid)
+        self.docs = {}
+        self.keys = {}
+        # trigram -> set of docids
+        self.postings = {}
+        # docid -> trigrams of the log
+        self.grams = {}
+        # Changes not written to the journal yet, and the sizes of the index
+        # and journal files
+        self.changes = []
+        self.indexsize = 0
+        self.journalsize = 0
+
+    def _indexFilename(self):
+        return os.path.join(self.path, 'index')
+
+    def _journalFilename(self):
+        return os.path.join(self.path, 'journal')
+
+    def _filename(self, docid):
+        return os.path.join(self.path, '%08x.log' % docid)
+
+    def _load(self):
+        """
+        _load()
+
+        Read the index and replay the journal on first use. Log files that
+        are not in the index are removed. The lock must be held
+        """
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            f = open(self._indexFilename(), 'rb')
+            try:
+                (version, nextid, docs, postings) = marshal.load(f)
+                self.indexsize = f.tell()
+            finally:
+                f.close()
+            if version != INDEX_VERSION:
+                # Neither can the journal of another version be replayed
+                self._unlink(self._journalFilename())
+                raise ValueError('log index version mismatch')
+        except (IOError, EOFError, ValueError, TypeError):
+            (nextid, docs, postings) = (0, {}, {})
+        self.nextid = nextid
+        self.docs = dict([(docid, list(doc)) for (docid, doc) in docs.iteritems()])
+        self.keys = dict([(doc[0], docid) for (docid, doc) in self.docs.iteritems()])
+        self.postings = dict([(gram, set(array('I', docids))) for (gram, docids) in postings.iteritems()])
+        self.grams = dict([(docid, []) for docid in self.docs])
+        for (gram, docids) in self.postings.iteritems():
+            for docid in docids:
+                self.grams[docid].append(gram)
+        self._replay()
+        try:
+            filenames = os.listdir(self.path)
+        except OSError:
+            return
+        known = set([os.path.basename(self._filename(docid)) for docid in self.docs])
+        for filename in filenames:
+            if filename.endswith('.log') and filename not in known:
+                self._unlink(os.path.join(self.path, filename))
+
+    def _replay(self):
+        """
+        _replay()
+
+        Apply the changes in the journal to the index. A journal that ends in
+        an incomplete change is merged into the index on the next save. The
+        lock must be held
+        """
+        try:
+            f = open(self._journalFilename(), 'rb')
+        except IOError:
+            return
+        try:
+            end = os.fstat(f.fileno()).st_size
+            while f.tell() < end:
+                try:
+                    change = marshal.load(f)
+                except (EOFError, ValueError, TypeError):
+                    self.journalsize = None
+                    return
+                if change[0] == 'put':
+                    (op, docid, key, size, atime, grams) = change
+                    self._add(docid, key, size, atime, grams)
+                elif change[0] == 'remove':
+                    if change[1] in self.docs:
+                        self._drop(change[1])
+                elif change[0] == 'touch':
+                    if change[1] in self.docs:
+                        self.docs[change[1]][2] = change[2]
+            self.journalsize = f.tell()
+        finally:
+            f.close()
+
+    def _write(self, filename, data, append=False):
+        """
+        _write(filename, data, append=False)
+
+        Append data to a file of the store, or replace the file with data
+        atomically
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        if append:
+            f = open(filename, 'ab')
+        else:
+            (fd, tmpname) = tempfile.mkstemp(prefix='.tmp', dir=self.path)
+            f = os.fdopen(fd, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        if not append:
+            os.rename(tmpname, filename)
+
+    def save(self):
+        """
+        save()
+
+        Append the changes to the index to the journal, or write the whole
+        index once the journal has grown large. Errors writing the index are
+        ignored
+        """
+        self.lock.acquire()
+        try:
+            if not self.changes:
+                return
+            try:
+                if self.journalsize is not None and \
+                   self.journalsize < max(JOURNAL_MINSIZE, self.indexsize * JOURNAL_RATIO):
+                    data = ''.join([marshal.dumps(change) for change in self.changes])
+                    self._write(self._journalFilename(), data, append=True)
+                    self.journalsize += len(data)
+                else:
+                    postings = dict([(gram, array('I', docids).tostring()) for (gram, docids) in self.postings.iteritems()])
+                    docs = dict([(docid, tuple(doc)) for (docid, doc) in self.docs.iteritems()])
+                    data = marshal.dumps((INDEX_VERSION, self.nextid, docs, postings))
+                    self._write(self._indexFilename(), data)
+                    self._unlink(self._journalFilename())
+                    self.indexsize = len(data)
+                    self.journalsize = 0
+            except (IOError, OSError):
+                return
+            self.changes = []
+            self.saved = time.time()
+        finally:
+            self.lock.release()
+
+    def _unlink(self, filename):
+        try:
+            os.unlink(filename)
+        except OSError:
+            pass
+
+    def _read(self, docid):
+        """
+        _read(docid) -> str
+
+        Returns the text of a log, or None if it can not be read
+        """
+        try:
+            f = open(self._filename(docid), 'rb')
+            try:
+                return zlib.decompress(f.read())
+            finally:
+                f.close()
+        except (IOError, zlib.error):
+            return None
+
+    def get(self, apiurl, project, target, package, buildid):
+        """
+        get(apiurl, project, target, package, buildid) -> str
+
+        Returns the stored log, or None if it is not in the store
+        """
+        self.lock.acquire()
+        try:
+            self._load()
+            docid = self.keys.get((apiurl, project, target, package, buildid))
+            if docid is None:
+                return None
+            self.docs[docid][2] = time.time()
+            self.changes.append(('touch', docid, self.docs[docid][2]))
+        finally:
+            self.lock.release()
+        data = self._read(docid)
+        if data is None:
+            self.remove(apiurl, project, target, package, buildid)
+        return data
+
+    def put(self, apiurl, project, target, package, buildid, data):
+        """
+        put(apiurl, project, target, package, buildid, data)
+
+        Store and index a complete log. Logs of earlier builds of the same
+        package and target are replaced
+        """
+        grams = tuple(logTrigrams(data))
+        compressed = zlib.compress(data, 6)
+        self.lock.acquire()
+        try:
+            self._load()
+            for key in [k for k in self.keys if k[:4] == (apiurl, project, target, package)]:
+                self._remove(self.keys[key])
+            docid = self.nextid
+            self.nextid += 1
+            try:
+                if not os.path.isdir(self.path):
+                    os.makedirs(self.path)
+                f = open(self._filename(docid), 'wb')
+                try:
+                    f.write(compressed)
+                finally:
+                    f.close()
+            except (IOError, OSError):
+                return
+            key = (apiurl, project, target, package, buildid)
+            atime = time.time()
+            self._add(docid, key, len(compressed), atime, grams)
+            self.changes.append(('put', docid, key, len(compressed), atime, grams))
+            self.evict()
+            if time.time() - self.saved > SAVE_INTERVAL:
+                self.save()
+        finally:
+            self.lock.release()
+
+    def _partialFilename(self, apiurl, project, target, package, buildid):
+        name = hashlib.sha1(repr((apiurl, project, target, package))).hexdigest()[:16]
+        return os.path.join(self.path, 'partial', '%s-%s' % (name, buildid))
+
+    def openPartial(self, apiurl, project, target, package, buildid):
+        """
+        openPartial(apiurl, project, target, package, buildid) -> file
+
+        Open the file holding a partial download of a log for appending, and
+        return it positioned at its end. Partial downloads of earlier builds
+        are removed
+        """
+        filename = self._partialFilename(apiurl, project, target, package, buildid)
+        directory = os.path.dirname(filename)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for other in glob.glob(filename.rsplit('-', 1)[0] + '-*'):
+            if other != filename:
+                self._unlink(other)
+        f = open(filename, 'ab+')
+        f.seek(0, os.SEEK_END)
+        return f
+
+    def removePartial(self, apiurl, project, target, package, buildid):
+        """
+        removePartial(apiurl, project, target, package, buildid)
+
+        Remove the partial download of a log
+        """
+        self._unlink(self._partialFilename(apiurl, project, target, package, buildid))
+
+    def remove(self, apiurl, project, target, package, buildid):
+        """
+        remove(apiurl, project, target, package, buildid)
+
+        Remove a log from the store
+        """
+        self.lock.acquire()
+        try:
+            self._load()
+            docid = self.keys.get((apiurl, project, target, package, buildid))
+            if docid is not None:
+                self._remove(docid)
+        finally:
+            self.lock.release()
+
+    def _add(self, docid, key, size, atime, grams):
+        """
+        _add(docid, key, size, atime, grams)
+
+        Add a log to the index. The lock must be held
+        """
+        self.nextid = max(self.nextid, docid + 1)
+        self.docs[docid] = [key, size, atime]
+        self.keys[key] = docid
+        self.grams[docid] = grams
+        postings = self.postings
+        for gram in grams:
+            try:
+                postings[gram].add(docid)
+            except KeyError:
+                postings[gram] = set([docid])
+
+    def _drop(self, docid):
+        """
+        _drop(docid)
+
+        Remove a log from the index, touching only the postings of its own
+        trigrams. The lock must be held
+        """
+        doc = self.docs.pop(docid)
+        del self.keys[doc[0]]
+        postings = self.postings
+        for gram in self.grams.pop(docid, ()):
+            docids = postings.get(gram)
+            if docids is not None:
+                docids.discard(docid)
+                if not docids:
+                    del postings[gram]
+
+    def _remove(self, docid):
+        """
+        _remove(docid)
+
+        Remove a log and its index entries. The lock must be held
+        """
+        self._drop(docid)
+        self._unlink(self._filename(docid))
+        self.changes.append(('remove', docid))
+
+    def evict(self):
+        """
+        evict()
+
+        Remove the least recently used logs until the store is no larger than
+        maxsize
+        """
+        self.lock.acquire()
+        try:
+            self._load()
+            total = sum([doc[1] for doc in self.docs.itervalues()])
+            if total <= self.maxsize:
+                return
+            for (atime, docid) in sorted([(doc[2], docid) for (docid, doc) in self.docs.iteritems()]):
+                if total <= self.maxsize:
+                    break
+                total -= self.docs[docid][1]
+                self._remove(docid)
+        finally:
+            self.lock.release()
+
+    def logs(self, apiurl, project):
+        """
+        logs(apiurl, project) -> list
+
+        Returns the (target, package, buildid) keys of the stored logs of
+        project
+        """
+        self.lock.acquire()
+        try:
+            self._load()
+            return [key[2:] for key in self.keys if key[:2] == (apiurl, project)]
+        finally:
+            self.lock.release()
+
+    def search(self, apiurl, project, text, maxlines=20):
+        """
+        search(apiurl, project, text, maxlines=20) -> list
+
+        Search the stored logs of project for lines containing text, ignoring
+        case. Returns a list of (target, package, buildid, lines) tuples, where
+        lines is a list of up to maxlines (line number, line) pairs, counting
+        from 1
+        """
+        needle = text.lower()
+        self.lock.acquire()
+        try:
+            self._load()
+            candidates = set([docid for (key, docid) in self.keys.iteritems() if key[:2] == (apiurl, project)])
+            if len(needle) >= 3:
+                postings = self.postings
+                for gram in sorted(trigrams(needle), key=lambda g: len(postings.get(g, ()))):
+                    candidates &= postings.get(gram, set())
+                    if not candidates:
+                        break
+            candidates = [(docid, self.docs[docid][0]) for docid in candidates]
+        finally:
+            self.lock.release()
+
+        results = []
+        for (docid, key) in sorted(candidates, key=lambda c: c[1]):
+            data = self._read(docid)
+            if data is None:
+                continue
+            lines = []
+            lower = data.lower()
+            pos = lower.find(needle)
+            while pos >= 0 and len(lines) < maxlines:
+                start = data.rfind('\n', 0, pos) + 1
+                end = data.find('\n', pos)
+                if end < 0:
+                    end = len(data)
+                lines.append((data.count('\n', 0, start) + 1, data[start:end]))
+                pos = lower.find(needle, end)
+            if lines:
+                results.append((key[2], key[3], key[4], lines))
+        return results
@@ -0,0 +1,254 @@
+#
+# logstream.py - Live build log polling for Yabsc
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+import time
+from PyQt4 import QtCore
+
+from scheduler import PRIORITY_INTERACTIVE
+
+# Poll intervals in milliseconds
+MIN_INTERVAL = 250
+BASE_INTERVAL = 1000
+MAX_INTERVAL = 30000
+
+# A chunk at least this large means the log is growing fast
+LARGE_CHUNK = 16384
+
+def pollLog(bs, project, target, package, offset, checkstatus):
+    """
+    pollLog(bs, project, target, package, offset, checkstatus) -> tuple
+
+    Get the build log text after offset through the BuildService object bs.
+    Returns a (chunk, status) tuple. If checkstatus is True and there is no
+    new text, status is the status of the package for target; otherwise it
+    is None
+    """
+    chunk = bs.getBuildLog(project, target, package, offset)
+    status = None
+    if checkstatus and not chunk:
+        status = bs.getPackageStatus(project, package).get(target, '')
+    return (chunk, status)
+
+def fetchLog(bs, project, target, package):
+    """
+    fetchLog(bs, project, target, package) -> tuple
+
+    Get the complete log of a finished build through the BuildService object
+    bs, from its log store if possible. Returns a (log, None) tuple, like
+    pollLog()
+    """
+    return (bs.getCompleteBuildLog(project, target, package), None)
+
+def storeLog(bs, project, target, package, buffer):
+    """
+    storeLog(bs, project, target, package, buffer)
+
+    Store the complete log of a finished build, held in the LogBuffer
+    buffer, through the BuildService object bs
+    """
+    bs.storeBuildLog(project, target, package, buffer.text())
+
+
+class LogPoller(QtCore.QObject):
+    """
+    LogPoller(bs, scheduler, group)
+
+    Follows the build log of a package through the BuildService object bs,
+    with requests run by scheduler in 'group'. The poll interval shrinks
+    while large chunks arrive and doubles while the log is idle. Polling
+    stops once the package status shows the build has ended.
+
+    Emits logReceived(chunk) for new log text and logFinished() when the
+    whole log has been received. If the request for a log whose build has
+    ended fails, polling stops and logFailed(error) is emitted instead.
+    'streamed' is True if the log was followed while the package was
+    building
+    """
+    def __init__(self, bs, scheduler, group):
+        QtCore.QObject.__init__(self)
+        self.bs = bs
+        self.scheduler = scheduler
+        self.group = group
+        self.timer = QtCore.QTimer()
+        self.timer.setSingleShot(True)
+        QtCore.QObject.connect(self.timer, QtCore.SIGNAL("timeout()"), self.poll)
+        self.project = None
+        self.target = None
+        self.package = None
+        self.live = False
+        self.streamed = False
+        self.active = False
+        self.paused = False
+        self.waiting = False
+        self.resetStats()
+
+    def resetStats(self):
+        """
+        resetStats()
+
+        Reset the throughput metrics
+        """
+        self.offset = 0
+        self.interval = BASE_INTERVAL
+        self.requests = 0
+        self.emptypolls = 0
+        self.started = time.time()
+        self.lastchunk = None
+
+    def stats(self):
+        """
+        stats() -> dict
+
+        Returns throughput metrics for the current log: the bytes received,
+        the number of requests and of those that returned no text, the
+        average rate in bytes per second, the current poll interval in
+        milliseconds and the seconds since text last arrived
+        """
+        elapsed = time.time() - self.started
+        if self.lastchunk is None:
+            idle = elapsed
+        else:
+            idle = time.time() - self.lastchunk
+        return {'bytes': self.offset,
+                'requests': self.requests,
+                'emptypolls': self.emptypolls,
+                'rate': self.offset / max(elapsed, 0.001),
+                'interval': self.interval,
+                'idle': idle}
+
+    def start(self, project, target, package, live=True):
+        """
+        start(project, target, package, live=True)
+
+        Start following the log of package in project for target. If live is
+        False, the log is retrieved once, as the build is not running
+        """
+        self.stop()
+        self.project = project
+        self.target = target
+        self.package = package
+        self.live = live
+        self.streamed = live
+        self.active = True
+        self.resetStats()
+        self.poll()
+
+    def stop(self):
+        """
+        stop()
+
+        Stop following the log
+        """
+        self.active = False
+        self.waiting = False
+        self.timer.stop()
+        self.scheduler.cancelGroup(self.group)
+
+    def pause(self):
+        """
+        pause()
+
+        Stop polling until resume() is called
+        """
+        self.paused = True
+        self.timer.stop()
+
+    def resume(self):
+        """
+        resume()
+
+        Continue polling after pause()
+        """
+        self.paused = False
+        if self.active and not self.waiting:
+            self.poll()
+
+    def poll(self):
+        """
+        poll()
+
+        Request the log text after the current offset
+        """
+        if not self.active or self.paused:
+            return
+        self.waiting = True
+        self.requests += 1
+        if self.streamed:
+            (func, args) = (pollLog, (self.bs, self.project, self.target, self.package,
+                                      self.offset, self.live))
+        else:
+            (func, args) = (fetchLog, (self.bs, self.project, self.target, self.package))
+        self.scheduler.submit(func, args, group=self.group, priority=PRIORITY_INTERACTIVE,
+                              callback=self.logPolled, errback=self.pollFailed)
+
+    def pollFailed(self, request):
+        """
+        pollFailed(request)
+
+        Back off after a failed request while the build is running, or give
+        up on a log whose build has ended
+        """
+        self.waiting = False
+        if not self.live:
+            self.active = False
+            self.emit(QtCore.SIGNAL("logFailed"), request.error)
+            return
+        self.interval = min(self.interval * 2, MAX_INTERVAL)
+        self.schedule()
+
+    def logPolled(self, request):
+        """
+        logPolled(request)
+
+        Handle the result of a log request and schedule the next one
+        """
+        self.waiting = False
+        (chunk, status) = request.result
+        if chunk:
+            self.offset += len(chunk)
+            self.lastchunk = time.time()
+            self.emit(QtCore.SIGNAL("logReceived"), chunk)
+
+        if not self.live:
+            self.active = False
+            self.emit(QtCore.SIGNAL("logFinished()"))
+            return
+
+        if len(chunk) >= LARGE_CHUNK:
+            self.interval = max(self.interval / 2, MIN_INTERVAL)
+        elif chunk:
+            self.interval = BASE_INTERVAL
+        else:
+            self.emptypolls += 1
+            self.interval = min(self.interval * 2, MAX_INTERVAL)
+            if status is not None and not status.startswith('building'):
+                # Get any text written between the log and status requests
+                self.live = False
+                self.interval = 0
+        self.schedule()
+
+    def schedule(self):
+        """
+        schedule()
+
+        Poll again after the current interval
+        """
+        if self.active and not self.paused:
+            self.timer.start(self.interval)
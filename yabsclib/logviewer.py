@@ -0,0 +1,429 @@
+#
+# logviewer.py - Build log viewer for Yabsc
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+import collections
+import mmap
+import os
+import tempfile
+from array import array
+from PyQt4 import QtGui, QtCore
+
+# Milliseconds between repaints while log data is arriving
+FRAME_INTERVAL = 40
+
+class LogBuffer(object):
+    """
+    LogBuffer(maxlines=5000)
+
+    Line-indexed storage for a build log of any size. The last 'maxlines'
+    lines are held in memory. Every line is also written to a temporary
+    file, from which older lines are read back through mmap when they are
+    needed. Text after the last newline is kept as a partial last line
+    """
+    def __init__(self, maxlines=5000):
+        self.maxlines = maxlines
+        self.recent = collections.deque()
+        self.offsets = array('L')
+        self.partial = ''
+        self.file = None
+        self.size = 0
+        self.map = None
+        self.longest = 0
+
+    def __len__(self):
+        if self.partial:
+            return len(self.offsets) + 1
+        return len(self.offsets)
+
+    def clear(self):
+        """
+        clear()
+
+        Remove all lines and the temporary file
+        """
+        self.recent.clear()
+        self.offsets = array('L')
+        self.partial = ''
+        self.longest = 0
+        self._closeMap()
+        if self.file:
+            self.file.close()
+            self.file = None
+        self.size = 0
+
+    def append(self, data):
+        """
+        append(data) -> int
+
+        Append log text and return the number of complete lines added
+        """
+        if not data:
+            return 0
+        lines = (self.partial + data).split('\n')
+        self.partial = lines.pop()
+        if not lines:
+            self.longest = max(self.longest, len(self.partial))
+            return 0
+
+        if self.file is None:
+            self.file = tempfile.TemporaryFile(prefix='yabsc-log.')
+        self.file.seek(0, os.SEEK_END)
+        offset = self.size
+        offsets = self.offsets
+        recent = self.recent
+        for line in lines:
+            offsets.append(offset)
+            offset += len(line) + 1
+            recent.append(line)
+            if len(line) > self.longest:
+                self.longest = len(line)
+        self.file.write('\n'.join(lines) + '\n')
+        self.size = offset
+        while len(recent) > self.maxlines:
+            recent.popleft()
+        self.longest = max(self.longest, len(self.partial))
+        return len(lines)
+
+    def text(self):
+        """
+        text() -> str
+
+        Returns the whole log
+        """
+        if self.file is None:
+            return self.partial
+        self.file.flush()
+        self.file.seek(0)
+        return self.file.read(self.size) + self.partial
+
+    def _closeMap(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def _spilled(self, n):
+        """
+        _spilled(n) -> str
+
+        Read line n, which is no longer held in memory, from the temporary file
+        """
+        if self.map is None or len(self.map) < self.offsets[n + 1]:
+            self._closeMap()
+            self.file.flush()
+            self.map = mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ)
+        return self.map[self.offsets[n]:self.offsets[n + 1] - 1]
+
+    def line(self, n):
+        """
+        line(n) -> str
+
+        Returns line n, counting from 0
+        """
+        complete = len(self.offsets)
+        if n == complete and self.partial:
+            return self.partial
+        if n < 0 or n >= complete:
+            raise IndexError('line %d out of range' % n)
+        first = complete - len(self.recent)
+        if n >= first:
+            return self.recent[n - first]
+        return self._spilled(n)
+
+    def lines(self, start, count):
+        """
+        lines(start, count) -> list
+
+        Returns up to 'count' lines starting at line 'start'
+        """
+        end = min(start + count, len(self))
+        return [self.line(n) for n in xrange(max(start, 0), end)]
+
+
+class LogView(QtGui.QAbstractScrollArea):
+    """
+    LogView(parent=None)
+
+    Read-only view of a build log held in a LogBuffer. Only the visible lines
+    are rendered, and text appended while the log streams in is added to the
+    buffer and painted at most once per frame. Text is selected with the
+    mouse and copied with the usual shortcut or the context menu
+    """
+    def __init__(self, parent=None):
+        QtGui.QAbstractScrollArea.__init__(self, parent)
+        self.buffer = LogBuffer()
+        self.pending = []
+        self.autoscroll = True
+        # Selection ends as (line, column), in the order they were set
+        self.anchor = None
+        self.cursor = None
+        self.viewport().setFont(QtGui.QFont("Bitstream Vera Sans Mono", 7))
+        self.viewport().setCursor(QtCore.Qt.IBeamCursor)
+        self.setFocusPolicy(QtCore.Qt.StrongFocus)
+        self.frametimer = QtCore.QTimer()
+        self.frametimer.setSingleShot(True)
+        QtCore.QObject.connect(self.frametimer, QtCore.SIGNAL("timeout()"), self.flush)
+
+        copyaction = QtGui.QAction("&Copy", self)
+        copyaction.setShortcut(QtGui.QKeySequence.Copy)
+        copyaction.setShortcutContext(QtCore.Qt.WidgetShortcut)
+        QtCore.QObject.connect(copyaction, QtCore.SIGNAL("triggered()"), self.copy)
+        self.addAction(copyaction)
+        selectallaction = QtGui.QAction("Select &All", self)
+        selectallaction.setShortcut(QtGui.QKeySequence.SelectAll)
+        selectallaction.setShortcutContext(QtCore.Qt.WidgetShortcut)
+        QtCore.QObject.connect(selectallaction, QtCore.SIGNAL("triggered()"), self.selectAll)
+        self.addAction(selectallaction)
+        self.setContextMenuPolicy(QtCore.Qt.ActionsContextMenu)
+
+    def setAutoScroll(self, autoscroll):
+        """
+        setAutoScroll(autoscroll)
+
+        If autoscroll is True, the view follows the end of the log as text is
+        appended, as long as it is scrolled to the end
+        """
+        self.autoscroll = autoscroll
+
+    def scrollToEnd(self):
+        """
+        scrollToEnd()
+
+        Show the end of the log, including text not shown yet
+        """
+        self.flush()
+        scrollbar = self.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
+
+    def clear(self):
+        """
+        clear()
+
+        Remove all text
+        """
+        self.frametimer.stop()
+        self.pending = []
+        self.anchor = None
+        self.cursor = None
+        # A new buffer leaves the old one intact for requests still reading it
+        self.buffer = LogBuffer()
+        self.updateScrollBars()
+        self.verticalScrollBar().setValue(0)
+        self.horizontalScrollBar().setValue(0)
+        self.viewport().update()
+
+    def setPlainText(self, text):
+        """
+        setPlainText(text)
+
+        Replace the log with text
+        """
+        self.clear()
+        self.appendText(text)
+
+    def appendText(self, text):
+        """
+        appendText(text)
+
+        Append text to the log. The view is updated on the next frame
+        """
+        if not text:
+            return
+        self.pending.append(text)
+        if not self.frametimer.isActive():
+            self.frametimer.start(FRAME_INTERVAL)
+
+    def flush(self):
+        """
+        flush()
+
+        Add pending text to the buffer and repaint
+        """
+        if not self.pending:
+            return
+        data = ''.join(self.pending)
+        self.pending = []
+        scrollbar = self.verticalScrollBar()
+        atend = scrollbar.value() >= scrollbar.maximum()
+        self.buffer.append(data)
+        self.updateScrollBars()
+        if self.autoscroll and atend:
+            scrollbar.setValue(scrollbar.maximum())
+        self.viewport().update()
+
+    def logBuffer(self):
+        """
+        logBuffer() -> LogBuffer
+
+        Returns the LogBuffer holding the whole log, including text not shown
+        yet. It is no longer changed once the view is cleared, so a log that
+        is complete can be read from it in the background
+        """
+        self.flush()
+        return self.buffer
+
+    def selection(self):
+        """
+        selection() -> tuple
+
+        Returns the (start, end) positions of the selected text, each a
+        (line, column) tuple, or None if nothing is selected
+        """
+        if self.anchor is None or self.cursor is None or self.anchor == self.cursor:
+            return None
+        return (min(self.anchor, self.cursor), max(self.anchor, self.cursor))
+
+    def selectedText(self):
+        """
+        selectedText() -> unicode
+
+        Returns the selected text
+        """
+        selection = self.selection()
+        if selection is None:
+            return u''
+        ((startline, startcolumn), (endline, endcolumn)) = selection
+        lines = [line.decode('utf-8', 'replace') for line in self.buffer.lines(startline, endline - startline + 1)]
+        if len(lines) == 1:
+            return lines[0][startcolumn:endcolumn]
+        lines[0] = lines[0][startcolumn:]
+        lines[-1] = lines[-1][:endcolumn]
+        return u'\n'.join(lines)
+
+    def copy(self):
+        """
+        copy()
+
+        Copy the selected text to the clipboard
+        """
+        text = self.selectedText()
+        if text:
+            QtGui.QApplication.clipboard().setText(text)
+
+    def selectAll(self):
+        """
+        selectAll()
+
+        Select the whole log
+        """
+        self.flush()
+        if not len(self.buffer):
+            return
+        last = len(self.buffer) - 1
+        self.anchor = (0, 0)
+        self.cursor = (last, len(self.buffer.line(last).decode('utf-8', 'replace')))
+        self.viewport().update()
+
+    def positionAt(self, point):
+        """
+        positionAt(point) -> tuple
+
+        Returns the (line, column) of the character boundary nearest to the
+        viewport position point, or None if the log is empty
+        """
+        if not len(self.buffer):
+            return None
+        metrics = self.viewport().fontMetrics()
+        charwidth = metrics.width('M')
+        line = self.verticalScrollBar().value() + point.y() / metrics.lineSpacing()
+        line = max(0, min(line, len(self.buffer) - 1))
+        column = (point.x() + self.horizontalScrollBar().value() + charwidth / 2) / charwidth
+        return (line, max(0, column))
+
+    def mousePressEvent(self, event):
+        if event.button() == QtCore.Qt.LeftButton:
+            self.anchor = self.cursor = self.positionAt(event.pos())
+            self.viewport().update()
+        QtGui.QAbstractScrollArea.mousePressEvent(self, event)
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() & QtCore.Qt.LeftButton and self.anchor is not None:
+            # Scroll while dragging past the top or bottom
+            scrollbar = self.verticalScrollBar()
+            if event.pos().y() < 0:
+                scrollbar.setValue(scrollbar.value() - 1)
+            elif event.pos().y() > self.viewport().height():
+                scrollbar.setValue(scrollbar.value() + 1)
+            self.cursor = self.positionAt(event.pos())
+            self.viewport().update()
+        QtGui.QAbstractScrollArea.mouseMoveEvent(self, event)
+
+    def visibleLines(self):
+        """
+        visibleLines() -> int
+
+        Returns the number of lines that fit in the viewport
+        """
+        return max(1, self.viewport().height() / self.viewport().fontMetrics().lineSpacing())
+
+    def updateScrollBars(self):
+        """
+        updateScrollBars()
+
+        Update the scroll bar ranges to the size of the log
+        """
+        page = self.visibleLines()
+        vertical = self.verticalScrollBar()
+        vertical.setRange(0, max(0, len(self.buffer) - page))
+        vertical.setPageStep(page)
+        metrics = self.viewport().fontMetrics()
+        width = self.buffer.longest * metrics.width('M')
+        horizontal = self.horizontalScrollBar()
+        horizontal.setRange(0, max(0, width - self.viewport().width()))
+        horizontal.setPageStep(self.viewport().width())
+
+    def resizeEvent(self, event):
+        self.updateScrollBars()
+        QtGui.QAbstractScrollArea.resizeEvent(self, event)
+
+    def scrollContentsBy(self, dx, dy):
+        self.viewport().update()
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self.viewport())
+        metrics = self.viewport().fontMetrics()
+        spacing = metrics.lineSpacing()
+        charwidth = metrics.width('M')
+        palette = self.palette()
+        selection = self.selection()
+        first = self.verticalScrollBar().value() + event.rect().top() / spacing
+        count = event.rect().height() / spacing + 2
+        x = -self.horizontalScrollBar().value()
+        y = (first - self.verticalScrollBar().value()) * spacing + metrics.ascent()
+        for (n, line) in enumerate(self.buffer.lines(first, count)):
+            text = line.decode('utf-8', 'replace')
+            painter.setPen(palette.color(QtGui.QPalette.Text))
+            painter.drawText(x, y, text)
+            if selection is not None and selection[0][0] <= first + n <= selection[1][0]:
+                # Selected text is drawn again over the highlight, which
+                # includes the line break of lines selected past their end
+                start = 0
+                if first + n == selection[0][0]:
+                    start = selection[0][1]
+                if first + n == selection[1][0]:
+                    end = selection[1][1]
+                else:
+                    end = len(text) + 1
+                if end > start:
+                    painter.fillRect(x + start * charwidth, y - metrics.ascent(), (end - start) * charwidth, spacing,
+                                     palette.brush(QtGui.QPalette.Highlight))
+                    painter.setPen(palette.color(QtGui.QPalette.HighlightedText))
+                    painter.drawText(x + start * charwidth, y, text[start:end])
+            y += spacing
+        painter.end()
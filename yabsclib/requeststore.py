@@ -0,0 +1,188 @@
+#
+# requeststore.py - Persistent submit request store for Yabsc
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+import bisect
+import hashlib
+import marshal
+import os
+import tempfile
+import threading
+
+from cache import defaultCacheDir
+
+# Bump whenever the layout of the store files changes
+STORE_VERSION = 1
+
+
+class RequestList(object):
+    """
+    RequestList(lastid=0, lastchange='', requests=())
+
+    The submit requests of one API server as a list of dicts sorted by id,
+    with the highest request id and the latest state change time seen, from
+    which the next synchronization continues
+    """
+    def __init__(self, lastid=0, lastchange='', requests=()):
+        self.lastid = lastid
+        self.lastchange = lastchange
+        self.requests = list(requests)
+        self.ids = [request['id'] for request in self.requests]
+
+    def update(self, requests):
+        """
+        update(requests) -> boolean
+
+        Add new requests and replace changed ones. requests is a list of
+        (request, when) pairs, where when is the time of the last state change
+        of the request dict as text. Returns True if the list changed
+        """
+        changed = False
+        new = {}
+        for (request, when) in requests:
+            requestid = request['id']
+            self.lastid = max(self.lastid, requestid)
+            self.lastchange = max(self.lastchange, when)
+            i = bisect.bisect_left(self.ids, requestid)
+            if i < len(self.ids) and self.ids[i] == requestid:
+                if self.requests[i] != request:
+                    self.requests[i] = request
+                    changed = True
+            else:
+                new[requestid] = request
+        if new:
+            self.requests.extend(new.itervalues())
+            self.requests.sort(key=lambda request: request['id'])
+            self.ids = [request['id'] for request in self.requests]
+            changed = True
+        return changed
+
+
+class RequestStore(object):
+    """
+    RequestStore(path=None)
+
+    A persistent store of the submit requests of each API server under
+    'path', by default the requests directory of the yabsc cache, beside the
+    entries directory of the DiskCache so its eviction does not reach it.
+    The requests and the position synchronization continues from are saved
+    together in one file per server. If that file is missing or unreadable,
+    the store is empty and the next synchronization is a full one. See
+    BuildService.getSubmitRequests() for how it is kept up to date
+    """
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(defaultCacheDir(), 'requests')
+        self.path = path
+        self.lock = threading.Lock()
+        self.lists = {}
+
+    def _filename(self, apiurl):
+        return os.path.join(self.path, hashlib.sha1(apiurl).hexdigest()[:16])
+
+    def _list(self, apiurl):
+        """
+        _list(apiurl) -> RequestList
+
+        Returns the requests of apiurl, reading them on first use. Requests
+        that have been saved are dropped if their file has since been
+        removed, so the next synchronization starts over. The lock must be
+        held
+        """
+        requestlist = self.lists.get(apiurl)
+        if requestlist is not None:
+            if not requestlist.lastid or os.path.exists(self._filename(apiurl)):
+                return requestlist
+        try:
+            f = open(self._filename(apiurl), 'rb')
+            try:
+                (version, lastid, lastchange, requests) = marshal.load(f)
+            finally:
+                f.close()
+            if version != STORE_VERSION:
+                raise ValueError('request store version mismatch')
+            requestlist = RequestList(lastid, lastchange, requests)
+        except (IOError, EOFError, ValueError, TypeError):
+            requestlist = RequestList()
+        self.lists[apiurl] = requestlist
+        return requestlist
+
+    def position(self, apiurl):
+        """
+        position(apiurl) -> tuple
+
+        Returns the (lastid, lastchange) of apiurl. See RequestList
+        """
+        self.lock.acquire()
+        try:
+            requestlist = self._list(apiurl)
+            return (requestlist.lastid, requestlist.lastchange)
+        finally:
+            self.lock.release()
+
+    def requests(self, apiurl):
+        """
+        requests(apiurl) -> list of dicts
+
+        Returns the stored requests of apiurl, sorted by id
+        """
+        self.lock.acquire()
+        try:
+            return list(self._list(apiurl).requests)
+        finally:
+            self.lock.release()
+
+    def update(self, apiurl, requests):
+        """
+        update(apiurl, requests) -> boolean
+
+        Merge requests into the store of apiurl and save it. See
+        RequestList.update()
+        """
+        self.lock.acquire()
+        try:
+            requestlist = self._list(apiurl)
+            position = (requestlist.lastid, requestlist.lastchange)
+            changed = requestlist.update(requests)
+            if changed or position != (requestlist.lastid, requestlist.lastchange):
+                self._save(apiurl, requestlist)
+            return changed
+        finally:
+            self.lock.release()
+
+    def _save(self, apiurl, requestlist):
+        """
+        _save(apiurl, requestlist)
+
+        Write the requests of apiurl. Errors writing the store are ignored.
+        The lock must be held
+        """
+        data = marshal.dumps((STORE_VERSION, requestlist.lastid, requestlist.lastchange, requestlist.requests))
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            (fd, tmpname) = tempfile.mkstemp(prefix='.tmp', dir=self.path)
+            f = os.fdopen(fd, 'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            os.rename(tmpname, self._filename(apiurl))
+        except (IOError, OSError):
+            pass
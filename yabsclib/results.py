@@ -18,13 +18,34 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
 
+import bisect
 import os
+import re
+import time
 from PyQt4 import QtGui, QtCore
 
+from buildservice import NOT_MODIFIED, WATCHED_MAXAGE
+from index import NameIndex, narrows
+from logfetch import LogFetcher
+from logstream import LogPoller, storeLog
+from logviewer import LogView
+from scheduler import PRIORITY_INTERACTIVE
+from resultstore import ResultStore, statusName, statuscodes, rowsToBits, bitsToFlags, bitCount
+
 #
 # Data model
 #
 
+# Result cell colours, looked up by status
+foregroundcolors = {'succeeded': QtCore.Qt.green,
+                    'building': QtCore.Qt.blue,
+                    'disabled': QtCore.Qt.gray,
+                    'expansion error': QtCore.Qt.red,
+                    'failed': QtCore.Qt.red,
+                    'broken': QtCore.Qt.red}
+backgroundcolors = {'building': QtCore.Qt.gray,
+                    'scheduled': QtCore.Qt.gray}
+
 class ResultModel(QtCore.QAbstractItemModel):
     """ResultModel()
     
@@ -32,37 +53,199 @@ class ResultModel(QtCore.QAbstractItemModel):
     """
     def __init__(self):
         QtCore.QAbstractItemModel.__init__(self)
-        self.results = []
+        self.store = ResultStore()
         self.targets = []
         self.targetfilter = ""
         self.resultfilter = ""
         self.visibletargets = []
+        self.visiblecolumns = []
         self.packages = []
         self.packagefilter = ""
-        self.visiblepackages = []
+        self.visiblerows = []
+        # Status code -> bitset of packages with that status in a visible target
+        self.statusbits = {}
+        # Bitset of the package rows matching the package filter, and the
+        # rows in package name order with their positions in the package
+        # search index, or None if there is no filter
+        self.filterbits = 0L
+        self.filterpositions = None
+        self.filterrows = None
+        self._filterbitsfor = None
     
-    def setResults(self, results, targets):
+    def setResults(self, store, diff=True):
         """
-        setResults(results, targets)
+        setResults(store, diff=True) -> boolean
+        
+        Set the ResultStore of the model, as returned from
+        BuildService.getResults(). Returns whether anything changed.
         
-        Set the results dict and targets list of the model, as returned from
-        BuildService.getResults()
+        If 'diff' is True, the new results are compared with the current ones
+        and only the rows, columns and cells that changed are signalled to the
+        views, so selection and scroll position are kept. Otherwise the model
+        is reset
         """
-        self.results = results
-        self.targets = targets
-        self.packages = sorted(results.keys())
-        self.updateVisiblePackages(reset=False)
+        old = self.store
+        if diff and store.targets == old.targets and store.packages == old.packages \
+           and store.columns == old.columns and store.details == old.details:
+            return False
+
+        oldrows = self.visiblerows
+        oldcolumns = self.visiblecolumns
+        oldtargets = self.visibletargets
+
+        # Work out the new visible state, then restore the old one so the
+        # views see consistent data while the changes are signalled
+        self.store = store
+        self.targets = store.targets
+        self.packages = [store.packages[row] for row in store.sortedRows()]
+        self._filterbitsfor = None
+        self.filterpositions = None
+        self.filterrows = None
+        self._updateFilterBits()
         self.updateVisibleTargets(reset=False)
-        self.reset()
-    
-    def _targetIndexFromName(self, target):
+        self.updateVisiblePackages(reset=False)
+        newrows = self.visiblerows
+        newcolumns = self.visiblecolumns
+        newtargets = self.visibletargets
+
+        if not diff or not old.targets or oldtargets != newtargets[:len(oldtargets)]:
+            self.reset()
+            return True
+
+        self.store = old
+        self.visiblerows = list(oldrows)
+        self.visiblecolumns = oldcolumns
+        self.visibletargets = oldtargets
+        self._diffRows(old, store, newrows, newcolumns, newtargets)
+        return True
+
+    def _diffRows(self, old, new, newrows, newcolumns, newtargets):
         """
-        _targetIndexFromName(target)
+        _diffRows(old, new, newrows, newcolumns, newtargets)
         
-        Returns the column index of the named target in the raw result data
+        Move the model from the 'old' store to the 'new' one, signalling
+        removed rows, then added columns and rows, then changed cells
         """
-        return self.targets.index(target)
+        parent = QtCore.QModelIndex()
+        newpackages = set([new.packages[r] for r in newrows])
+
+        # Remove rows that are no longer visible, last first so the positions
+        # of earlier rows stay valid
+        runs = []
+        for (pos, row) in enumerate(self.visiblerows):
+            if old.packages[row] not in newpackages:
+                if runs and runs[-1][1] == pos - 1:
+                    runs[-1][1] = pos
+                else:
+                    runs.append([pos, pos])
+        for (first, last) in reversed(runs):
+            self.beginRemoveRows(parent, first, last)
+            del self.visiblerows[first:last+1]
+            self.endRemoveRows()
+
+        # The remaining rows are all in the new store
+        keptrows = [(row, new.packageindex[old.packages[row]]) for row in self.visiblerows]
+        oldcolumns = self.visiblecolumns
+        self.store = new
+        self.targets = new.targets
+        self.visiblerows = [newrow for (oldrow, newrow) in keptrows]
+
+        if len(newcolumns) > len(oldcolumns):
+            self.beginInsertColumns(parent, len(oldcolumns) + 1, len(newcolumns))
+            self.visiblecolumns = newcolumns
+            self.visibletargets = newtargets
+            self.endInsertColumns()
+        else:
+            self.visiblecolumns = newcolumns
+            self.visibletargets = newtargets
+
+        # Insert rows that became visible. The kept rows are in the same order
+        # in the new list, so inserting in ascending order lands every run at
+        # its final position
+        kept = set(self.visiblerows)
+        runs = []
+        for (pos, row) in enumerate(newrows):
+            if row not in kept:
+                if runs and runs[-1][1] == pos - 1:
+                    runs[-1][1] = pos
+                    runs[-1][2].append(row)
+                else:
+                    runs.append([pos, pos, [row]])
+        for (first, last, rows) in runs:
+            self.beginInsertRows(parent, first, last)
+            self.visiblerows[first:first] = rows
+            self.endInsertRows()
+
+        # Signal changed cells of the rows that were visible before. If the
+        # package rows are unchanged, only columns that differ are compared
+        columnpairs = [(old.columns[oc], new.columns[nc]) for (oc, nc) in zip(oldcolumns, newcolumns)]
+        if old.packages == new.packages:
+            columnpairs = [(oc, nc) for (oc, nc) in columnpairs if oc != nc]
+        if not columnpairs:
+            return
+        changed = set()
+        for (oldrow, newrow) in keptrows:
+            for (oc, nc) in columnpairs:
+                if oc[oldrow] != nc[newrow]:
+                    changed.add(newrow)
+                    break
+        if not changed:
+            return
+        lastcolumn = len(newcolumns)
+        runs = []
+        for (pos, row) in enumerate(self.visiblerows):
+            if row in changed:
+                if runs and runs[-1][1] == pos - 1:
+                    runs[-1][1] = pos
+                else:
+                    runs.append([pos, pos])
+        for (first, last) in runs:
+            self.emit(QtCore.SIGNAL("dataChanged(const QModelIndex&, const QModelIndex&)"),
+                      self.index(first, 1), self.index(last, lastcolumn))
     
+    def appendResults(self, target, packages, codes, details=None):
+        """
+        appendResults(target, packages, codes, details=None)
+        
+        Append the results of one target, as yielded by
+        BuildService.iterResults(), as a new column. The store of the model
+        is extended in place, and only the new column and the rows that
+        became visible are signalled to the views
+        """
+        store = self.store
+        if not store.targets:
+            first = ResultStore()
+            first.addResults(target, packages, codes, details)
+            self.setResults(first, diff=False)
+            return
+
+        oldrows = self.visiblerows
+        oldcolumns = self.visiblecolumns
+        oldtargets = self.visibletargets
+        npackages = len(store.packages)
+
+        # Existing rows and columns keep their indexes, so the views see
+        # consistent data until the additions are signalled
+        store.addResults(target, packages, codes, details)
+        self.targets = store.targets
+        if len(store.packages) != npackages:
+            self.packages = [store.packages[row] for row in store.sortedRows()]
+            self._filterbitsfor = None
+            self.filterpositions = None
+            self.filterrows = None
+            self._updateFilterBits()
+        self.updateVisibleTargets(reset=False)
+        self.updateVisiblePackages(reset=False)
+        newrows = self.visiblerows
+        newcolumns = self.visiblecolumns
+        newtargets = self.visibletargets
+
+        # Adding results only ever makes rows visible, so this only inserts
+        self.visiblerows = list(oldrows)
+        self.visiblecolumns = oldcolumns
+        self.visibletargets = oldtargets
+        self._diffRows(store, store, newrows, newcolumns, newtargets)
+
     def targetFromColumn(self, column):
         """
         targetFromColumn(column)
@@ -70,7 +253,7 @@ class ResultModel(QtCore.QAbstractItemModel):
         Returns the target represented by the visible 'column'
         """
         if column > 0:
-            return self.targets[self._targetIndexFromName(self.visibletargets[column-1])]
+            return self.targets[self.visiblecolumns[column-1]]
     
     def getPackageTargetsWithStatus(self, package, status):
         """
@@ -78,11 +261,7 @@ class ResultModel(QtCore.QAbstractItemModel):
         
         Returns a list of failed targets for a package
         """
-        targets = []
-        for (i, target) in enumerate(self.results[package]):
-            if target == status.lower():
-                targets.append(self.targets[i])
-        return targets
+        return self.store.packageTargetsWithStatus(package, status.lower())
 
     def _data(self, row, column):
         """
@@ -91,12 +270,10 @@ class ResultModel(QtCore.QAbstractItemModel):
         Internal method for getting model data. The 0th column is the package name, and subsequent
         columns are result codes
         """
-        package = self.visiblepackages[row]
-        target = self.visibletargets[column-1]
         if column == 0:
-            return package
+            return self.store.packages[self.visiblerows[row]]
         else:
-            return self.results[package][self._targetIndexFromName(target)]
+            return statusName(self.store.columns[self.visiblecolumns[column-1]][self.visiblerows[row]])
     
     def packageFromRow(self, row):
         """
@@ -120,17 +297,11 @@ class ResultModel(QtCore.QAbstractItemModel):
         if role == QtCore.Qt.DisplayRole:
             return QtCore.QVariant(txt)
         elif role == QtCore.Qt.ForegroundRole:
-            if txt in ("succeeded",):
-                return QtCore.QVariant(QtGui.QColor(QtCore.Qt.green))
-            if txt in ("building",):
-                return QtCore.QVariant(QtGui.QColor(QtCore.Qt.blue))
-            if txt in ("disabled",):
-                return QtCore.QVariant(QtGui.QColor(QtCore.Qt.gray))
-            if txt in ("expansion error", "failed", "broken"):
-                return QtCore.QVariant(QtGui.QColor(QtCore.Qt.red))
+            if txt in foregroundcolors:
+                return QtCore.QVariant(QtGui.QColor(foregroundcolors[txt]))
         elif role == QtCore.Qt.BackgroundRole:
-            if txt in ("building", "scheduled"):
-                return QtCore.QVariant(QtGui.QColor(QtCore.Qt.gray))
+            if txt in backgroundcolors:
+                return QtCore.QVariant(QtGui.QColor(backgroundcolors[txt]))
 
         return QtCore.QVariant()
 
@@ -156,7 +327,7 @@ class ResultModel(QtCore.QAbstractItemModel):
         
         Returns a QModelIndex object representing row and column
         """
-        return self.createIndex(row, column, id(self._data(row, column)))
+        return self.createIndex(row, column)
         
     def parent(self, index):
         """
@@ -172,7 +343,7 @@ class ResultModel(QtCore.QAbstractItemModel):
         
         Returns the number of rows of data currently in the model
         """
-        return len(self.visiblepackages)
+        return len(self.visiblerows)
         
     def columnCount(self, parent=None):
         """
@@ -180,30 +351,74 @@ class ResultModel(QtCore.QAbstractItemModel):
         
         Returns the number of columns of data currently in the model
         """
-        return len(self.visibletargets) + 1
+        return len(self.visiblecolumns) + 1
     
+    def _updateStatusBits(self):
+        """
+        _updateStatusBits()
+        
+        Rebuild the status index for the visible targets from the per-target
+        indexes of the result store
+        """
+        self.statusbits = {}
+        for column in self.visiblecolumns:
+            for (code, bits) in self.store.columnBits(column).iteritems():
+                self.statusbits[code] = self.statusbits.get(code, 0L) | bits
+
+    def _updateFilterBits(self):
+        """
+        _updateFilterBits()
+        
+        Update the bitset of packages matching the package filter, through
+        the package search index of the store. See index.parseQuery() for the
+        filter syntax. When a substring filter only grew, just the packages
+        matching the previous filter are searched. An invalid regular
+        expression matches no packages
+        """
+        size = len(self.store.packages)
+        if not self.packagefilter:
+            self.filterbits = self.store.allBits()
+            self.filterpositions = None
+            self.filterrows = None
+        else:
+            within = None
+            if self._filterbitsfor and self.filterpositions is not None \
+               and narrows(self._filterbitsfor, self.packagefilter):
+                within = self.filterpositions
+            try:
+                self.filterpositions = self.store.packageSearch().query(self.packagefilter, within)
+            except re.error:
+                self.filterpositions = []
+            sortedrows = self.store.sortedRows()
+            self.filterrows = [sortedrows[position] for position in self.filterpositions]
+            self.filterbits = rowsToBits(self.filterrows, size)
+        self._filterbitsfor = self.packagefilter
+
     def packageHasResult(self, package, result):
         """
         packageHasResult(package, result) -> boolean
         
         Return whether a package has a result in one of the visible targets
         """
-        for (i, target) in enumerate(self.targets):
-            if target in self.visibletargets and self.results[package][i] == result:
-                return True
-        return False
+        code = statuscodes.get(result)
+        if code is None:
+            return False
+        return bool((self.statusbits.get(code, 0L) >> self.store.packageindex[package]) & 1)
     
     def numPackagesWithResult(self, result):
         """
         numPackagesWithResult(result)
         
-        Return the number of packages with result in one of the visible targets
+        Return the number of packages matching the package filter with result in
+        one of the visible targets
         """
-        packages = [p for p in self.packages if self.packagefilter in p]
         result = result.lower()
         if result == 'all':
-            return len(packages)
-        return len([p for p in packages if self.packageHasResult(p, result)])
+            return bitCount(self.filterbits)
+        code = statuscodes.get(result)
+        if code is None:
+            return 0
+        return bitCount(self.statusbits.get(code, 0L) & self.filterbits)
 
     def updateVisiblePackages(self, reset=True):
         """
@@ -211,16 +426,18 @@ class ResultModel(QtCore.QAbstractItemModel):
         
         Update the list of visible packages
         """
-        # Start with all packages
-        self.visiblepackages = self.packages
+        # Start with the packages matching the filter string, which are in
+        # package name order
+        if self.filterrows is not None:
+            self.visiblerows = self.filterrows
+        else:
+            self.visiblerows = self.store.sortedRows()
 
-        # Apply filter string
-        if self.packagefilter:
-            self.visiblepackages = [p for p in self.visiblepackages if self.packagefilter in p]
-        
         # Apply result filter
         if self.resultfilter:
-            self.visiblepackages = [p for p in self.visiblepackages if self.packageHasResult(p, self.resultfilter)]
+            code = statuscodes.get(self.resultfilter)
+            flags = bitsToFlags(self.statusbits.get(code, 0L), len(self.store.packages))
+            self.visiblerows = [r for r in self.visiblerows if flags[r] == '1']
         
         if reset:
             self.reset()
@@ -232,6 +449,7 @@ class ResultModel(QtCore.QAbstractItemModel):
         Only show packages matching filterstring
         """
         self.packagefilter = filterstring
+        self._updateFilterBits()
         self.updateVisiblePackages(reset)
 
     def setResultFilter(self, result="", reset=True):
@@ -250,10 +468,17 @@ class ResultModel(QtCore.QAbstractItemModel):
         
         Update the list of visible targets
         """
-        self.visibletargets = self.targets
-        
         if self.targetfilter:
-            self.visibletargets = [t for t in self.targets if t == self.targetfilter]
+            if self.targetfilter in self.store.targetindex:
+                self.visiblecolumns = [self.store.targetindex[self.targetfilter]]
+            else:
+                self.visiblecolumns = []
+        else:
+            self.visiblecolumns = range(len(self.targets))
+        self.visibletargets = [self.targets[column] for column in self.visiblecolumns]
+        self._updateStatusBits()
+        if self.resultfilter:
+            self.updateVisiblePackages(reset=False)
         
         if reset:
             self.reset()
@@ -268,87 +493,363 @@ class ResultModel(QtCore.QAbstractItemModel):
         self.targetfilter = target
         self.updateVisibleTargets(reset)
 
-#
-# API call threads
-#
-class ProjectListThread(QtCore.QThread):
+# Rows of the project list added to the view at a time
+PROJECTLIST_FETCHSIZE = 256
+
+# Larger changes to the project list reset the view instead of updating it
+PROJECTLIST_MAXCHANGES = 64
+
+def diffSorted(old, new):
     """
-    ProjectListThread(bs)
+    diffSorted(old, new) -> list
     
-    Thread for retrieving project lists. Requires a BuildService object
+    Returns the changes that turn the sorted list old into the sorted list
+    new, as a list of ('remove', row, count) and ('insert', row, items)
+    tuples, where row is the row in the list as changed by the previous
+    tuples
     """
-    def __init__(self, bs):
-        QtCore.QThread.__init__(self)
-        self.bs = bs
-        self.projects = []
-        self.watched = True
+    changes = []
+    (i, j, row) = (0, 0, 0)
+    (nold, nnew) = (len(old), len(new))
+    while i < nold or j < nnew:
+        if j >= nnew or (i < nold and old[i] < new[j]):
+            start = i
+            while i < nold and (j >= nnew or old[i] < new[j]):
+                i += 1
+            changes.append(('remove', row, i - start))
+        elif i >= nold or new[j] < old[i]:
+            start = j
+            while j < nnew and (i >= nold or new[j] < old[i]):
+                j += 1
+            changes.append(('insert', row, new[start:j]))
+            row += j - start
+        else:
+            i += 1
+            j += 1
+            row += 1
+    return changes
+
+
+class ProjectListModel(QtCore.QAbstractItemModel):
+    """ProjectListModel()
     
-    def run(self):
-        if self.watched:
-            self.projects = self.bs.getWatchedProjectList()
+    Model for the project list. The projects are held in a NameIndex, and
+    the view is given rows in pages of PROJECTLIST_FETCHSIZE as it scrolls,
+    so showing a list takes the same time whatever its length. A new list
+    of the same projects is applied as row insertions and removals, which
+    keeps the selection and scroll position
+    """
+    def __init__(self):
+        QtCore.QAbstractItemModel.__init__(self)
+        self.projects = NameIndex([])
+        self.filtertext = ""
+        # The positions in projects of the projects matching the filter, or
+        # None if there is no filter
+        self.positions = None
+        # The names of the visible projects, and how many of them the view
+        # has been given
+        self.rows = []
+        self.fetched = 0
+
+    def _visible(self, projects, positions):
+        if positions is None:
+            return projects.names
+        names = projects.names
+        return [names[i] for i in positions]
+
+    def setProjects(self, projects, diff=True):
+        """
+        setProjects(projects, diff=True)
+        
+        Set the projects of the model to the NameIndex projects. If diff is
+        True, the view is updated with the differences to the current
+        projects, otherwise it is reset
+        """
+        if self.filtertext:
+            positions = projects.search(self.filtertext)
+        else:
+            positions = None
+        rows = self._visible(projects, positions)
+        if diff:
+            changes = diffSorted(self.rows, rows)
+            if len(changes) <= PROJECTLIST_MAXCHANGES:
+                self.applyChanges(changes)
+                (self.projects, self.positions, self.rows) = (projects, positions, rows)
+                return
+        (self.projects, self.positions) = (projects, positions)
+        self.setRows(rows)
+
+    def applyChanges(self, changes):
+        """
+        applyChanges(changes)
+        
+        Apply the changes returned by diffSorted() to the visible rows,
+        telling the view about those it has been given
+        """
+        self.rows = list(self.rows)
+        for (change, row, arg) in changes:
+            if change == 'remove':
+                shown = max(0, min(row + arg, self.fetched) - row)
+                if shown:
+                    self.beginRemoveRows(QtCore.QModelIndex(), row, row + shown - 1)
+                del self.rows[row:row + arg]
+                if shown:
+                    self.fetched -= shown
+                    self.endRemoveRows()
+            else:
+                shown = row < self.fetched or self.fetched == len(self.rows)
+                if shown:
+                    self.beginInsertRows(QtCore.QModelIndex(), row, row + len(arg) - 1)
+                self.rows[row:row] = arg
+                if shown:
+                    self.fetched += len(arg)
+                    self.endInsertRows()
+
+    def setRows(self, rows):
+        """
+        setRows(rows)
+        
+        Show the sorted list of project names rows, resetting the view
+        """
+        self.rows = rows
+        self.fetched = min(len(rows), PROJECTLIST_FETCHSIZE)
+        self.reset()
+
+    def setFilter(self, text):
+        """
+        setFilter(text)
+        
+        Only show projects containing text, ignoring case. While text is
+        extended, only the projects matching the previous filter are searched
+        """
+        previous = self.filtertext
+        self.filtertext = text
+        if not text:
+            self.positions = None
+        elif previous and text.lower().startswith(previous.lower()) and self.positions is not None:
+            self.positions = self.projects.search(text, self.positions)
         else:
-            self.projects = self.bs.getProjectList()
+            self.positions = self.projects.search(text)
+        self.setRows(self._visible(self.projects, self.positions))
 
-class ProjectResultsThread(QtCore.QThread):
+    def projectFromRow(self, row):
+        """
+        projectFromRow(row) -> str
+        
+        Returns the project shown in row
+        """
+        return self.rows[row]
+
+    def rowOfProject(self, project):
+        """
+        rowOfProject(project) -> int
+        
+        Returns the row of project, or -1 if it is not visible. The view is
+        given the rows up to it
+        """
+        row = bisect.bisect_left(self.rows, project)
+        if row == len(self.rows) or self.rows[row] != project:
+            return -1
+        if row >= self.fetched:
+            self.beginInsertRows(QtCore.QModelIndex(), self.fetched, row)
+            self.fetched = row + 1
+            self.endInsertRows()
+        return row
+
+    def canFetchMore(self, parent):
+        """
+        canFetchMore(parent) -> bool
+        
+        Returns True if there are rows the view has not been given yet
+        
+        This is normally only called within Qt
+        """
+        return not parent.isValid() and self.fetched < len(self.rows)
+
+    def fetchMore(self, parent):
+        """
+        fetchMore(parent)
+        
+        Give the view the next page of rows
+        
+        This is normally only called within Qt
+        """
+        count = min(len(self.rows) - self.fetched, PROJECTLIST_FETCHSIZE)
+        if parent.isValid() or count <= 0:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), self.fetched, self.fetched + count - 1)
+        self.fetched += count
+        self.endInsertRows()
+
+    def data(self, index, role):
+        """
+        data(index, role) -> QVariant
+        
+        Returns the QVariant model data located at QModelIndex index
+        
+        This is normally only called within Qt
+        """
+        if index.isValid() and role == QtCore.Qt.DisplayRole:
+            return QtCore.QVariant(self.rows[index.row()])
+        return QtCore.QVariant()
+
+    def headerData(self, section, orientation, role):
+        """
+        headerData(section, orientation, role) -> QVariant
+        
+        Returns header for section (column) with orientation (Qt.Horizontal or Qt.Vertical)
+        
+        This is normally only called within Qt
+        """
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return QtCore.QVariant("Project")
+        return QtCore.QVariant()
+
+    def index(self, row, column, parent=None):
+        """
+        index(row, column, parent) -> QModelIndex
+        
+        Returns a QModelIndex object representing row and column
+        """
+        return self.createIndex(row, column)
+        
+    def parent(self, index):
+        """
+        parent(index) -> QModelIndex
+        
+        Return the parent index of an index (for trees)
+        """
+        return QtCore.QModelIndex()
+
+    def rowCount(self, parent=None):
+        """
+        rowCount() -> int
+        
+        Returns the number of rows the view has been given
+        """
+        if parent is not None and parent.isValid():
+            return 0
+        return self.fetched
+        
+    def columnCount(self, parent=None):
+        """
+        columnCount() -> int
+        
+        Returns the number of columns of data currently in the model
+        """
+        return 1
+
+#
+# API calls, run through the request scheduler
+#
+
+# Seconds for which package status retrieved for the package info pane is
+# reused
+PACKAGESTATUS_MAXAGE = 30
+
+def searchBuildLogs(bs, project, text):
     """
-    ProjectResultsThread(bs)
+    searchBuildLogs(bs, project, text) -> tuple
+
+    Search the stored build logs of project through the BuildService object
+    bs. Returns the matches, as returned by BuildService.searchBuildLogs(),
+    and the number of stored logs of project
+    """
+    return (bs.searchBuildLogs(project, text), len(bs.logstore.logs(bs.apiurl, project)))
+
+def indexProjects(projects):
+    """
+    indexProjects(projects) -> NameIndex
     
-    Thread for retrieving project results. Requires a BuildService object
+    Returns a NameIndex of the list projects, with its substring index built
     """
-    def __init__(self, bs):
-        QtCore.QThread.__init__(self)
-        self.bs = bs
-        self.project = None
-        self.results = []
-        self.targets = []
+    projects = NameIndex(projects)
+    projects.buildTrigrams()
+    return projects
+
+def getProjectList(bs, watched):
+    """
+    getProjectList(bs, watched) -> NameIndex
     
-    def run(self):
-        (self.results, self.targets) = self.bs.getResults(self.project)
+    Get the watched projects, or all projects, through the BuildService object
+    bs and save them in its cache
+    """
+    apiurl = bs.apiurl
+    if watched:
+        projects = bs.getWatchedProjectList(WATCHED_MAXAGE)
+        bs.cache.put(apiurl, 'watched', projects)
+    else:
+        projects = bs.getProjectList()
+        bs.cache.put(apiurl, 'projects', projects)
+    return indexProjects(projects)
 
-class PackageStatusThread(QtCore.QThread):
+def getCachedProjectList(bs, watched):
     """
-    PackageStatusThread(bs)
+    getCachedProjectList(bs, watched) -> NameIndex
     
-    Thread for retrieving package status. Requires a BuildService object
+    Returns the watched projects, or all projects, from the cache of the
+    BuildService object bs, or None if they are not cached
     """
-    def __init__(self, bs):
-        QtCore.QThread.__init__(self)
-        self.bs = bs
-        self.project = None
-        self.package = None
-        self.status = {}
+    if watched:
+        projects = bs.cache.get(bs.apiurl, 'watched')
+    else:
+        projects = bs.cache.get(bs.apiurl, 'projects')
+    if projects is None:
+        return None
+    return indexProjects(projects)
+
+def getProjectTargets(bs, project):
+    """
+    getProjectTargets(bs, project) -> list
     
-    def run(self):
-        self.status = self.bs.getPackageStatus(self.project, self.package)
+    Get the targets of project through the BuildService object bs and save
+    them in its cache
+    """
+    targets = bs.getTargets(project)
+    bs.cache.put(bs.apiurl, 'targets', targets, project)
+    return targets
 
-class BuildLogThread(QtCore.QThread):
+def getProjectResults(bs, project, ifchanged):
     """
-    BuildLogThread(bs)
+    getProjectResults(bs, project, ifchanged) -> ResultStore
     
-    Thread for retrieving build logs. Requires a BuildService object
+    Get the results of project through the BuildService object bs and save
+    them in its cache. See BuildService.getResults() for ifchanged
     """
-    def __init__(self, bs):
-        QtCore.QThread.__init__(self)
-        self.bs = bs
-        self.project = None
-        self.target = None
-        self.package = None
-        self.offset = 0
-        self.live = False
-        self.log_chunk = ""
+    apiurl = bs.apiurl
+    store = bs.getResults(project, ifchanged=ifchanged)
+    if store is not NOT_MODIFIED:
+        bs.cache.put(apiurl, 'results', store.dump(), project)
+        # Spare the GUI thread building the package search index
+        store.packageSearch().build()
+    return store
+
+def iterProjectResults(bs, project):
+    """
+    iterProjectResults(bs, project) -> iterator
     
-    def run(self):
-        self.log_chunk = self.bs.getBuildLog(self.project, self.target, self.package, self.offset)
+    Get the results of project through the BuildService object bs as they
+    arrive, as BuildService.iterResults() does. The complete results are saved
+    in the cache of bs
+    """
+    apiurl = bs.apiurl
+    store = ResultStore()
+    for (target, packages, codes, details) in bs.iterResults(project):
+        store.addResults(target, packages, codes, details)
+        yield (target, packages, codes, details)
+    bs.cache.put(apiurl, 'results', store.dump(), project)
 
 
 class ProjectTreeView(QtGui.QTreeView):
     """
-    ProjectTreeView(bs, parent=None)
+    ProjectTreeView(bs, commands, parent=None)
     
-    The project tree view. 'bs' must be a BuildService object
+    The project tree view. 'bs' must be a BuildService object and 'commands'
+    the CommandRunner that runs the context menu actions
     """
-    def __init__(self, bs, parent=None):
+    def __init__(self, bs, commands, parent=None):
         self.bs = bs
+        self.commands = commands
         QtGui.QTreeView.__init__(self, parent)
     
     def contextMenuEvent(self, event):
@@ -358,7 +859,7 @@ class ProjectTreeView(QtGui.QTreeView):
         Context menu event handler
         """
         index = self.indexAt(event.pos())
-        project = self.model().data(index, QtCore.Qt.DisplayRole).toString()
+        project = str(self.model().data(index, QtCore.Qt.DisplayRole).toString())
         if project:
             menu = QtGui.QMenu()
             
@@ -372,7 +873,12 @@ class ProjectTreeView(QtGui.QTreeView):
             # editflagsaction = QtGui.QAction('Edit flags for %s' % project, self)
             # menu.addAction(editflagsaction)
             
-            if project in self.bs.getWatchedProjectList():
+            # The watched projects retrieved last are good enough here;
+            # getting them again would block the menu
+            watched = self.bs.watchedProjects()
+            if watched is None:
+                watched = frozenset(self.bs.cache.get(self.bs.apiurl, 'watched') or [])
+            if project in watched:
                 unwatchaction = QtGui.QAction('Unwatch %s' % project, self)
                 menu.addAction(unwatchaction)
             else:
@@ -381,22 +887,24 @@ class ProjectTreeView(QtGui.QTreeView):
             
             selectedaction = menu.exec_(self.mapToGlobal(event.pos()))
             
-            if selectedaction:
-                try:
-                    if selectedaction == abortaction:
-                        self.bs.abortBuild(str(project))
-                    # elif selectedaction == editflagsaction:
-                    #     self.editFlags(project)
-                    elif selectedaction == watchaction:
-                        self.bs.watchProject(project)
-                    elif selectedaction == unwatchaction:
-                        self.bs.unwatchProject(project)
-                except Exception, e:
-                    QtGui.QMessageBox.critical(self, "Error",
-                               "Could not perform action on project %s: %s" % (project, e))
-                    raise
-                if selectedaction in (watchaction, unwatchaction):
-                    self.emit(QtCore.SIGNAL("watchedProjectsChanged()"))
+            if selectedaction == abortaction:
+                self.commands.run("Aborting all builds for %s" % project, self.bs.abortBuild, (project,))
+            # elif selectedaction == editflagsaction:
+            #     self.editFlags(project)
+            elif selectedaction == watchaction:
+                self.commands.run("Watching %s" % project, self.bs.watchProject, (project,),
+                                  callback=self.watchedProjectsChanged)
+            elif selectedaction == unwatchaction:
+                self.commands.run("Unwatching %s" % project, self.bs.unwatchProject, (project,),
+                                  callback=self.watchedProjectsChanged)
+
+    def watchedProjectsChanged(self, request):
+        """
+        watchedProjectsChanged(request)
+        
+        Emit watchedProjectsChanged() after a project was watched or unwatched
+        """
+        self.emit(QtCore.SIGNAL("watchedProjectsChanged()"))
 
     def editFlags(self, project):
         """
@@ -465,21 +973,22 @@ class ResultTreeView(QtGui.QTreeView):
             selectedaction = menu.exec_(self.mapToGlobal(event.pos()))
             
             if selectedaction:
-                try:
-                    if selectedaction == rebuildtargetaction:
-                        self.parent.bs.rebuild(self.parent.currentproject, packagename, target=target)
-                    elif selectedaction == rebuildallfailedaction:
-                        self.parent.bs.rebuild(self.parent.currentproject, packagename, code='failed')
-                    elif selectedaction == rebuildallaction:
-                        self.parent.bs.rebuild(self.parent.currentproject, packagename)
-                    elif selectedaction == aborttargetaction:
-                        self.parent.bs.abortBuild(self.parent.currentproject, packagename, target)                        
-                    elif selectedaction == abortallaction:
-                        self.parent.bs.abortBuild(self.parent.currentproject, packagename)
-                except Exception, e:
-                    QtGui.QMessageBox.critical(self, "Error",
-                               "Could not perform action on package %s: %s" % (packagename, e))
-                    raise
+                bs = self.parent.bs
+                project = self.parent.currentproject
+                run = self.parent.commands.run
+                if selectedaction == rebuildtargetaction:
+                    run("Rebuilding %s for %s" % (packagename, target), bs.rebuild,
+                        (project, packagename), {'target': target})
+                elif selectedaction == rebuildallfailedaction:
+                    run("Rebuilding %s for all failed targets" % packagename, bs.rebuild,
+                        (project, packagename), {'code': 'failed'})
+                elif selectedaction == rebuildallaction:
+                    run("Rebuilding %s for all targets" % packagename, bs.rebuild, (project, packagename))
+                elif selectedaction == aborttargetaction:
+                    run("Aborting build of %s for %s" % (packagename, target), bs.abortBuild,
+                        (project, packagename, target))
+                elif selectedaction == abortallaction:
+                    run("Aborting all builds of %s" % packagename, bs.abortBuild, (project, packagename))
 
 
 class ProjectFlagsDialog(QtGui.QDialog):
@@ -512,6 +1021,156 @@ class ProjectFlagsDialog(QtGui.QDialog):
         self.setLayout(layout)
 
 
+class LogSearchDialog(QtGui.QDialog):
+    """
+    LogSearchDialog(widget)
+    
+    Dialog for searching the stored build logs of the current project of the
+    ResultWidget widget. Selecting a match shows its build log in the widget
+    """
+    def __init__(self, widget):
+        QtGui.QDialog.__init__(self, widget)
+        self.widget = widget
+        self.project = widget.currentproject
+        
+        self.setWindowTitle("Search Build Logs of %s" % self.project)
+        self.resize(700, 400)
+        
+        self.searchedit = QtGui.QLineEdit()
+        QtCore.QObject.connect(self.searchedit, QtCore.SIGNAL("returnPressed()"), self.search)
+        searchbutton = QtGui.QPushButton('Search')
+        self.connect(searchbutton, QtCore.SIGNAL('clicked()'), self.search)
+        
+        self.resultview = QtGui.QTreeWidget()
+        self.resultview.setRootIsDecorated(False)
+        self.resultview.setHeaderLabels(["Package", "Target", "Line", "Text"])
+        QtCore.QObject.connect(self.resultview, QtCore.SIGNAL("itemActivated(QTreeWidgetItem*, int)"), self.viewLog)
+        
+        self.statuslabel = QtGui.QLabel()
+        
+        searchlayout = QtGui.QHBoxLayout()
+        searchlayout.addWidget(self.searchedit)
+        searchlayout.addWidget(searchbutton)
+        
+        buttonlayout = QtGui.QHBoxLayout()
+        buttonlayout.addWidget(self.statuslabel, 1)
+        close = QtGui.QPushButton('Close')
+        self.connect(close, QtCore.SIGNAL('clicked()'), self.reject)
+        buttonlayout.addWidget(close)
+        
+        layout = QtGui.QVBoxLayout()
+        layout.addLayout(searchlayout)
+        layout.addWidget(self.resultview)
+        layout.addLayout(buttonlayout)
+        self.setLayout(layout)
+
+    def search(self):
+        """
+        search()
+        
+        Search the stored logs for the text in the search field
+        """
+        text = str(self.searchedit.text())
+        if not text:
+            return
+        self.statuslabel.setText("Searching...")
+        self.widget.scheduler.submit(searchBuildLogs, (self.widget.bs, self.project, text),
+                                     group='results.logsearch', priority=PRIORITY_INTERACTIVE,
+                                     callback=self.showResults, started=time.time())
+
+    def showResults(self, request):
+        """
+        showResults(request)
+        
+        Show the result of a search request
+        """
+        self.resultview.clear()
+        (matches, nlogs) = request.result
+        nlines = 0
+        for (target, package, buildid, lines) in matches:
+            for (lineno, line) in lines:
+                item = QtGui.QTreeWidgetItem([package, target, str(lineno), line.strip()])
+                self.resultview.addTopLevelItem(item)
+                nlines += 1
+        for column in range(3):
+            self.resultview.resizeColumnToContents(column)
+        self.statuslabel.setText("%d matching lines in %d of %d stored logs (%.0f ms)" % (nlines,
+                                   len(matches), nlogs,
+                                   (time.time() - request.params['started'])*1000))
+
+    def viewLog(self, item, column):
+        """
+        viewLog(item, column)
+        
+        Show the build log of a match
+        """
+        if self.widget.currentproject == self.project:
+            self.widget.viewBuildOutput(str(item.text(1)), str(item.text(0)))
+
+
+class FailureSummaryDialog(QtGui.QDialog):
+    """
+    FailureSummaryDialog(widget, project, results)
+    
+    Shows the error lines of the failed builds of project, as reported by
+    LogFetcher. Activating a build shows its log in the ResultWidget widget
+    """
+    def __init__(self, widget, project, results):
+        QtGui.QDialog.__init__(self, widget)
+        self.widget = widget
+        self.project = project
+        
+        self.setWindowTitle("Failed Builds of %s" % project)
+        self.resize(800, 500)
+        
+        self.summaryview = QtGui.QTreeWidget()
+        self.summaryview.setHeaderLabels(["Package", "Target"])
+        QtCore.QObject.connect(self.summaryview, QtCore.SIGNAL("itemActivated(QTreeWidgetItem*, int)"), self.viewLog)
+        font = QtGui.QFont("Bitstream Vera Sans Mono", 7)
+        errors = 0
+        for (package, target, summary, error) in results:
+            item = QtGui.QTreeWidgetItem([package, target])
+            self.summaryview.addTopLevelItem(item)
+            if summary is None:
+                errors += 1
+                lines = ["Could not retrieve log: %s" % error]
+            else:
+                lines = summary
+            for line in lines:
+                child = QtGui.QTreeWidgetItem([line])
+                child.setFont(0, font)
+                child.setFirstColumnSpanned(True)
+                item.addChild(child)
+            item.setExpanded(True)
+        self.summaryview.resizeColumnToContents(1)
+        
+        label = QtGui.QLabel("%d failed builds" % len(results))
+        if errors:
+            label.setText("%d failed builds, %d logs could not be retrieved" % (len(results), errors))
+        
+        buttonlayout = QtGui.QHBoxLayout()
+        buttonlayout.addWidget(label, 1)
+        close = QtGui.QPushButton('Close')
+        self.connect(close, QtCore.SIGNAL('clicked()'), self.reject)
+        buttonlayout.addWidget(close)
+        
+        layout = QtGui.QVBoxLayout()
+        layout.addWidget(self.summaryview)
+        layout.addLayout(buttonlayout)
+        self.setLayout(layout)
+
+    def viewLog(self, item, column):
+        """
+        viewLog(item, column)
+        
+        Show the build log of a failed build
+        """
+        if item.parent():
+            item = item.parent()
+        if self.widget.currentproject == self.project:
+            self.widget.viewBuildOutput(str(item.text(1)), str(item.text(0)))
+
+
 #
 # Result widget
 #
@@ -533,8 +1192,14 @@ class ResultWidget(QtGui.QWidget):
         # Config object
         self.cfg = cfg
         
+        # Request scheduler, and the runner for user commands
+        self.scheduler = parent.scheduler
+        self.commands = parent.commands
+        
         # Convenience attributes
         self.currentproject = ''
+        self.resultsproject = None
+        self.resultsstale = False
         self.initialprojectrefresh = True
         
         # Project list selector
@@ -546,20 +1211,29 @@ class ResultWidget(QtGui.QWidget):
         QtCore.QObject.connect(self.projectlistselector, QtCore.SIGNAL("currentIndexChanged(const QString&)"), self.refreshProjectList)
 
         # The project list
-        self.projecttreeview = ProjectTreeView(self.bs)
+        self.projecttreeview = ProjectTreeView(self.bs, self.commands)
         self.projecttreeview.setRootIsDecorated(False)
-        self.projectlistmodel = QtGui.QStandardItemModel(0, 1, self)
-        self.projectlistmodel.setHeaderData(0, QtCore.Qt.Horizontal, QtCore.QVariant("Project"))
-        self.projectlistthread = ProjectListThread(self.bs)
-        self.refreshProjectList()
+        self.projecttreeview.setUniformRowHeights(True)
+        self.projectlistmodel = ProjectListModel()
         self.projecttreeview.setModel(self.projectlistmodel)
+        self.projectlistlive = False
+        # The NameIndex of each (apiurl, watched) project list retrieved, and
+        # the key of the one shown
+        self.projectlists = {}
+        self.projectlistkey = None
+        
+        # Project type-ahead filter
+        self.projectfilteredit = QtGui.QLineEdit()
+        self.projectfilteredit.setToolTip("Only show projects containing this text")
+        QtCore.QObject.connect(self.projectfilteredit, QtCore.SIGNAL("textChanged(const QString&)"), self.filterProjects)
         QtCore.QObject.connect(self.projecttreeview, QtCore.SIGNAL("clicked(const QModelIndex&)"), self.projectSelected)
         QtCore.QObject.connect(self.projecttreeview, QtCore.SIGNAL("watchedProjectsChanged()"), self.refreshProjectList)
-        QtCore.QObject.connect(self.projectlistthread, QtCore.SIGNAL("finished()"), self.updateProjectList)
         
         # Filter widgets
         searchlabel = QtGui.QLabel("Search")
         self.searchedit = QtGui.QLineEdit()
+        self.searchedit.setToolTip("Only show packages containing this text, matching a pattern such as "
+                                   "python-*, or matching a regular expression such as /^lib.*-devel$/")
         QtCore.QObject.connect(self.searchedit, QtCore.SIGNAL("textChanged(const QString&)"), self.filterPackages)
         targetlabel = QtGui.QLabel("Target")
         self.targetselector = QtGui.QComboBox()
@@ -586,26 +1260,34 @@ class ResultWidget(QtGui.QWidget):
         # Result refresh
         self.refreshtimer = QtCore.QTimer()
         QtCore.QObject.connect(self.refreshtimer, QtCore.SIGNAL("timeout()"), self.timerRefresh)
-        self.projectresultsthread = ProjectResultsThread(self.bs)
-        QtCore.QObject.connect(self.projectresultsthread, QtCore.SIGNAL("finished()"), self.updatePackageList)
 
         # Package info
         self.packageinfo = QtGui.QTextBrowser()
         self.packageinfo.setReadOnly(True)
         self.packageinfo.setOpenLinks(False)
         QtCore.QObject.connect(self.packageinfo, QtCore.SIGNAL("anchorClicked(const QUrl&)"), self.infoClick)
-        self.packagestatusthread = PackageStatusThread(self.bs)
-        QtCore.QObject.connect(self.packagestatusthread, QtCore.SIGNAL("finished()"), self.updatePackageInfo)
 
-        # Stream parameters and timer
-        self.streamtimer = QtCore.QTimer()
-        QtCore.QObject.connect(self.streamtimer, QtCore.SIGNAL("timeout()"), self.requestBuildOutput)
-        self.buildlogthread = BuildLogThread(self.bs)
-        QtCore.QObject.connect(self.buildlogthread, QtCore.SIGNAL("finished()"), self.updateBuildOutput)
+        # Build log
+        self.logview = LogView()
+        self.infostack = QtGui.QStackedWidget()
+        self.infostack.addWidget(self.packageinfo)
+        self.infostack.addWidget(self.logview)
+
+        # Failed build log retrieval
+        self.logfetcher = LogFetcher(self.bs, self.scheduler)
+        QtCore.QObject.connect(self.logfetcher, QtCore.SIGNAL("fetchProgress"), self.failedLogsProgress)
+        QtCore.QObject.connect(self.logfetcher, QtCore.SIGNAL("fetchFinished"), self.failedLogsFetched)
+
+        # Build log streaming
+        self.logpoller = LogPoller(self.bs, self.scheduler, 'results.buildlog')
+        QtCore.QObject.connect(self.logpoller, QtCore.SIGNAL("logReceived"), self.updateBuildOutput)
+        QtCore.QObject.connect(self.logpoller, QtCore.SIGNAL("logFinished()"), self.buildOutputFinished)
+        QtCore.QObject.connect(self.logpoller, QtCore.SIGNAL("logFailed"), self.buildOutputFailed)
 
         # Layout
         projectlistlayout = QtGui.QVBoxLayout()
         projectlistlayout.addWidget(self.projectlistselector)
+        projectlistlayout.addWidget(self.projectfilteredit)
         projectlistlayout.addWidget(self.projecttreeview)
         filterlayout = QtGui.QHBoxLayout()
         filterlayout.addWidget(searchlabel)
@@ -616,11 +1298,13 @@ class ResultWidget(QtGui.QWidget):
         packagelistlayout.addLayout(filterlayout)
         packagelistlayout.addWidget(self.resulttab)
         packagelistlayout.addWidget(self.resultview)
-        packagelistlayout.addWidget(self.packageinfo)
+        packagelistlayout.addWidget(self.infostack)
         mainlayout = QtGui.QHBoxLayout()
         mainlayout.addLayout(projectlistlayout)
         mainlayout.addLayout(packagelistlayout, 1)
         self.setLayout(mainlayout)
+
+        self.refreshProjectList()
     
     def enableRefresh(self, now=False):
         """
@@ -652,6 +1336,8 @@ class ResultWidget(QtGui.QWidget):
         """
         self.bs.apiurl = apiurl
         self.currentproject = ""
+        self.resultsproject = None
+        self.resultsstale = False
         self.refreshProjectList()
 
     def refreshProjectList(self, dummy=None):
@@ -660,38 +1346,123 @@ class ResultWidget(QtGui.QWidget):
         
         Refresh the project list from the current buildservice API
         """
-        if str(self.projectlistselector.currentText()) == "Watched Projects":
-            self.projectlistthread.watched = True
+        watched = str(self.projectlistselector.currentText()) == "Watched Projects"
+        listkey = (self.bs.apiurl, watched)
+        # Show the list retrieved last, or the cached one, until the live one
+        # arrives
+        self.projectlistlive = False
+        if listkey in self.projectlists:
+            self.showProjectList(listkey, self.projectlists[listkey])
         else:
-            self.projectlistthread.watched = False
+            self.scheduler.submit(getCachedProjectList, (self.bs, watched),
+                                  group='results.cachedprojectlist', priority=PRIORITY_INTERACTIVE,
+                                  callback=self.updateCachedProjectList, listkey=listkey)
         self.parent.statusBar().showMessage("Retrieving project list")
-        self.projectlistthread.start()
+        self.scheduler.submit(getProjectList, (self.bs, watched),
+                              key=('projectlist',) + listkey, group='results.projectlist',
+                              priority=PRIORITY_INTERACTIVE, callback=self.updateProjectList,
+                              listkey=listkey)
     
-    def updateProjectList(self):
+    def updateProjectList(self, request):
         """
-        updateProjectList()
+        updateProjectList(request)
         
-        Update project list from result in self.projectlistthread
+        Update project list from the result of a project list request
         """
         if self.viewable:
             self.parent.statusBar().clearMessage()
-        self.projectlistmodel.clear()
-        for project in sorted(self.projectlistthread.projects):
-            si = QtGui.QStandardItem(project)
-            si.setEditable(False)
-            self.projectlistmodel.appendRow(si)
-        self.projectlistmodel.setHeaderData(0, QtCore.Qt.Horizontal, QtCore.QVariant("Project"))
-        self.projecttreeview.sortByColumn(0, QtCore.Qt.AscendingOrder)
+        listkey = request.params['listkey']
+        self.projectlists[listkey] = request.result
+        self.projectlistlive = True
+        self.showProjectList(listkey, request.result)
+
+    def updateCachedProjectList(self, request):
+        """
+        updateCachedProjectList(request)
+        
+        Show the cached project list, unless the live one has arrived already
+        """
+        if request.result is not None and not self.projectlistlive:
+            self.showProjectList(request.params['listkey'], request.result)
+
+    def showProjectList(self, listkey, projects):
+        """
+        showProjectList(listkey, projects)
+        
+        Show the NameIndex of projects, which is the (apiurl, watched) list
+        listkey. A newer version of the list shown is applied as changes,
+        while another list replaces it. The first time a list is shown, the
+        last selected project is restored
+        """
+        self.projectlistmodel.setProjects(projects, diff=(listkey == self.projectlistkey))
+        if listkey != self.projectlistkey:
+            self.projectlistkey = listkey
+            row = self.projectlistmodel.rowOfProject(self.currentproject)
+            if row >= 0:
+                self.projecttreeview.setCurrentIndex(self.projectlistmodel.index(row, 0))
         if self.initialprojectrefresh:
             self.initialprojectrefresh = False
             if self.cfg.has_option('persistence', 'project'):
                 lastproject = self.cfg.get('persistence', 'project')
-                if lastproject in self.projectlistthread.projects:
-                    self.currentproject = lastproject
-                    self.targetselector.clear()
-                    self.targetselector.addItem("All")
-                    self.targetselector.addItems(self.bs.getTargets(lastproject))
-                    self.refreshPackageLists(lastproject)
+                if lastproject in projects:
+                    self.restoreProject(lastproject)
+
+    def restoreProject(self, project):
+        """
+        restoreProject(project)
+        
+        Make project current, showing its cached results as stale data until
+        the live results arrive
+        """
+        self.currentproject = project
+        self.refreshTargets(project)
+        cached = self.bs.cache.get(self.bs.apiurl, 'results', project)
+        if cached is not None:
+            self.resultmodel.setResults(ResultStore.load(cached), diff=False)
+            self.resultsproject = project
+            self.resultsstale = True
+            self.resizeColumns()
+            self.updateResultCounts()
+        self.refreshPackageLists(project)
+
+    def refreshTargets(self, project):
+        """
+        refreshTargets(project)
+        
+        Refresh the target selector for project, showing its cached targets
+        until the live ones arrive
+        """
+        self.showTargets(self.bs.cache.get(self.bs.apiurl, 'targets', project) or [])
+        self.scheduler.submit(getProjectTargets, (self.bs, project),
+                              key=('targets', self.bs.apiurl, project), group='results.targets',
+                              priority=PRIORITY_INTERACTIVE, callback=self.updateTargets,
+                              project=project)
+
+    def updateTargets(self, request):
+        """
+        updateTargets(request)
+        
+        Update the target selector from the result of a targets request
+        """
+        if request.params['project'] == self.currentproject:
+            self.showTargets(request.result)
+
+    def showTargets(self, targets):
+        """
+        showTargets(targets)
+        
+        Show targets in the target selector, keeping the selected target if it
+        is still there
+        """
+        shown = [str(self.targetselector.itemText(i)) for i in xrange(1, self.targetselector.count())]
+        if shown == list(targets):
+            return
+        current = str(self.targetselector.currentText())
+        self.targetselector.clear()
+        self.targetselector.addItem("All")
+        self.targetselector.addItems(targets)
+        if current in targets:
+            self.targetselector.setCurrentIndex(self.targetselector.findText(current))
 
     def refreshPackageLists(self, project):
         """
@@ -700,23 +1471,68 @@ class ResultWidget(QtGui.QWidget):
         Refresh the package lists to show results for the specified project
         """
         self.disableRefresh()
-        self.projectresultsthread.project = project
-        self.parent.statusBar().showMessage("Retrieving package results for %s" % project)
-        self.projectresultsthread.start()
+        if self.resultsstale:
+            self.parent.statusBar().showMessage("Showing cached results for %s, retrieving package results" % project)
+        else:
+            self.parent.statusBar().showMessage("Retrieving package results for %s" % project)
+        if project == self.resultsproject:
+            # Only skip unchanged results when they are the live ones already
+            # shown
+            self.scheduler.submit(getProjectResults, (self.bs, project, not self.resultsstale),
+                                  key=('results', self.bs.apiurl, project), group='results.results',
+                                  callback=self.updatePackageList, errback=self.packageListFailed,
+                                  project=project)
+        else:
+            # Show a new project target by target as its results arrive
+            self.resultmodel.setResults(ResultStore(), diff=False)
+            self.resultsproject = project
+            self.resultsstale = False
+            self.scheduler.submit(iterProjectResults, (self.bs, project),
+                                  key=('results', self.bs.apiurl, project, 'progressive'),
+                                  group='results.results', priority=PRIORITY_INTERACTIVE,
+                                  progress=self.addTargetResults, callback=self.updatePackageList,
+                                  errback=self.packageListFailed, project=project)
+
+    def addTargetResults(self, request, results):
+        """
+        addTargetResults(request, results)
+        
+        Add the (target, packages, codes, details) results of one target,
+        received from a progressive project results request
+        """
+        if request.params['project'] != self.resultsproject:
+            return
+        (target, packages, codes, details) = results
+        self.resultmodel.appendResults(target, packages, codes, details)
+        if self.resultmodel.columnCount() <= 2:
+            self.resultview.resizeColumnToContents(0)
+        self.resultview.resizeColumnToContents(self.resultmodel.columnCount() - 1)
+        self.updateResultCounts()
 
-    def updatePackageList(self):
+    def packageListFailed(self, request):
         """
-        updatePackageList()
+        packageListFailed(request)
         
-        Update package list data from result in self.projectresultsthread
+        Keep refreshing after a failed project results request
+        """
+        if self.viewable:
+            self.enableRefresh()
+
+    def updatePackageList(self, request):
+        """
+        updatePackageList(request)
+        
+        Update package list data from the result of a project results request
         """
         if self.viewable:
             self.parent.statusBar().clearMessage()
-        results = self.projectresultsthread.results
-        targets = self.projectresultsthread.targets
-        self.resultmodel.setResults(results, targets)
-        self.resizeColumns()
-        self.updateResultCounts()
+        results = request.result
+        if results is not None and results is not NOT_MODIFIED \
+           and request.params['project'] == self.resultsproject:
+            self.resultsstale = False
+            if self.resultmodel.setResults(results):
+                self.resizeColumns()
+                self.updateResultCounts()
         if self.viewable:
             self.enableRefresh()
 
@@ -727,12 +1543,18 @@ class ResultWidget(QtGui.QWidget):
         Set the current project to that represented by QModelIndex modelindex and refresh the
         package lists
         """
-        self.currentproject = str(self.projectlistmodel.data(modelindex, QtCore.Qt.DisplayRole).toString())
-        self.targetselector.clear()
-        self.targetselector.addItem("All")
-        self.targetselector.addItems(self.bs.getTargets(self.currentproject))
+        self.currentproject = self.projectlistmodel.projectFromRow(modelindex.row())
+        self.refreshTargets(self.currentproject)
         self.refreshPackageLists(self.currentproject)
     
+    def filterProjects(self, text):
+        """
+        filterProjects(text)
+        
+        Only show projects containing text
+        """
+        self.projectlistmodel.setFilter(str(text))
+
     def timerRefresh(self):
         """
         timerRefresh()
@@ -749,7 +1571,7 @@ class ResultWidget(QtGui.QWidget):
         Refresh the package info for the package represented by QModelIndex modelindex
         """
         # If we're streaming a log file, stop
-        self.streamtimer.stop()
+        self.logpoller.stop()
         tabname = self.tabs[self.resulttab.currentIndex()]
         column = modelindex.column()
         row = modelindex.row()
@@ -757,26 +1579,57 @@ class ResultWidget(QtGui.QWidget):
         if column > 0:
             statuscode = self.resultmodel._data(row, column)
             if statuscode in ("succeeded", "building", "failed"):
-                target = self.resultmodel.visibletargets[column-1]
+                target = self.resultmodel.targetFromColumn(column)
                 self.viewBuildOutput(target, package)
                 return
-        self.packagestatusthread.project = self.currentproject
-        self.packagestatusthread.package = package
+        status = self.packageStatus(package)
+        if status is not None:
+            self.showPackageInfo(package, status)
+            return
+        # Get the status of the neighbouring packages too, as they are likely
+        # to be clicked next
+        packages = [self.resultmodel.packageFromRow(r)
+                    for r in xrange(max(row - 25, 0), min(row + 25, self.resultmodel.rowCount()))]
         self.parent.statusBar().showMessage("Getting package status for %s" % package)
-        self.packagestatusthread.start()
+        self.scheduler.submit(self.bs.getPackagesStatus, (self.currentproject, packages, PACKAGESTATUS_MAXAGE),
+                              key=('packagestatus', self.bs.apiurl, self.currentproject, package),
+                              group='results.packageinfo', priority=PRIORITY_INTERACTIVE,
+                              callback=self.updatePackageInfo, project=self.currentproject, package=package)
         
-    def updatePackageInfo(self):
+    def packageStatus(self, package):
+        """
+        packageStatus(package) -> dict
+        
+        Returns the status of package in the current project from the loaded
+        results, or None if they do not include it
+        """
+        if self.resultsproject != self.currentproject:
+            return None
+        return self.resultmodel.store.packageStatus(package)
+
+    def updatePackageInfo(self, request):
         """
-        updatePackageInfo()
+        updatePackageInfo(request)
         
-        Update the pkginfo pane to the result from self.packagestatusthread
+        Update the pkginfo pane to the result of a package status request,
+        unless another project has been selected since it was made
         """
+        if request.params['project'] != self.currentproject:
+            return
         if self.viewable:
             self.parent.statusBar().clearMessage()
-        package = self.packagestatusthread.package
+        package = request.params['package']
+        self.showPackageInfo(package, request.result[package])
+
+    def showPackageInfo(self, package, status):
+        """
+        showPackageInfo(package, status)
+        
+        Show the status of package, as returned by BuildService.getPackageStatus(),
+        in the pkginfo pane
+        """
         pitext = "<h2>%s</h2>" % package
         pitext += "<table width='90%'>"
-        status = self.packagestatusthread.status
         for target in sorted(status.keys()):
             statustext = status[target]
             code = statustext.split(':')[0]
@@ -802,8 +1655,18 @@ class ResultWidget(QtGui.QWidget):
         
         pitext += "<p><a href='commitlog,%s'><b>commitlog</b></a></p>" % package
         
-        self.packageinfo.setWordWrapMode(QtGui.QTextOption.WordWrap)
+        self.setPackageInfo(pitext)
+
+    def setPackageInfo(self, pitext):
+        """
+        setPackageInfo(pitext)
+        
+        Show the HTML text pitext in the package info pane
+        """
+        self.logpoller.stop()
+        self.logview.clear()
         self.packageinfo.setText(pitext)
+        self.infostack.setCurrentWidget(self.packageinfo)
 
     def infoClick(self, url):
         """
@@ -829,8 +1692,20 @@ class ResultWidget(QtGui.QWidget):
         
         View binaries for target and package
         """
+        self.commands.run("Getting binaries of %s for %s" % (package, target),
+                          self.bs.getBinaryList, (self.currentproject, target, package),
+                          group='results.packageinfo', callback=self.showBinaries,
+                          target=target, package=package)
+
+    def showBinaries(self, request):
+        """
+        showBinaries(request)
+        
+        Show the result of a binary list request in the package info pane
+        """
+        (target, package) = (request.params['target'], request.params['package'])
         pitext = "<h2>%s binaries for %s</h2>" % (package, target)
-        binaries = self.bs.getBinaryList(self.currentproject, target, package)
+        binaries = request.result
         if binaries:
             pitext += "<table>"
             for binary in sorted(binaries):
@@ -839,8 +1714,7 @@ class ResultWidget(QtGui.QWidget):
         else:
             pitext += "<b>No binaries</b>"
 
-        self.packageinfo.setWordWrapMode(QtGui.QTextOption.WordWrap)
-        self.packageinfo.setText(pitext)
+        self.setPackageInfo(pitext)
     
     def getBinary(self, target, package, file):
         """
@@ -853,12 +1727,27 @@ class ResultWidget(QtGui.QWidget):
                                                  os.path.join(os.environ['HOME'], file),
                                                  "RPM Files (*.rpm);;All Files (*.*)")
         if path:
-            try:
-                self.bs.getBinary(self.currentproject, target, package, file, path)
-            except Exception, e:
-                QtGui.QMessageBox.critical(self, "Binary Save Error",
-                                                 "Could not save binary to %s: %s" % (path, e))
-                raise
+            path = str(path)
+            self.commands.run("Saving %s" % file, self.bs.getBinary,
+                              (self.currentproject, target, package, file, path),
+                              callback=self.binarySaved, errback=self.binarySaveFailed, path=path)
+
+    def binarySaved(self, request):
+        """
+        binarySaved(request)
+        
+        Report a saved binary in the status bar
+        """
+        self.parent.statusBar().showMessage("Saved %s" % request.params['path'], 5000)
+
+    def binarySaveFailed(self, request):
+        """
+        binarySaveFailed(request)
+        
+        Report a failed binary download
+        """
+        QtGui.QMessageBox.critical(self, "Binary Save Error",
+                                   "Could not save binary to %s: %s" % (request.params['path'], request.error))
 
     def viewBuildHistory(self, target, package):
         """
@@ -866,8 +1755,20 @@ class ResultWidget(QtGui.QWidget):
         
         View build history of package for target
         """
+        self.commands.run("Getting build history of %s for %s" % (package, target),
+                          self.bs.getBuildHistory, (self.currentproject, package, target),
+                          group='results.packageinfo', callback=self.showBuildHistory,
+                          target=target, package=package)
+
+    def showBuildHistory(self, request):
+        """
+        showBuildHistory(request)
+        
+        Show the result of a build history request in the package info pane
+        """
+        (target, package) = (request.params['target'], request.params['package'])
         pitext = "<h2>Build History of %s for %s</h2>" % (package, target)
-        history = self.bs.getBuildHistory(self.currentproject, package, target)
+        history = request.result
         
         if history:
             pitext += "<table width='90%'><tr><td><b>Time</b></td><td><b>Source MD5</b></td><td><b>Revision</b></td><td><b>Version-Release.Buildcount</b></td></tr>"
@@ -878,8 +1779,7 @@ class ResultWidget(QtGui.QWidget):
         else:
             pitext += "<b>No history</b>"
 
-        self.packageinfo.setWordWrapMode(QtGui.QTextOption.WordWrap)
-        self.packageinfo.setText(pitext)
+        self.setPackageInfo(pitext)
 
     def viewCommitLog(self, package):
         """
@@ -887,8 +1787,20 @@ class ResultWidget(QtGui.QWidget):
         
         View commit log of package
         """
+        self.commands.run("Getting commit log of %s" % package,
+                          self.bs.getCommitLog, (self.currentproject, package),
+                          group='results.packageinfo', callback=self.showCommitLog,
+                          package=package)
+
+    def showCommitLog(self, request):
+        """
+        showCommitLog(request)
+        
+        Show the result of a commit log request in the package info pane
+        """
+        package = request.params['package']
         pitext = "<h2>Commit Log of %s</h2>" % package
-        commitlog = self.bs.getCommitLog(self.currentproject, package)
+        commitlog = request.result
         
         if commitlog:            
             for entry in commitlog:
@@ -896,8 +1808,7 @@ class ResultWidget(QtGui.QWidget):
         else:
             pitext += "<b>No log</b>"
 
-        self.packageinfo.setWordWrapMode(QtGui.QTextOption.WordWrap)
-        self.packageinfo.setText(pitext)
+        self.setPackageInfo(pitext)
 
     def viewBuildOutput(self, target, package):
         """
@@ -906,52 +1817,104 @@ class ResultWidget(QtGui.QWidget):
         Show build output for target and package. If the package is currently
         building, stream the output until it is finished
         """
-        self.packageinfo.clear()
-        # For some reason, the font is set to whatever the calling link had. Argh
-        self.packageinfo.setCurrentFont(QtGui.QFont("Bitstream Vera Sans Mono", 7))
-        self.packageinfo.setTextColor(QtGui.QColor('black'))
-        self.packageinfo.setWordWrapMode(QtGui.QTextOption.NoWrap)
+        # Package info still being retrieved would replace the log
+        self.scheduler.cancelGroup('results.packageinfo')
+        self.logview.clear()
+        self.infostack.setCurrentWidget(self.logview)
         
-        self.buildlogthread.project = self.currentproject
-        self.buildlogthread.target = target
-        self.buildlogthread.package = package
-        self.buildlogthread.offset = 0
-
-        if self.bs.getPackageStatus(self.currentproject, package)[target].startswith('building'):
-            self.buildlogthread.live = True
+        # Follow the log unless the loaded results show the build has ended.
+        # The log poller stops following once the build is over anyway
+        status = self.packageStatus(package)
+        if status is not None and target in status and not status[target].startswith('building'):
+            live = False
         else:
-            self.buildlogthread.live = False
+            live = True
+        # A streaming log follows its end, finished logs only do so when done
+        # and the autoscroll option is set
+        self.logview.setAutoScroll(live)
         self.parent.statusBar().showMessage("Retrieving build log for %s" % package)
-        self.requestBuildOutput()
+        self.logpoller.start(self.currentproject, target, package, live)
     
-    def requestBuildOutput(self):
+    def updateBuildOutput(self, chunk):
         """
-        requestBuildOutput()
+        updateBuildOutput(chunk)
         
-        Send request to update streaming build output, based on existing buildlogthread parameters
+        Append a chunk of build output
         """
-        self.buildlogthread.start()
-    
-    def updateBuildOutput(self):
+        if self.viewable:
+            self.parent.statusBar().clearMessage()
+        self.logview.appendText(chunk)
+
+    def buildOutputFinished(self):
         """
-        updateBuildOutput()
+        buildOutputFinished()
         
-        Update the build output
+        Report the end of the build output, and store logs that were
+        streamed
         """
+        poller = self.logpoller
+        if poller.streamed:
+            self.scheduler.submit(storeLog, (self.bs, poller.project, poller.target, poller.package,
+                                             self.logview.logBuffer()))
+        elif self.cfg.getboolean('general', 'autoscroll'):
+            self.logview.scrollToEnd()
         if self.viewable:
-            self.parent.statusBar().clearMessage()
-        self.streamtimer.stop()
-        if self.buildlogthread.live:
-            log_chunk = self.buildlogthread.log_chunk
-            self.buildlogthread.offset += len(log_chunk)
-            self.packageinfo.append(log_chunk.strip())
-            if not len(log_chunk) == 0 and self.viewable:
-                self.streamtimer.start(1000)
-        else:
-            self.packageinfo.setPlainText(self.buildlogthread.log_chunk)
-            if self.cfg.getboolean('general', 'autoscroll'):
-                self.packageinfo.moveCursor(QtGui.QTextCursor.End)
+            stats = self.logpoller.stats()
+            self.parent.statusBar().showMessage("Build log for %s complete: %d bytes in %d requests" % (self.logpoller.package,
+                                                                                                    stats['bytes'],
+                                                                                                    stats['requests']),
+                                                5000)
+
+    def buildOutputFailed(self, error):
+        """
+        buildOutputFailed(error)
+        
+        Report a build log that could not be retrieved
+        """
+        if self.viewable:
+            self.parent.statusBar().showMessage("Could not retrieve build log for %s: %s" % (self.logpoller.package, error),
+                                                10000)
     
+    def fetchFailedLogs(self):
+        """
+        fetchFailedLogs()
+        
+        Retrieve the logs of all failed builds of the current project and
+        show a summary of their errors
+        """
+        if not self.currentproject or self.resultsproject != self.currentproject:
+            return
+        cells = self.resultmodel.store.cellsWithStatus('failed')
+        self.parent.statusBar().showMessage("Retrieving %d failed build logs of %s" % (len(cells), self.currentproject))
+        self.logfetcher.start(self.currentproject, cells)
+
+    def failedLogsProgress(self, done, total):
+        """
+        failedLogsProgress(done, total)
+        
+        Show the progress of failed build log retrieval
+        """
+        self.parent.statusBar().showMessage("Retrieved %d of %d failed build logs of %s" % (done, total,
+                                                                                          self.logfetcher.project))
+
+    def failedLogsFetched(self, project, results):
+        """
+        failedLogsFetched(project, results)
+        
+        Show the summary of the failed builds of project
+        """
+        self.parent.statusBar().clearMessage()
+        FailureSummaryDialog(self, project, results).show()
+
+    def searchBuildLogs(self):
+        """
+        searchBuildLogs()
+        
+        Open a dialog to search the stored build logs of the current project
+        """
+        if self.currentproject:
+            LogSearchDialog(self).show()
+
     def filterPackages(self, filterstring):
         """
         filterPackages(filterstring)
@@ -0,0 +1,372 @@
+#
+# resultstore.py - Compact package result storage for Yabsc
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+import threading
+from array import array
+
+from index import TrigramIndex
+
+#
+# Status code interning
+#
+# Status strings are interned to small integers shared by every store, so
+# cells fit in byte arrays and can be compared across stores without any
+# string operations. Code 0 is reserved for a missing result.
+#
+statusnames = ['']
+statuscodes = {'': 0}
+_statuslock = threading.Lock()
+
+def statusCode(status):
+    """
+    statusCode(status) -> int
+
+    Returns the interned integer code for the status string 'status'
+    """
+    try:
+        return statuscodes[status]
+    except KeyError:
+        _statuslock.acquire()
+        try:
+            if status not in statuscodes:
+                statuscodes[status] = len(statusnames)
+                statusnames.append(status)
+            return statuscodes[status]
+        finally:
+            _statuslock.release()
+
+def statusName(code):
+    """
+    statusName(code) -> str
+
+    Returns the status string for the interned integer 'code'
+    """
+    return statusnames[code]
+
+
+#
+# Row bitsets
+#
+# Sets of package rows are held as long integers with bit n set for row n, so
+# unions, intersections and counts over whole projects are single operations.
+#
+def rowsToBits(rows, size):
+    """
+    rowsToBits(rows, size) -> long
+
+    Returns a bitset with the bits for each of 'rows' set. 'size' is the total
+    number of rows
+    """
+    b = bytearray((size + 7) >> 3)
+    for row in rows:
+        b[row >> 3] |= 1 << (row & 7)
+    b.reverse()
+    return long(str(b).encode('hex') or '0', 16)
+
+def bitsToFlags(bits, size):
+    """
+    bitsToFlags(bits, size) -> str
+
+    Returns a string of length 'size' with '1' at the position of every row
+    set in 'bits', and '0' elsewhere
+    """
+    flags = bin(bits)[:1:-1]
+    return flags + '0' * (size - len(flags))
+
+def bitCount(bits):
+    """
+    bitCount(bits) -> int
+
+    Returns the number of rows set in 'bits'
+    """
+    return bin(bits).count('1')
+
+
+class ResultStore(object):
+    """
+    ResultStore(targets=())
+
+    Compact store for the results of a project. Each target (column) holds an
+    array of status codes indexed by package row. Rows are kept in the order
+    packages were added; sortedRows() gives them ordered by package name.
+    The few results with details text keep it in 'details', keyed by (row,
+    column)
+    """
+    def __init__(self, targets=()):
+        self.packages = []
+        self.packageindex = {}
+        self.targets = []
+        self.targetindex = {}
+        self.columns = []
+        self.details = {}
+        self._sortedrows = None
+        self._columnbits = {}
+        self._search = None
+        for target in targets:
+            self.addTarget(target)
+
+    def fromResults(cls, results, targets):
+        """
+        ResultStore.fromResults(results, targets) -> ResultStore
+
+        Build a store from a dict of package names to lists of status strings,
+        and the list of targets corresponding to the status lists
+        """
+        store = cls(targets)
+        for package in results:
+            row = store.addPackage(package)
+            for (column, status) in enumerate(results[package]):
+                store.columns[column][row] = statusCode(status)
+        return store
+    fromResults = classmethod(fromResults)
+
+    def dump(self):
+        """
+        dump() -> tuple
+
+        Returns the contents of the store as a tuple of basic types, suitable
+        for marshal. See load()
+        """
+        return (list(statusnames), self.packages, self.targets,
+                [column.tostring() for column in self.columns],
+                [(row, column, text) for ((row, column), text) in self.details.iteritems()])
+
+    def load(cls, data):
+        """
+        ResultStore.load(data) -> ResultStore
+
+        Build a store from the output of dump(), possibly from another process
+        with different status codes
+        """
+        (names, packages, targets, columns, details) = data
+        # Translation table from the dumped status codes to ours
+        table = [chr(i) for i in range(256)]
+        for (code, name) in enumerate(names):
+            table[code] = chr(statusCode(name))
+        table = ''.join(table)
+        store = cls()
+        store.packages = list(packages)
+        store.packageindex = dict([(package, row) for (row, package) in enumerate(packages)])
+        store.targets = list(targets)
+        store.targetindex = dict([(target, column) for (column, target) in enumerate(targets)])
+        store.columns = [array('B', column.translate(table)) for column in columns]
+        store.details = dict([((row, column), text) for (row, column, text) in details])
+        return store
+    load = classmethod(load)
+
+    def __len__(self):
+        return len(self.packages)
+
+    def addTarget(self, target):
+        """
+        addTarget(target) -> int
+
+        Add a target column with no results, and return its column index
+        """
+        column = len(self.targets)
+        self.targets.append(target)
+        self.targetindex[target] = column
+        self.columns.append(array('B', [0]) * len(self.packages))
+        return column
+
+    def addPackage(self, package):
+        """
+        addPackage(package) -> int
+
+        Add a package row with no results, and return its row index. If the
+        package already exists, its current row is returned
+        """
+        try:
+            return self.packageindex[package]
+        except KeyError:
+            row = len(self.packages)
+            self.packages.append(package)
+            self.packageindex[package] = row
+            for column in self.columns:
+                column.append(0)
+            self._sortedrows = None
+            self._columnbits = {}
+            self._search = None
+            return row
+
+    def addResults(self, target, packages, codes, details=None):
+        """
+        addResults(target, packages, codes, details=None) -> int
+
+        Add a target column holding the status 'codes' of 'packages', adding
+        any packages that are not in the store yet. 'details' is a dict of
+        package names to the details text of their results. Returns the
+        column index
+        """
+        column = self.addTarget(target)
+        cells = self.columns[column]
+        addPackage = self.addPackage
+        for (package, code) in zip(packages, codes):
+            cells[addPackage(package)] = code
+        if details:
+            for (package, text) in details.iteritems():
+                self.details[(self.packageindex[package], column)] = text
+        return column
+
+    def copy(self):
+        """
+        copy() -> ResultStore
+
+        Returns a copy of the store that can be changed independently
+        """
+        store = ResultStore()
+        store.packages = list(self.packages)
+        store.packageindex = self.packageindex.copy()
+        store.targets = list(self.targets)
+        store.targetindex = self.targetindex.copy()
+        store.columns = [array('B', column) for column in self.columns]
+        store.details = self.details.copy()
+        store._sortedrows = self._sortedrows
+        store._search = self._search
+        return store
+
+    def setResult(self, row, column, status):
+        """
+        setResult(row, column, status)
+
+        Set the result at 'row' and 'column' to the status string 'status'
+        """
+        self.columns[column][row] = statusCode(status)
+        self.details.pop((row, column), None)
+        self._columnbits.pop(column, None)
+
+    def code(self, row, column):
+        """
+        code(row, column) -> int
+
+        Returns the status code at 'row' and 'column'
+        """
+        return self.columns[column][row]
+
+    def result(self, row, column):
+        """
+        result(row, column) -> str
+
+        Returns the status string at 'row' and 'column'
+        """
+        return statusnames[self.columns[column][row]]
+
+    def packageStatus(self, package):
+        """
+        packageStatus(package) -> dict
+
+        Returns the status of 'package' in the same form as
+        BuildService.getPackageStatus(), or None if the package is not in the
+        store
+        """
+        row = self.packageindex.get(package)
+        if row is None:
+            return None
+        status = {}
+        for (column, target) in enumerate(self.targets):
+            code = self.columns[column][row]
+            if code:
+                text = statusnames[code]
+                if (row, column) in self.details:
+                    text += ': ' + self.details[(row, column)]
+                status[target] = text
+        return status
+
+    def sortedRows(self):
+        """
+        sortedRows() -> list
+
+        Returns the package rows ordered by package name
+        """
+        if self._sortedrows is None:
+            packages = self.packages
+            self._sortedrows = sorted(xrange(len(packages)), key=packages.__getitem__)
+        return self._sortedrows
+
+    def packageSearch(self):
+        """
+        packageSearch() -> TrigramIndex
+
+        Returns a search index of the package names in the order of
+        sortedRows(), so position n in a search result is the package at row
+        sortedRows()[n]. Its trigram index is built on first use, and shared
+        with copies of the store until packages are added
+        """
+        if self._search is None:
+            packages = self.packages
+            self._search = TrigramIndex([packages[row] for row in self.sortedRows()])
+        return self._search
+
+    def allBits(self):
+        """
+        allBits() -> long
+
+        Returns a bitset with every package row set
+        """
+        return (1L << len(self.packages)) - 1
+
+    def columnBits(self, column):
+        """
+        columnBits(column) -> dict
+
+        Returns a dict of status codes to bitsets of the rows with that status
+        in 'column'. The index is built on first use and kept until the column
+        changes
+        """
+        try:
+            return self._columnbits[column]
+        except KeyError:
+            rowsbycode = {}
+            for (row, code) in enumerate(self.columns[column]):
+                try:
+                    rowsbycode[code].append(row)
+                except KeyError:
+                    rowsbycode[code] = [row]
+            size = len(self.packages)
+            bits = dict([(code, rowsToBits(rows, size)) for (code, rows) in rowsbycode.iteritems()])
+            self._columnbits[column] = bits
+            return bits
+
+    def cellsWithStatus(self, status):
+        """
+        cellsWithStatus(status) -> list
+
+        Returns the (package, target) pairs with the status string 'status'
+        """
+        code = statuscodes.get(status)
+        if code is None:
+            return []
+        cells = []
+        packages = self.packages
+        for (target, column) in zip(self.targets, self.columns):
+            cells.extend([(packages[row], target) for (row, c) in enumerate(column) if c == code])
+        return cells
+
+    def packageTargetsWithStatus(self, package, status):
+        """
+        packageTargetsWithStatus(package, status) -> list
+
+        Returns the targets for which 'package' has the status string 'status'
+        """
+        row = self.packageindex.get(package)
+        code = statuscodes.get(status)
+        if row is None or code is None:
+            return []
+        return [self.targets[i] for (i, column) in enumerate(self.columns) if column[row] == code]
@@ -0,0 +1,278 @@
+#
+# scheduler.py - Background request scheduler for Yabsc
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+import heapq
+import itertools
+import sys
+import threading
+import traceback
+import types
+from PyQt4 import QtCore
+
+# Request priorities. Lower values run first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+class Request(object):
+    """
+    Request(func, args, kwargs, key, group, priority, params)
+
+    A call to be run by a RequestScheduler. When it has run, 'result' holds
+    the return value of the call, or 'error' and 'traceback' the exception it
+    raised. 'params' is a dict of parameters given by the submitter, for use
+    by the callbacks
+    """
+    def __init__(self, func, args, kwargs, key, group, priority, params):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.group = group
+        self.priority = priority
+        self.params = params
+        self.callbacks = []
+        self.errbacks = []
+        self.progressbacks = []
+        self.state = 'queued'
+        self.cancelled = False
+        self.result = None
+        self.error = None
+        self.traceback = None
+
+    def cancel(self):
+        """
+        cancel()
+
+        Cancel the request. A queued request will not run, and the callbacks
+        of a running one will not be called
+        """
+        self.cancelled = True
+
+
+class RequestScheduler(QtCore.QObject):
+    """
+    RequestScheduler(workers=4)
+
+    Runs calls, usually BuildService requests, on a bounded pool of worker
+    threads, and delivers their results to callbacks in the GUI thread.
+
+    Requests with the same key are run once, with the callbacks of every
+    submitter. Submitting a request with a group cancels the other
+    outstanding requests of that group, which is used for requests superseded
+    by a newer one, such as the results of the previously selected project.
+    Queued requests run in order of priority.
+
+    Emits requestFinished(request) for every completed request and
+    requestFailed(request) for every one that raised an exception
+    """
+    def __init__(self, workers=4):
+        QtCore.QObject.__init__(self)
+        self.queue = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.requests = {}
+        self.groups = {}
+        self.stopping = False
+        QtCore.QObject.connect(self, QtCore.SIGNAL("_requestDone"), self._requestDone)
+        QtCore.QObject.connect(self, QtCore.SIGNAL("_requestProgress"), self._requestProgress)
+        self.threads = []
+        for i in xrange(workers):
+            thread = threading.Thread(target=self._work, name='yabsc-worker-%d' % i)
+            thread.setDaemon(True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, func, args=(), kwargs=None, key=None, group=None,
+               priority=PRIORITY_BACKGROUND, callback=None, errback=None,
+               progress=None, **params):
+        """
+        submit(func, args=(), kwargs=None, key=None, group=None,
+               priority=PRIORITY_BACKGROUND, callback=None, errback=None,
+               progress=None, **params) -> Request
+
+        Run func(*args, **kwargs) in a worker thread. When it returns,
+        callback(request) is called in the GUI thread, or errback(request) if
+        it raised an exception. If func returns a generator, it is iterated in
+        the worker thread and progress(request, item) is called for each item.
+        Any other keyword arguments are stored in request.params
+        """
+        if kwargs is None:
+            kwargs = {}
+        self.condition.acquire()
+        try:
+            request = None
+            if key is not None:
+                request = self.requests.get(key)
+                if request and request.cancelled:
+                    request = None
+            if request is None:
+                request = Request(func, args, kwargs, key, group, priority, params)
+                if key is not None:
+                    self.requests[key] = request
+                heapq.heappush(self.queue, (priority, self.counter.next(), request))
+                self.condition.notify()
+            elif priority < request.priority and request.state == 'queued':
+                # Requeue at the higher priority. The old entry is skipped
+                request.priority = priority
+                heapq.heappush(self.queue, (priority, self.counter.next(), request))
+                self.condition.notify()
+
+            if group is not None:
+                for other in self.groups.get(group, []):
+                    if other is not request:
+                        other.cancel()
+                self.groups[group] = [request]
+        finally:
+            self.condition.release()
+
+        if callback:
+            request.callbacks.append(callback)
+        if errback:
+            request.errbacks.append(errback)
+        if progress:
+            request.progressbacks.append(progress)
+        return request
+
+    def cancelGroup(self, group):
+        """
+        cancelGroup(group)
+
+        Cancel every outstanding request of group
+        """
+        self.condition.acquire()
+        try:
+            for request in self.groups.pop(group, []):
+                request.cancel()
+        finally:
+            self.condition.release()
+
+    def shutdown(self):
+        """
+        shutdown()
+
+        Cancel all requests and stop the worker threads once their current
+        request is done
+        """
+        self.condition.acquire()
+        try:
+            self.stopping = True
+            for (priority, n, request) in self.queue:
+                request.cancel()
+            self.queue = []
+            self.condition.notifyAll()
+        finally:
+            self.condition.release()
+
+    def _next(self):
+        """
+        _next() -> Request
+
+        Wait for the next request to run. Returns None when shutting down
+        """
+        self.condition.acquire()
+        try:
+            while True:
+                while not self.queue and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    return None
+                (priority, n, request) = heapq.heappop(self.queue)
+                if request.state != 'queued':
+                    continue
+                if request.cancelled:
+                    self._forget(request)
+                    continue
+                request.state = 'running'
+                return request
+        finally:
+            self.condition.release()
+
+    def _forget(self, request):
+        """
+        _forget(request)
+
+        Remove a request from the key and group tables. The condition must be
+        held
+        """
+        if request.key is not None and self.requests.get(request.key) is request:
+            del self.requests[request.key]
+        if request.group is not None:
+            members = self.groups.get(request.group)
+            if members and request in members:
+                members.remove(request)
+
+    def _work(self):
+        """
+        _work()
+
+        Worker thread main loop
+        """
+        while True:
+            request = self._next()
+            if request is None:
+                return
+            try:
+                result = request.func(*request.args, **request.kwargs)
+                if isinstance(result, types.GeneratorType):
+                    for item in result:
+                        if request.cancelled:
+                            result.close()
+                            break
+                        self.emit(QtCore.SIGNAL("_requestProgress"), request, item)
+                    result = None
+                request.result = result
+            except Exception, e:
+                request.error = e
+                request.traceback = traceback.format_exc()
+            self.condition.acquire()
+            try:
+                request.state = 'done'
+                self._forget(request)
+            finally:
+                self.condition.release()
+            self.emit(QtCore.SIGNAL("_requestDone"), request)
+
+    def _requestProgress(self, request, item):
+        """
+        _requestProgress(request, item)
+
+        Deliver an item produced by a request, in the GUI thread
+        """
+        if not request.cancelled:
+            for progress in request.progressbacks:
+                progress(request, item)
+
+    def _requestDone(self, request):
+        """
+        _requestDone(request)
+
+        Deliver the outcome of a request, in the GUI thread
+        """
+        if request.cancelled:
+            return
+        if request.error is not None:
+            sys.stderr.write(request.traceback)
+            for errback in request.errbacks:
+                errback(request)
+            self.emit(QtCore.SIGNAL("requestFailed"), request)
+        else:
+            for callback in request.callbacks:
+                callback(request)
+            self.emit(QtCore.SIGNAL("requestFinished"), request)
@@ -19,6 +19,9 @@
 from PyQt4 import QtGui, QtCore
 from osc import conf, core
 
+from buildservice import NOT_MODIFIED, WatchedProjectsMixin
+from index import RecordIndex, intersect
+
 class SubmitRequestModel(QtCore.QAbstractItemModel):
     """SubmitRequestModel(bs)
     
@@ -28,11 +31,14 @@ class SubmitRequestModel(QtCore.QAbstractItemModel):
         QtCore.QAbstractItemModel.__init__(self)
         self.bs = bs
         self.submitrequests = []
+        self.requestindex = self._index([])
+        self.statecounts = {}
         self.visiblesubmitrequests = []
         self.statefilter = ""
         self.packagefilter = ""
         self.srcprojectfilter = ""
         self.dstprojectfilter = ""
+        self.watchedprojects = set()
         self.columnmap = ('id', 'state', 'srcproject', 'srcpackage', 'dstproject', 'dstpackage', 'comment')
     
     def setSubmitRequests(self, submitrequests):
@@ -42,7 +48,17 @@ class SubmitRequestModel(QtCore.QAbstractItemModel):
         Set the submitrequests list of the model, as returned from BuildService.getSubmitRequests()
         """
         self.submitrequests = submitrequests
+        self.requestindex = self._index(submitrequests)
+        self.statecounts = self.requestindex.histogram('state')
         self.updateVisibleSubmitrequests()
+
+    def _index(self, submitrequests):
+        """
+        _index(submitrequests) -> RecordIndex
+        
+        Returns the filtering index of a list of submitrequests
+        """
+        return RecordIndex(submitrequests, ('state', 'srcproject', 'dstproject'), ('srcpackage', 'dstpackage'))
     
     def _data(self, row, column):
         """
@@ -116,25 +132,30 @@ class SubmitRequestModel(QtCore.QAbstractItemModel):
         """
         updateVisibleSubmitrequests(reset=True)
         
-        Update the list of visible submitrequests
+        Update the list of visible submitrequests, from the intersection of
+        the submitrequests matching each filter in the request index
         """
-        self.visiblesubmitrequests = self.submitrequests
+        index = self.requestindex
+        positions = []
         
         if self.statefilter:
-            self.visiblesubmitrequests = [s for s in self.visiblesubmitrequests if s['state'] == self.statefilter]
+            positions.append(index.matching('state', [self.statefilter]))
         
         if self.packagefilter:
-            self.visiblesubmitrequests = [s for s in self.visiblesubmitrequests if (self.packagefilter in s['srcpackage'] or self.packagefilter in s['dstpackage'])]
+            positions.append(index.search(('srcpackage', 'dstpackage'), self.packagefilter))
         
-        if 'Watched' in (self.srcprojectfilter, self.dstprojectfilter):
-            watchedprojects = self.bs.getWatchedProjectList()
-
         for (filter, key) in ((self.srcprojectfilter, 'srcproject'), (self.dstprojectfilter, 'dstproject')):
             if filter:
                 if filter == 'Watched':
-                    self.visiblesubmitrequests = [s for s in self.visiblesubmitrequests if s[key] in watchedprojects]
+                    positions.append(index.matching(key, self.watchedprojects))
                 else:
-                    self.visiblesubmitrequests = [s for s in self.visiblesubmitrequests if s[key] == filter]
+                    positions.append(index.matching(key, [filter]))
+
+        if positions:
+            submitrequests = self.submitrequests
+            self.visiblesubmitrequests = [submitrequests[i] for i in intersect(positions, len(submitrequests))]
+        else:
+            self.visiblesubmitrequests = self.submitrequests
 
         if reset:
             self.reset()
@@ -187,6 +208,16 @@ class SubmitRequestModel(QtCore.QAbstractItemModel):
             self.dstprojectfilter = project
         self.updateVisibleSubmitrequests()
 
+    def setWatchedProjects(self, projects):
+        """
+        setWatchedProjects(projects)
+        
+        Set the projects shown by the 'Watched' project filters
+        """
+        self.watchedprojects = set(projects)
+        if 'Watched' in (self.srcprojectfilter, self.dstprojectfilter):
+            self.updateVisibleSubmitrequests()
+
     def numRequestsWithState(self, state):
         """
         numRequestsWithState(state)
@@ -196,23 +227,9 @@ class SubmitRequestModel(QtCore.QAbstractItemModel):
         state = state.lower()
         if state == 'all':
             return len(self.submitrequests)
-        return len([s for s in self.submitrequests if s['state'] == state])
-
-class SubmitRequestThread(QtCore.QThread):
-    """
-    SubmitRequestThread(bs)
-    
-    Thread for retrieving worker status. Requires a BuildService object
-    """
-    def __init__(self, bs):
-        QtCore.QThread.__init__(self)
-        self.bs = bs
-        self.workers = []
-    
-    def run(self):
-        self.submitrequests = self.bs.getSubmitRequests()
+        return self.statecounts.get(state, 0)
 
-class SubmitRequestWidget(QtGui.QWidget):
+class SubmitRequestWidget(QtGui.QWidget, WatchedProjectsMixin):
     """
     SubmitRequestWidget(bs, cfg)
     
@@ -230,6 +247,9 @@ class SubmitRequestWidget(QtGui.QWidget):
         # Config object
         self.cfg = cfg
 
+        # Request scheduler
+        self.scheduler = parent.scheduler
+
         # Filter widgets
         searchlabel = QtGui.QLabel("Search")
         self.searchedit = QtGui.QLineEdit()
@@ -261,12 +281,11 @@ class SubmitRequestWidget(QtGui.QWidget):
         self.srview.setRootIsDecorated(False)
         self.srvmodel = SubmitRequestModel(self.bs)
         self.srview.setModel(self.srvmodel)
+        QtCore.QObject.connect(self.bs, QtCore.SIGNAL("watchedProjectsChanged"), self.watchedProjectsChanged)
 
         # Data refresh
         self.refreshtimer = QtCore.QTimer()
         QtCore.QObject.connect(self.refreshtimer, QtCore.SIGNAL("timeout()"), self.refreshSubmitRequests)
-        self.bsthread = SubmitRequestThread(self.bs)
-        QtCore.QObject.connect(self.bsthread, QtCore.SIGNAL("finished()"), self.updateSubmitRequestList)
 
         # Layout
         filterlayout = QtGui.QHBoxLayout()
@@ -309,27 +328,44 @@ class SubmitRequestWidget(QtGui.QWidget):
         Set the buildservice API URL
         """
         self.bs.apiurl = apiurl
-        self.refreshSubmitRequests()
+        self.refreshSubmitRequests(ifchanged=False)
 
-    def refreshSubmitRequests(self):
+    def refreshSubmitRequests(self, ifchanged=True):
         """
-        refreshWorkerLists()
+        refreshSubmitRequests(ifchanged=True)
         
-        Refresh the worker lists
+        Refresh the submit request list. If ifchanged is True, the list is
+        only updated if the requests changed since the last refresh
         """
         self.disableRefresh()
         self.parent.statusBar().showMessage("Retrieving submit requests")
-        self.bsthread.start()
+        self.scheduler.submit(self.bs.getSubmitRequests, (ifchanged,),
+                              group='submitrequests', callback=self.updateSubmitRequestList,
+                              errback=self.submitRequestsFailed)
     
-    def updateSubmitRequestList(self):
+    def submitRequestsFailed(self, request):
+        """
+        submitRequestsFailed(request)
+        
+        Keep refreshing after a failed submit request list request
         """
-        updateSubmitRequestList()
+        if self.viewable:
+            self.enableRefresh()
+
+    def updateSubmitRequestList(self, request):
+        """
+        updateSubmitRequestList(request)
         
-        Update worker lists from result in self.bsthread
+        Update submit request lists from the result of a submit request list
+        request
         """
         if self.viewable:
             self.parent.statusBar().clearMessage()
-        submitrequests = self.bsthread.submitrequests
+        submitrequests = request.result
+        if submitrequests is NOT_MODIFIED:
+            if self.viewable:
+                self.enableRefresh()
+            return
         self.srvmodel.setSubmitRequests(submitrequests)
 
         # Update project filter dropboxes
@@ -401,6 +437,8 @@ class SubmitRequestWidget(QtGui.QWidget):
         are shown. If 'project' is 'Watched', all watched projects are
         shown
         """
+        if project == 'Watched':
+            self.refreshWatchedProjects()
         self.srvmodel.setSourceProjectFilter(str(project))
 
     def filterDestinationProjects(self, project):
@@ -411,4 +449,15 @@ class SubmitRequestWidget(QtGui.QWidget):
         are shown. If 'project' is 'Watched', all watched projects are
         shown
         """
+        if project == 'Watched':
+            self.refreshWatchedProjects()
         self.srvmodel.setDestinationProjectFilter(str(project))
+
+    def setWatchedProjects(self, projects):
+        """
+        setWatchedProjects(projects)
+        
+        Use projects as the watched projects of the project filters. See
+        WatchedProjectsMixin
+        """
+        self.srvmodel.setWatchedProjects(projects)
@@ -0,0 +1,168 @@
+#
+# transport.py - Conditional HTTP requests for Yabsc
+#
+
+# Copyright (C) 2008 James Oakley <jfunk@opensuse.org>
+
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+
+import hashlib
+import threading
+import urllib2
+
+class NotModified(object):
+    """
+    NotModified()
+
+    Type of NOT_MODIFIED, the result of a conditional request for a document
+    that has not changed since it was last retrieved
+    """
+    def __repr__(self):
+        return 'NOT_MODIFIED'
+
+NOT_MODIFIED = NotModified()
+
+
+class Transport(object):
+    """
+    Transport(session)
+
+    Performs GET requests through the connection.Session 'session', keeping the validators of the last
+    response for every URL. Conditional requests send them back to the server
+    and return NOT_MODIFIED instead of data when nothing has changed. Servers
+    that send neither an ETag nor a Last-Modified header are handled by
+    comparing a hash of the content
+    """
+    def __init__(self, session):
+        self.session = session
+        self.validators = {}
+        self.lock = threading.Lock()
+
+    def open(self, url, tag=None, conditional=False):
+        """
+        open(url, tag=None, conditional=False) -> Response
+
+        Open the document at 'url' for streaming. If 'conditional' is True
+        and the server reports that the document has not changed since the
+        last request with the same 'url' and 'tag', NOT_MODIFIED is returned.
+        'tag' lets several callers poll the same URL while each of them is
+        told about every change
+        """
+        key = (tag, url)
+        self.lock.acquire()
+        try:
+            validator = self.validators.get(key)
+        finally:
+            self.lock.release()
+
+        headers = {}
+        if conditional and validator:
+            (etag, lastmodified, digest) = validator
+            if etag:
+                headers['If-None-Match'] = etag
+            if lastmodified:
+                headers['If-Modified-Since'] = lastmodified
+
+        try:
+            f = self.session.GET(url, headers)
+        except urllib2.HTTPError, e:
+            if e.code == 304 and headers:
+                return NOT_MODIFIED
+            raise
+        if not conditional:
+            validator = None
+        return Response(self, key, f, validator)
+
+    def get(self, url, tag=None, conditional=False):
+        """
+        get(url, tag=None, conditional=False) -> str
+
+        Get the document at 'url'. See open() for the arguments. Unless the
+        server sends validators, a conditional request also returns
+        NOT_MODIFIED if the content is the same as last time
+        """
+        f = self.open(url, tag, conditional)
+        if f is NOT_MODIFIED:
+            return NOT_MODIFIED
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        if f.finish():
+            return NOT_MODIFIED
+        return data
+
+    def _store(self, key, validator):
+        """
+        _store(key, validator)
+
+        Remember the validator of the last response for key
+        """
+        self.lock.acquire()
+        try:
+            self.validators[key] = validator
+        finally:
+            self.lock.release()
+
+    def invalidate(self, url=None):
+        """
+        invalidate(url=None)
+
+        Forget the validators for 'url', or for all URLs if 'url' is None
+        """
+        self.lock.acquire()
+        try:
+            if url is None:
+                self.validators.clear()
+            else:
+                for key in [k for k in self.validators if k[1] == url]:
+                    del self.validators[key]
+        finally:
+            self.lock.release()
+
+
+class Response(object):
+    """
+    Response(transport, key, f, validator)
+
+    A file-like HTTP response that hashes its content as it is read. Call
+    finish() once the whole document has been read
+    """
+    def __init__(self, transport, key, f, validator):
+        self.transport = transport
+        self.key = key
+        self.f = f
+        self.validator = validator
+        self.digest = hashlib.md5()
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.digest.update(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+    def finish(self):
+        """
+        finish() -> boolean
+
+        Record the validators of the response. Returns True if the request was
+        conditional and the content is the same as that of the last response
+        """
+        digest = self.digest.hexdigest()
+        info = self.f.info()
+        self.transport._store(self.key, (info.getheader('ETag'), info.getheader('Last-Modified'), digest))
+        return bool(self.validator) and self.validator[2] == digest
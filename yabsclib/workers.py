@@ -19,28 +19,70 @@
 # Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
 
 import time
-import email.utils
 from PyQt4 import QtGui, QtCore
 
-from results import BuildLogThread
+from buildservice import WatchedProjectsMixin
+from durations import DurationEstimator
+from fleethistory import HOSTARCH
+from index import RecordIndex, intersect
+from logstream import LogPoller, storeLog
+from logviewer import LogView
+from scheduler import PRIORITY_INTERACTIVE
 
 #
 # Data model
 #
+
+# Builds running for longer than this many seconds are highlighted, in a
+# colour that changes with each minute over it, up to AGE_BUCKETS minutes
+AGE_HIGHLIGHT = 3600
+AGE_BUCKETS = 240
+
+# Milliseconds between updates of the highlighting
+AGE_INTERVAL = 60000
+
+# Highlight colours by minutes over AGE_HIGHLIGHT, from the webclient colour
+# scheme
+agecolors = [QtCore.QVariant(QtGui.QColor(255, n, 0)) for n in xrange(AGE_BUCKETS)]
+
+def formatRemaining(seconds):
+    """
+    formatRemaining(seconds) -> str
+    
+    Returns an estimate of the remaining time of a build as text
+    """
+    if seconds is None:
+        return ""
+    if seconds < 0:
+        return "overdue %d:%02d" % (-seconds / 3600, -seconds / 60 % 60)
+    return "%d:%02d" % (seconds / 3600, seconds / 60 % 60)
+
 class WorkerModel(QtCore.QAbstractItemModel):
-    """WorkerModel(bs)
+    """WorkerModel(bs, estimator)
     
-    Model for workers. 'bs' must be a BuildService object
+    Model for workers. 'bs' must be a BuildService object, and 'estimator' the
+    DurationEstimator giving the remaining time of builds
     """
-    def __init__(self, bs):
+    def __init__(self, bs, estimator):
         QtCore.QAbstractItemModel.__init__(self)
         self.bs = bs
+        self.estimator = estimator
         self.workers = []
+        self.workerindex = RecordIndex([], ('status', 'project'), ('package',))
+        self.statuscounts = {}
         self.visibleworkers = []
         self.statusfilter = ""
         self.packagefilter = ""
         self.projectfilter = ""
-        self.columnmap = ('id', 'hostarch', 'status', 'project', 'package', 'target', 'started')
+        self.watchedprojects = set()
+        self.columnmap = ('id', 'hostarch', 'status', 'project', 'package', 'target', 'started', 'remaining')
+        self.remainingcolumn = self.columnmap.index('remaining')
+        QtCore.QObject.connect(self.estimator, QtCore.SIGNAL("estimatesChanged"), self.updateEstimates)
+        # Worker -> highlight colour of long running builds
+        self.backgrounds = {}
+        self.agetimer = QtCore.QTimer()
+        QtCore.QObject.connect(self.agetimer, QtCore.SIGNAL("timeout()"), self.updateAges)
+        self.agetimer.start(AGE_INTERVAL)
     
     def setWorkers(self, workers):
         """
@@ -49,7 +91,74 @@ class WorkerModel(QtCore.QAbstractItemModel):
         Set the workers list of the model, as returned from BuildService.getWorkerStatus()
         """
         self.workers = workers
+        self.workerindex = RecordIndex(workers, ('status', 'project'), ('package',))
+        self.statuscounts = self.workerindex.histogram('status')
+        self.backgrounds = self._backgrounds()
         self.updateVisibleWorkers()
+        self.estimator.update(workers)
+
+    def _backgrounds(self):
+        """
+        _backgrounds() -> dict
+        
+        Returns the highlight colours of the workers running long builds at
+        this time
+        """
+        deadline = time.time() - AGE_HIGHLIGHT
+        backgrounds = {}
+        for worker in self.workers:
+            if worker.starttime is not None and worker.starttime < deadline:
+                n = int((deadline - worker.starttime) / 60)
+                if n < AGE_BUCKETS:
+                    backgrounds[worker] = agecolors[n]
+        return backgrounds
+
+    def updateAges(self):
+        """
+        updateAges()
+        
+        Update the highlighting of long running builds and their remaining
+        time as time passes, repainting the rows whose colour changed
+        """
+        self.updateEstimates()
+        backgrounds = self._backgrounds()
+        if backgrounds == self.backgrounds:
+            return
+        old = self.backgrounds
+        self.backgrounds = backgrounds
+        changed = [row for (row, worker) in enumerate(self.visibleworkers)
+                   if old.get(worker) is not backgrounds.get(worker)]
+        if changed:
+            self.emit(QtCore.SIGNAL("dataChanged(const QModelIndex&, const QModelIndex&)"),
+                      self.index(changed[0], 0), self.index(changed[-1], len(self.columnmap) - 1))
+    
+    def updateEstimates(self, keys=None):
+        """
+        updateEstimates(keys=None)
+        
+        Repaint the remaining time of the visible builds with estimates of
+        keys, or of all visible builds if keys is None
+        """
+        key = self.estimator.key
+        if keys is None:
+            rows = [row for (row, worker) in enumerate(self.visibleworkers) if worker.starttime is not None]
+        else:
+            keys = set(keys)
+            rows = [row for (row, worker) in enumerate(self.visibleworkers)
+                    if worker.starttime is not None and key(worker) in keys]
+        if rows:
+            self.emit(QtCore.SIGNAL("dataChanged(const QModelIndex&, const QModelIndex&)"),
+                      self.index(rows[0], self.remainingcolumn), self.index(rows[-1], self.remainingcolumn))
+
+    def setWatchedProjects(self, projects):
+        """
+        setWatchedProjects(projects)
+        
+        Set the projects shown by the 'Watched' project filter
+        """
+        self.watchedprojects = set(projects)
+        if self.projectfilter == 'Watched':
+            self.updateVisibleWorkers()
     
     def _data(self, row, column):
         """
@@ -57,10 +166,12 @@ class WorkerModel(QtCore.QAbstractItemModel):
         
         Internal method for getting model data
         """
-        try:
-            return self.visibleworkers[row][self.columnmap[column]]
-        except KeyError:
+        if column == self.remainingcolumn:
+            return formatRemaining(self.estimator.remaining(self.visibleworkers[row]))
+        value = getattr(self.visibleworkers[row], self.columnmap[column])
+        if value is None:
             return ""
+        return value
 
     def data(self, index, role):
         """
@@ -72,16 +183,10 @@ class WorkerModel(QtCore.QAbstractItemModel):
         """
         if index.isValid() and role == QtCore.Qt.DisplayRole:
             return QtCore.QVariant(self._data(index.row(), index.column()))
-        elif role == QtCore.Qt.BackgroundRole:
-            worker = self.visibleworkers[index.row()]
-            if 'started' in worker:
-                # Use the colour scheme from the webclient
-                deadline = time.time() - 3600
-                starttime = time.mktime(email.utils.parsedate(worker['started']))
-                if starttime < deadline:
-                    n = (abs((starttime - deadline))/60)
-                    if n < 240:
-                        return QtCore.QVariant(QtGui.QColor(255, n, 0))
+        elif index.isValid() and role == QtCore.Qt.BackgroundRole:
+            background = self.backgrounds.get(self.visibleworkers[index.row()])
+            if background is not None:
+                return background
 
         return QtCore.QVariant()
 
@@ -134,22 +239,29 @@ class WorkerModel(QtCore.QAbstractItemModel):
         """
         updateVisibleWorkers(reset=True)
         
-        Update the list of visible workers
+        Update the list of visible workers, from the intersection of the
+        workers matching each filter in the worker index
         """
-        self.visibleworkers = self.workers
+        index = self.workerindex
+        positions = []
         
         if self.statusfilter:
-            self.visibleworkers = [w for w in self.visibleworkers if w['status'] == self.statusfilter]
+            positions.append(index.matching('status', [self.statusfilter]))
         
         if self.packagefilter:
-            self.visibleworkers = [w for w in self.visibleworkers if 'package' in w and self.packagefilter in w['package']]
+            positions.append(index.search(('package',), self.packagefilter))
         
         if self.projectfilter:
             if self.projectfilter == 'Watched':
-                watchedprojects = self.bs.getWatchedProjectList()
-                self.visibleworkers = [w for w in self.visibleworkers if 'project' in w and w['project'] in watchedprojects]
+                positions.append(index.matching('project', self.watchedprojects))
             else:
-                self.visibleworkers = [w for w in self.visibleworkers if 'project' in w and w['project'] == self.projectfilter]
+                positions.append(index.matching('project', [self.projectfilter]))
+        
+        if positions:
+            workers = self.workers
+            self.visibleworkers = [workers[i] for i in intersect(positions, len(workers))]
+        else:
+            self.visibleworkers = self.workers
     
         if reset:
             self.reset()
@@ -197,35 +309,19 @@ class WorkerModel(QtCore.QAbstractItemModel):
         status = status.lower()
         if status == 'all':
             return len(self.workers)
-        return len([w for w in self.workers if w['status'] == status])
-
-
-#
-# API call threads
-#
-class WorkerStatusThread(QtCore.QThread):
-    """
-    WorkerStatusThread(bs)
-    
-    Thread for retrieving worker status. Requires a BuildService object
-    """
-    def __init__(self, bs):
-        QtCore.QThread.__init__(self)
-        self.bs = bs
-        self.workers = []
-    
-    def run(self):
-        self.workers = self.bs.getWorkerStatus()
+        return self.statuscounts.get(status, 0)
 
 
 class WorkerTreeView(QtGui.QTreeView):
     """
-    WorkerTreeView(bs, parent=None)
+    WorkerTreeView(bs, commands, parent=None)
     
-    The worker tree view. 'bs' must be a BuildService object
+    The worker tree view. 'bs' must be a BuildService object and 'commands'
+    the CommandRunner that runs the context menu actions
     """
-    def __init__(self, bs, parent=None):
+    def __init__(self, bs, commands, parent=None):
         self.bs = bs
+        self.commands = commands
         QtGui.QTreeView.__init__(self, parent)
     
     def contextMenuEvent(self, event):
@@ -253,17 +349,202 @@ class WorkerTreeView(QtGui.QTreeView):
             
             selectedaction = menu.exec_(self.mapToGlobal(event.pos()))
             
-            if selectedaction:
-                try:
-                    if selectedaction == abortaction:
-                        self.bs.abortBuild(str(project), str(package), str(target))
-                except Exception, e:
-                    QtGui.QMessageBox.critical(self, "Error",
-                               "Could not perform action on project %s: %s" % (project, e))
-                    raise
+            if selectedaction == abortaction:
+                self.commands.run("Aborting build of %s for %s" % (package, target),
+                                  self.bs.abortBuild, (project, package, target))
+
+
+#
+# Fleet history
+#
+
+# (label, seconds) of the periods the fleet history can be shown for
+HISTORY_RANGES = (("Last hour", 3600),
+                  ("Last 6 hours", 6*3600),
+                  ("Last day", 86400),
+                  ("Last week", 7*86400))
+
+# Milliseconds between updates of the fleet history dialog
+HISTORY_INTERVAL = 30000
+
+class FleetChart(QtGui.QWidget):
+    """
+    FleetChart(parent=None)
+    
+    Charts the utilization of the workers, as the percentage of them that is
+    building, and the number of waiting jobs over a period of time
+    """
+    def __init__(self, parent=None):
+        QtGui.QWidget.__init__(self, parent)
+        self.setMinimumSize(400, 200)
+        self.start = self.end = 0
+        self.samples = []
+
+    def setSamples(self, start, end, samples):
+        """
+        setSamples(start, end, samples)
+        
+        Show samples, a list of (time, building, idle, waiting) tuples, for
+        the period from start to end
+        """
+        self.start = start
+        self.end = end
+        self.samples = samples
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), self.palette().base())
+        metrics = painter.fontMetrics()
+        margin = metrics.height()
+        left = metrics.width("100%") + margin
+        right = self.width() - metrics.width("00000") - margin
+        top = margin
+        bottom = self.height() - 2*margin
+        if right <= left or bottom <= top or self.end <= self.start:
+            return
+        maxwaiting = max([1] + [int(w + 0.5) for (t, b, i, w) in self.samples])
+
+        # Axes and labels, utilization on the left and waiting jobs on the right
+        painter.setPen(self.palette().text().color())
+        painter.drawRect(left, top, right - left, bottom - top)
+        painter.drawText(0, top, left - margin/2, margin, QtCore.Qt.AlignRight, "100%")
+        painter.drawText(0, bottom - margin, left - margin/2, margin, QtCore.Qt.AlignRight, "0%")
+        painter.drawText(right + margin/2, top, margin*4, margin, QtCore.Qt.AlignLeft, str(maxwaiting))
+        painter.drawText(right + margin/2, bottom - margin, margin*4, margin, QtCore.Qt.AlignLeft, "0")
+        if self.end - self.start > 86400:
+            timeformat = "%a %H:%M"
+        else:
+            timeformat = "%H:%M"
+        painter.drawText(left, bottom, right - left, margin*2, QtCore.Qt.AlignLeft | QtCore.Qt.AlignVCenter,
+                         time.strftime(timeformat, time.localtime(self.start)))
+        painter.drawText(left, bottom, right - left, margin*2, QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter,
+                         time.strftime(timeformat, time.localtime(self.end)))
+        painter.drawText(left, bottom, right - left, margin*2, QtCore.Qt.AlignHCenter | QtCore.Qt.AlignVCenter,
+                         "Utilization (green), waiting jobs (red)")
+
+        xscale = float(right - left) / (self.end - self.start)
+        height = bottom - top
+        utilization = QtGui.QPolygonF()
+        waiting = QtGui.QPolygonF()
+        for (t, building, idle, jobs) in self.samples:
+            x = left + (t - self.start) * xscale
+            if building + idle:
+                utilization.append(QtCore.QPointF(x, bottom - height * building / (building + idle)))
+            waiting.append(QtCore.QPointF(x, bottom - height * jobs / maxwaiting))
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.setPen(QtGui.QPen(QtGui.QColor(0, 160, 0), 1.5))
+        painter.drawPolyline(utilization)
+        painter.setPen(QtGui.QPen(QtGui.QColor(200, 0, 0), 1.5))
+        painter.drawPolyline(waiting)
+
+
+class FleetHistoryDialog(QtGui.QDialog):
+    """
+    FleetHistoryDialog(widget)
+    
+    Shows the worker fleet history recorded for the API server of the
+    WorkerWidget widget, for all architectures or a single one. The workers
+    of a host architecture and the waiting jobs of a scheduler architecture
+    are recorded apart, so a single one shows either
+    """
+    def __init__(self, widget):
+        QtGui.QDialog.__init__(self, widget)
+        self.widget = widget
+        self.apiurl = widget.bs.apiurl
+        
+        self.setWindowTitle("Worker History of %s" % self.apiurl)
+        self.resize(800, 400)
+        
+        self.rangeselector = QtGui.QComboBox()
+        for (label, seconds) in HISTORY_RANGES:
+            self.rangeselector.addItem(label)
+        QtCore.QObject.connect(self.rangeselector, QtCore.SIGNAL("currentIndexChanged(int)"), self.refresh)
+        self.archselector = QtGui.QComboBox()
+        self.archselector.setSizeAdjustPolicy(QtGui.QComboBox.AdjustToContents)
+        self.archselector.addItem("All")
+        # The (kind, name) architectures following "All" in archselector
+        self.arches = []
+        QtCore.QObject.connect(self.archselector, QtCore.SIGNAL("currentIndexChanged(int)"), self.refresh)
+        
+        self.chart = FleetChart()
+        self.statuslabel = QtGui.QLabel()
+        
+        selectorlayout = QtGui.QHBoxLayout()
+        selectorlayout.addWidget(QtGui.QLabel("Period"))
+        selectorlayout.addWidget(self.rangeselector)
+        selectorlayout.addWidget(QtGui.QLabel("Architecture"))
+        selectorlayout.addWidget(self.archselector)
+        selectorlayout.addStretch()
+        
+        buttonlayout = QtGui.QHBoxLayout()
+        buttonlayout.addWidget(self.statuslabel, 1)
+        close = QtGui.QPushButton('Close')
+        self.connect(close, QtCore.SIGNAL('clicked()'), self.reject)
+        buttonlayout.addWidget(close)
+        
+        layout = QtGui.QVBoxLayout()
+        layout.addLayout(selectorlayout)
+        layout.addWidget(self.chart, 1)
+        layout.addLayout(buttonlayout)
+        self.setLayout(layout)
+        
+        self.refreshtimer = QtCore.QTimer(self)
+        QtCore.QObject.connect(self.refreshtimer, QtCore.SIGNAL("timeout()"), self.refresh)
+        self.refreshtimer.start(HISTORY_INTERVAL)
+        self.widget.scheduler.submit(self.widget.bs.fleethistory.arches, (self.apiurl,),
+                                     priority=PRIORITY_INTERACTIVE, callback=self.showArches)
+        self.refresh()
+
+    def showArches(self, request):
+        """
+        showArches(request)
+        
+        Fill the architecture selector with the result of an arches request
+        """
+        self.arches = request.result
+        for (kind, name) in self.arches:
+            if kind == HOSTARCH:
+                self.archselector.addItem("%s workers" % name)
+            else:
+                self.archselector.addItem("%s waiting jobs" % name)
+
+    def refresh(self, index=None):
+        """
+        refresh()
+        
+        Query the history for the selected period and architecture
+        """
+        end = time.time()
+        start = end - HISTORY_RANGES[self.rangeselector.currentIndex()][1]
+        arch = None
+        if self.archselector.currentIndex() > 0:
+            arch = self.arches[self.archselector.currentIndex() - 1]
+        self.widget.scheduler.submit(self.widget.bs.fleethistory.query, (self.apiurl, start, end, arch),
+                                     group='workers.fleethistory', priority=PRIORITY_INTERACTIVE,
+                                     callback=self.showHistory, start=start, end=end, started=time.time())
 
+    def showHistory(self, request):
+        """
+        showHistory(request)
+        
+        Chart the result of a history query
+        """
+        (width, samples) = request.result
+        self.chart.setSamples(request.params['start'], request.params['end'], samples)
+        if width:
+            resolution = "%d minute averages" % (width / 60)
+        else:
+            resolution = "samples"
+        self.statuslabel.setText("%d %s (%.0f ms)" % (len(samples), resolution,
+                                                     (time.time() - request.params['started'])*1000))
+
+    def done(self, result):
+        self.refreshtimer.stop()
+        QtGui.QDialog.done(self, result)
 
-class WorkerWidget(QtGui.QWidget):
+
+class WorkerWidget(QtGui.QWidget, WatchedProjectsMixin):
     """
     WorkerWidget(bs, cfg)
     
@@ -281,6 +562,10 @@ class WorkerWidget(QtGui.QWidget):
         # Config object
         self.cfg = cfg
 
+        # Request scheduler, and the runner for user commands
+        self.scheduler = parent.scheduler
+        self.commands = parent.commands
+
         # Filter widgets
         searchlabel = QtGui.QLabel("Search")
         self.searchedit = QtGui.QLineEdit()
@@ -302,28 +587,29 @@ class WorkerWidget(QtGui.QWidget):
             self.tabs.append(tabname)
         
         # Status view
-        self.workerview = WorkerTreeView(self.bs, parent=self)
+        self.workerview = WorkerTreeView(self.bs, self.commands, parent=self)
         self.workerview.setRootIsDecorated(False)
-        self.workermodel = WorkerModel(self.bs)
+        self.estimator = DurationEstimator(self.bs, self.scheduler)
+        QtCore.QObject.connect(self.estimator, QtCore.SIGNAL("estimatesFailed"), self.estimatesFailed)
+        self.workermodel = WorkerModel(self.bs, self.estimator)
         self.workerview.setModel(self.workermodel)
         QtCore.QObject.connect(self.workerview, QtCore.SIGNAL("clicked(const QModelIndex&)"), self.watchBuildLog)
 
         # Build log
-        self.logpane = QtGui.QTextBrowser()
-        self.logpane.setReadOnly(True)
-        self.logpane.setOpenLinks(False)
+        self.logpane = LogView()
 
         # Worker refresh
         self.refreshtimer = QtCore.QTimer()
         QtCore.QObject.connect(self.refreshtimer, QtCore.SIGNAL("timeout()"), self.refreshWorkerList)
-        self.workerstatusthread = WorkerStatusThread(self.bs)
-        QtCore.QObject.connect(self.workerstatusthread, QtCore.SIGNAL("finished()"), self.updateWorkerList)
+        self.snapshot = None
+        QtCore.QObject.connect(self.bs, QtCore.SIGNAL("workerStatusChanged"), self.updateWorkerList)
+        QtCore.QObject.connect(self.bs, QtCore.SIGNAL("watchedProjectsChanged"), self.watchedProjectsChanged)
         
         # Build log refresh
-        self.streamtimer = QtCore.QTimer()
-        QtCore.QObject.connect(self.streamtimer, QtCore.SIGNAL("timeout()"), self.requestBuildOutput)
-        self.buildlogthread = BuildLogThread(self.bs)
-        QtCore.QObject.connect(self.buildlogthread, QtCore.SIGNAL("finished()"), self.updateBuildOutput)
+        self.logpoller = LogPoller(self.bs, self.scheduler, 'workers.buildlog')
+        QtCore.QObject.connect(self.logpoller, QtCore.SIGNAL("logReceived"), self.updateBuildOutput)
+        QtCore.QObject.connect(self.logpoller, QtCore.SIGNAL("logFinished()"), self.buildOutputFinished)
+        QtCore.QObject.connect(self.logpoller, QtCore.SIGNAL("logFailed"), self.buildOutputFailed)
 
         # Layout
         filterlayout = QtGui.QHBoxLayout()
@@ -365,34 +651,78 @@ class WorkerWidget(QtGui.QWidget):
         Set the buildservice API URL
         """
         self.bs.apiurl = apiurl
-        self.refreshWorkerList()
+        self.estimator.reset()
+        self.refreshWorkerList(cached=False)
 
-    def refreshWorkerList(self):
+    def refreshWorkerList(self, cached=True):
         """
-        refreshWorkerList()
+        refreshWorkerList(cached=True)
         
-        Refresh the worker lists
+        Refresh the worker lists. If cached is True, a worker status snapshot
+        retrieved within the refresh interval is used
         """
         self.disableRefresh()
         self.parent.statusBar().showMessage("Retrieving worker status")
-        self.workerstatusthread.start()
+        if cached:
+            maxage = self.cfg.getint('general', 'refreshinterval')
+        else:
+            maxage = 0
+        self.scheduler.submit(self.bs.getWorkerStatusSnapshot, (maxage,),
+                              key=('workerstatus', self.bs.apiurl, maxage),
+                              callback=self.workerStatusRetrieved,
+                              errback=self.workerStatusFailed)
     
-    def updateWorkerList(self):
+    def workerStatusRetrieved(self, request):
         """
-        updateWorkerList()
+        workerStatusRetrieved(request)
         
-        Update worker lists from result in self.workerstatusthread
+        Handle the end of a worker status request
         """
         if self.viewable:
             self.parent.statusBar().clearMessage()
-        workers = self.workerstatusthread.workers
+        if request.result:
+            self.updateWorkerList(request.result)
+        if self.viewable:
+            self.enableRefresh()
+
+    def workerStatusFailed(self, request):
+        """
+        workerStatusFailed(request)
+        
+        Keep refreshing after a failed worker status request
+        """
+        if self.viewable:
+            self.enableRefresh()
+
+    def estimatesFailed(self, failures):
+        """
+        estimatesFailed(failures)
+        
+        Report build histories that could not be retrieved for estimates
+        """
+        if self.viewable:
+            ((apiurl, project, package, target), error) = failures[0]
+            self.parent.statusBar().showMessage("Could not retrieve %d build histories for estimates, %s/%s/%s: %s" %
+                                                (len(failures), project, package, target, error),
+                                                10000)
+
+    def updateWorkerList(self, snapshot):
+        """
+        updateWorkerList(snapshot)
+        
+        Update worker lists from a worker status snapshot
+        """
+        if snapshot is self.snapshot:
+            return
+        self.snapshot = snapshot
+        workers = snapshot.workers()
         self.workermodel.setWorkers(workers)
         
         # Update project filter dropbox
         projects = {}
         for worker in workers:
-            if 'project' in worker:
-                projects[worker['project']] = None
+            if worker.project is not None:
+                projects[worker.project] = None
         
         currentprojectfilter = str(self.projectselector.currentText())
         self.projectselector.clear()
@@ -404,8 +734,6 @@ class WorkerWidget(QtGui.QWidget):
         
         self.resizeColumns()
         self.updateWorkerCounts()
-        if self.viewable:
-            self.enableRefresh()
 
     def filterWorkers(self, index):
         """
@@ -437,8 +765,27 @@ class WorkerWidget(QtGui.QWidget):
         are shown. If 'project' is 'Watched', all watched projects are
         shown
         """
+        if project == 'Watched':
+            self.refreshWatchedProjects()
         self.workermodel.setProjectFilter(str(project))
 
+    def setWatchedProjects(self, projects):
+        """
+        setWatchedProjects(projects)
+        
+        Use projects as the watched projects of the project filter. See
+        WatchedProjectsMixin
+        """
+        self.workermodel.setWatchedProjects(projects)
+
+    def showFleetHistory(self):
+        """
+        showFleetHistory()
+        
+        Open a dialog charting the recorded worker utilization and wait queue
+        """
+        FleetHistoryDialog(self).show()
+
     def resizeColumns(self):
         """
         resizeColumns()
@@ -457,28 +804,41 @@ class WorkerWidget(QtGui.QWidget):
         for tab in self.tabs:
             self.workertab.setTabText(self.tabs.index(tab), "%s (%d)" % (tab, self.workermodel.numWorkersWithStatus(tab)))
 
-    def requestBuildOutput(self):
+    def updateBuildOutput(self, chunk):
         """
-        requestBuildOutput()
+        updateBuildOutput(chunk)
         
-        Send request to update streaming build output, based on existing buildlogthread parameters
+        Append a chunk of build output
         """
-        self.buildlogthread.start()
-    
-    def updateBuildOutput(self):
+        if self.viewable:
+            self.parent.statusBar().clearMessage()
+        self.logpane.appendText(chunk)
+
+    def buildOutputFinished(self):
         """
-        updateBuildOutput()
+        buildOutputFinished()
         
-        Update the build output
+        Report the end of the build output, and store the log
         """
+        poller = self.logpoller
+        self.scheduler.submit(storeLog, (self.bs, poller.project, poller.target, poller.package,
+                                         self.logpane.logBuffer()))
         if self.viewable:
-            self.parent.statusBar().clearMessage()
-        self.streamtimer.stop()
-        log_chunk = self.buildlogthread.log_chunk
-        self.buildlogthread.offset += len(log_chunk)
-        self.logpane.append(log_chunk.strip())
-        if not len(log_chunk) == 0 and self.viewable:
-            self.streamtimer.start(1000)
+            stats = self.logpoller.stats()
+            self.parent.statusBar().showMessage("Build of %s finished: %d bytes of log in %d requests" % (self.logpoller.package,
+                                                                                                     stats['bytes'],
+                                                                                                     stats['requests']),
+                                                5000)
+
+    def buildOutputFailed(self, error):
+        """
+        buildOutputFailed(error)
+        
+        Report the end of a build whose complete log could not be retrieved
+        """
+        if self.viewable:
+            self.parent.statusBar().showMessage("Could not retrieve build log for %s: %s" % (self.logpoller.package, error),
+                                                10000)
 
     def watchBuildLog(self, modelindex):
         """
@@ -488,7 +848,7 @@ class WorkerWidget(QtGui.QWidget):
         QModelIndex modelindex
         """
         # If we're streaming a log file, stop
-        self.streamtimer.stop()
+        self.logpoller.stop()
         row = modelindex.row()
         self.logpane.clear()
         
@@ -497,15 +857,5 @@ class WorkerWidget(QtGui.QWidget):
             package = self.workermodel.visibleworkers[row]['package']
             target = self.workermodel.visibleworkers[row]['target']
 
-            self.logpane.setCurrentFont(QtGui.QFont("Bitstream Vera Sans Mono", 7))
-            self.logpane.setTextColor(QtGui.QColor('black'))
-            self.logpane.setWordWrapMode(QtGui.QTextOption.NoWrap)
-            
-            self.buildlogthread.project = project
-            self.buildlogthread.target = target
-            self.buildlogthread.package = package
-            self.buildlogthread.offset = 0
-            self.buildlogthread.live = True
-
             self.parent.statusBar().showMessage("Retrieving build log for %s" % package)
-            self.requestBuildOutput()
+            self.logpoller.start(project, target, package)